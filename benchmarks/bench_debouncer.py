@@ -0,0 +1,142 @@
+# Benchmark: debouncer scheduling overhead with many concurrent phone numbers.
+#
+# "before" is the previous engine (one sleeping task per phone, cancelled and
+# re-created on every message). "after" is services.debouncer.Debouncer (one
+# scheduler task, deadline heap). Each phone sends a burst of messages, then
+# all buffers flush. Messages arrive at a fixed rate so both engines see the
+# same deadlines. We report the cost of scheduling a message, total CPU
+# (schedule + flush), peak live tasks, peak RSS and how late the flushes fire.
+#
+# Usage:
+#   python benchmarks/bench_debouncer.py --phones 50000 --burst 3
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.debouncer import Debouncer
+
+
+class TaskPerMessageDebouncer:
+    """The previous engine, kept here for comparison."""
+
+    def __init__(self, delay_seconds: float):
+        self.delay_seconds = delay_seconds
+        self.tasks = {}
+        self.message_buffers = {}
+
+    async def debounce(self, phone_number, message_text, payload_data, process_callback):
+        task = self.tasks.get(phone_number)
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.message_buffers.setdefault(phone_number, []).append(message_text)
+
+        async def debounce_task():
+            await asyncio.sleep(self.delay_seconds)
+            combined_message = " ".join(self.message_buffers.pop(phone_number, []))
+            self.tasks.pop(phone_number, None)
+            return await process_callback(phone_number, combined_message, payload_data)
+
+        self.tasks[phone_number] = asyncio.create_task(debounce_task())
+
+    def get_pending_count(self) -> int:
+        return len(self.tasks)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(engine: str, phones: int, burst: int, delay: float, rate: int):
+    debouncer = Debouncer(delay_seconds=delay) if engine == "after" else TaskPerMessageDebouncer(delay)
+    loop = asyncio.get_running_loop()
+    last_message = {}
+    lateness = []
+    done = asyncio.Event()
+
+    async def callback(phone, text, payload):
+        lateness.append(loop.time() - last_message[phone] - delay)
+        if len(lateness) == phones:
+            done.set()
+
+    numbers = ["569" + str(10000000 + i) for i in range(phones)]
+    base_rss = rss_mb()
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    busy_seconds = 0.0
+    sent = 0
+    peak_tasks = 0
+    peak_rss = 0.0
+    for round_ in range(burst):
+        for phone in numbers:
+            t0 = time.perf_counter()
+            last_message[phone] = loop.time()
+            await debouncer.debounce(phone, "msg " + str(round_), {}, callback)
+            busy_seconds += time.perf_counter() - t0
+            sent += 1
+            # Hold arrivals to the target rate (both engines see the same deadlines)
+            if sent % 1000 == 0:
+                peak_tasks = max(peak_tasks, len(asyncio.all_tasks()))
+                peak_rss = max(peak_rss, rss_mb() - base_rss)
+                await asyncio.sleep(max(0.0, started + sent / rate - time.perf_counter()))
+
+    await asyncio.wait_for(done.wait(), timeout=delay + 120)
+    cpu_seconds = time.process_time() - cpu_started
+    messages = phones * burst
+    print(
+        engine.ljust(7)
+        + " phones=" + str(phones)
+        + "  schedule=" + str(round(busy_seconds / messages * 1e6, 2)) + "us/msg"
+        + "  cpu_total=" + str(round(cpu_seconds, 2)) + "s"
+        + "  peak_tasks=" + str(peak_tasks)
+        + "  peak_rss=+" + str(round(peak_rss)) + "MB"
+        + "  flush_late p50=" + str(round(percentile(lateness, 0.5) * 1000)) + "ms"
+        + " p99=" + str(round(percentile(lateness, 0.99) * 1000)) + "ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phones", type=int, default=50000)
+    parser.add_argument("--burst", type=int, default=3)
+    parser.add_argument("--delay", type=float, default=2.0)
+    parser.add_argument("--rate", type=int, default=20000, help="incoming messages per second")
+    parser.add_argument("--engine", choices=["before", "after"])
+    args = parser.parse_args()
+
+    if args.engine:
+        asyncio.run(run(args.engine, args.phones, args.burst, args.delay, args.rate))
+        return
+
+    # Each engine in its own process so RSS numbers are comparable
+    for engine in ("before", "after"):
+        subprocess.run([
+            sys.executable, __file__,
+            "--engine", engine,
+            "--phones", str(args.phones),
+            "--burst", str(args.burst),
+            "--delay", str(args.delay),
+            "--rate", str(args.rate)
+        ], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Benchmark: memory held by the debouncer per tracked conversation.
+#
+# Distinct phones each send one message through Debouncer.debounce(), with
+# payload data built the way webhook.py builds it (fresh strings per
+# request, as parsed from JSON). Memory is measured with tracemalloc:
+#   - buffered: every phone has a buffer waiting for its debounce delay,
+#   - flushed: every buffer was processed; what is left is per-phone
+#     state kept between turns (adaptive delay timings),
+#   - evicted: after the idle state is dropped.
+#
+# Usage:
+#   python benchmarks/bench_debouncer_memory.py --phones 1000000
+
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import webhook
+from services.debounce_policy import AdaptiveDelay
+from services.debouncer import Debouncer
+
+ACCOUNTS = 50  # SpicyTool accounts (userEmail) the phones are spread over
+
+
+def payload_data(i: int) -> dict:
+    # "".join builds new string objects, like the JSON parser does per request
+    payload = SimpleNamespace(
+        userEmail="".join(["asesor", str(i % ACCOUNTS), "@inmobiliaria.cl"]),
+        contactId="",
+        assignedContainer="".join(["container-", str(i % ACCOUNTS)])
+    )
+    return webhook.build_payload_data(payload, format(i, "016x"))
+
+
+async def noop(phone_number: str, message_text: str, payload: dict):
+    return None
+
+
+def measure(baseline: int, phones: int) -> dict:
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    return {"bytes": used, "bytes_per_phone": round(used / phones, 1)}
+
+
+async def run(phones: int) -> dict:
+    debouncer = Debouncer(delay_seconds=3600.0, policy=AdaptiveDelay(initial_delay=3600.0, max_delay=3600.0, max_phones=phones))
+    results = {}
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    started = time.perf_counter()
+    for i in range(phones):
+        await debouncer.debounce("+569" + str(10000000 + i), "hola, busco depto", payload_data(i), noop)
+    results["add_seconds"] = round(time.perf_counter() - started, 1)
+    results["buffered"] = measure(baseline, phones)
+
+    # Process every buffer now
+    loop = asyncio.get_running_loop()
+    for pending in debouncer.pending_messages.values():
+        pending.deadline = loop.time()
+    debouncer._heap = [(loop.time(), token, phone) for _, token, phone in debouncer._heap]
+    debouncer._push(loop.time(), -1, "")
+    while debouncer.pending_messages or debouncer._flush_tasks:
+        await asyncio.sleep(0.05)
+    results["flushed"] = measure(baseline, phones)
+
+    policy = debouncer.policy
+    if hasattr(policy, "evict_idle"):
+        policy.evict_idle(loop.time() + policy.idle_seconds + 1)
+        results["evicted"] = measure(baseline, phones)
+
+    tracemalloc.stop()
+    await debouncer.cancel_all()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phones", type=int, default=1000000)
+    args = parser.parse_args()
+    for phase, value in asyncio.run(run(args.phones)).items():
+        print(phase.ljust(12) + str(value))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# Benchmark: event-loop throughput with print() logging vs the queued JSON logger.
+#
+# Simulated webhook turns run on the event loop, each writing the records a
+# turn writes (message received, turn started, LLM request, reply, queued).
+# "print" is the old behavior: formatted strings printed from the loop.
+# "logger" is observability.log: records are queued and written by a thread.
+#
+# Two sinks:
+#   - devnull: a fast sink, shows the CPU cost of logging on the loop,
+#   - slow-pipe: a pipe drained by a slow reader (a busy log collector);
+#     print() blocks the loop once the pipe buffer is full, the logger
+#     only fills its queue (and drops records past LOG_QUEUE_SIZE).
+#
+# Usage:
+#   python benchmarks/bench_logging.py --turns 20000 --reader-kbps 256
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from observability import log
+
+BODY = "Hola, busco un departamento de 2 dormitorios en Providencia, ¿tienen algo disponible?"
+REPLY = "¡Hola! Claro, tenemos varias opciones en Providencia. ¿Cuál es tu presupuesto aproximado?"
+
+
+def print_turn(phone: str):
+    print("📩 Message from " + phone + ": " + BODY)
+    print("🔄 Processing debounced message from " + phone + ": " + BODY)
+    print("📊 LLM request: prompt_tokens=1437 cached_tokens=0 latency_ms=812")
+    print("🤖 Agent response: " + REPLY[:50] + "...")
+    print("📤 Reply queued for " + phone)
+
+
+def logger_turn(logger, phone: str):
+    logger.info("message_received", phone=phone, stage="ingress", body=BODY)
+    logger.info("turn_started", phone=phone, stage="agent", body=BODY, queue_wait_ms=0.1)
+    logger.info("llm_request", phone=phone, stage="llm_round_trip", duration_ms=812.0, prompt_tokens=1437, cached_tokens=0)
+    logger.info("agent_replied", phone=phone, stage="agent", reply=REPLY, duration_ms=830.5)
+    logger.info("reply_queued", phone=phone, stage="outbox", outbox_id=1, duration_ms=831.0)
+
+
+async def run_turns(turns: int, concurrency: int, turn) -> dict:
+    loop = asyncio.get_running_loop()
+    lag = []
+    done = False
+
+    async def sample():
+        while not done:
+            started = loop.time()
+            await asyncio.sleep(0.005)
+            lag.append(loop.time() - started - 0.005)
+
+    async def worker(offset: int):
+        for i in range(offset, turns, concurrency):
+            turn("+569" + str(10000000 + i))
+            await asyncio.sleep(0)
+
+    sampler = asyncio.create_task(sample())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done = True
+    await sampler
+    lag.sort()
+    return {
+        "turns_per_second": round(turns / elapsed),
+        "lag_p99_ms": round(lag[int(len(lag) * 0.99)] * 1000, 1) if lag else 0.0,
+        "lag_max_ms": round(lag[-1] * 1000, 1) if lag else 0.0
+    }
+
+
+def open_sink(kind: str, reader_kbps: int):
+    """Returns (line-buffered text stream, reader process or None)."""
+    if kind == "devnull":
+        return open(os.devnull, "w", buffering=1), None
+    chunk = 4096
+    reader = subprocess.Popen(
+        [sys.executable, "-c",
+         "import sys, time\n"
+         "while sys.stdin.buffer.read1(" + str(chunk) + "):\n"
+         "    time.sleep(" + str(chunk / (reader_kbps * 1024)) + ")\n"],
+        stdin=subprocess.PIPE
+    )
+    return open(reader.stdin.fileno(), "w", buffering=1, closefd=False), reader
+
+
+def close_sink(stream, reader):
+    try:
+        stream.close()
+    except BrokenPipeError:
+        pass
+    if reader is not None:
+        reader.kill()
+        reader.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--reader-kbps", type=int, default=256, help="slow pipe drain rate")
+    args = parser.parse_args()
+
+    report = sys.stdout
+    for sink in ("devnull", "slow-pipe"):
+        for mode in ("print", "logger"):
+            stream, reader = open_sink(sink, args.reader_kbps)
+            if mode == "print":
+                sys.stdout = stream
+                try:
+                    result = asyncio.run(run_turns(args.turns, args.concurrency, print_turn))
+                finally:
+                    sys.stdout = report
+            else:
+                log.configure(stream=stream)
+                logger = log.get_logger("bench")
+                result = asyncio.run(run_turns(args.turns, args.concurrency, lambda phone: logger_turn(logger, phone)))
+                result["dropped_records"] = log.stats()["dropped"]
+                if reader is not None:
+                    reader.kill()  # do not wait for the slow reader to drain the queue
+                log.shutdown()
+            close_sink(stream, reader)
+            print(sink.ljust(10) + mode.ljust(8) + str(result), file=report, flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Micro-benchmark: webhook body -> new user messages, per request.
+#
+# "before" is what the endpoint did: json.loads + full WebhookPayload
+# validation (every Message), then the scan for new messages. "after" is the
+# lean path: orjson + parse_webhook_payload (LazyConversation), so the scan
+# from the end only validates the messages it reads. In both cases every
+# message but the newest one was already processed (a typical delivery).
+#
+# Usage:
+#   python benchmarks/bench_payload_parse.py --sizes 10 100 1000
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import WebhookPayload
+from models.lean_payload import loads, orjson, parse_webhook_payload
+
+
+def build_body(size: int) -> bytes:
+    conversation = [
+        {
+            "id": "wamid.HBgLNTY5MTIzNDU2NzgVAgASGBQzQTg" + str(i),
+            "body": "Mensaje número " + str(i) + " sobre el departamento en Providencia, 2 dormitorios",
+            "fromMe": i % 2 == 1,
+            "timestamp": 1700000000 + i * 30
+        }
+        for i in range(size)
+    ]
+    return json.dumps({
+        "chatBotId": {"$oid": "65f1c0ffee"},
+        "userEmail": "ventas@inmobiliaria.cl",
+        "clientNumber": "+56900000000",
+        "from": "+56912345678",
+        "contactId": "c-123",
+        "assignedContainer": "main",
+        "conversation": conversation
+    }).encode()
+
+
+def new_messages(conversation, seen: set) -> list:
+    new = []
+    for message in reversed(conversation):
+        if message.fromMe:
+            continue
+        if message.id in seen:
+            break
+        new.append(message)
+    return new
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    print("orjson: " + ("yes" if orjson is not None else "no (json fallback)"))
+    for size in args.sizes:
+        body = build_body(size)
+        seen = {m["id"] for m in json.loads(body)["conversation"][:-2]}
+
+        def before():
+            payload = WebhookPayload.model_validate(json.loads(body), from_attributes=True)
+            return new_messages(payload.conversation, seen)
+
+        def after():
+            payload = parse_webhook_payload(loads(body))
+            return new_messages(payload.conversation, seen)
+
+        assert [m.model_dump() for m in before()] == [m.model_dump() for m in after()]
+
+        number = max(10, 20000 // size)
+        results = {}
+        for label, fn in (("before", before), ("after", after)):
+            results[label] = min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+        print(
+            str(size).rjust(5) + " messages  "
+            + "before=" + str(round(results["before"], 1)) + "us  "
+            + "after=" + str(round(results["after"], 1)) + "us  "
+            + "speedup=" + str(round(results["before"] / results["after"], 1)) + "x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Micro-benchmark: system prompt render cost per LLM call.
+#
+# "before" formats the whole template and resolves config/defaults on every
+# call (the old before_model_callback). "after" uses PromptCompiler, which
+# only formats the per-turn tail.
+#
+# Usage:
+#   python benchmarks/bench_prompt_render.py --iterations 100000
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from real_estate_agent import config
+from real_estate_agent.prompt import PromptCompiler, static_prompt_template, turn_prompt_template
+
+full_template = static_prompt_template + turn_prompt_template
+
+CONTACT = "Existing contact. Name: Ana"
+GREETING = "This is a returning contact named Ana. Greet them by name."
+COUNTRY = "Chile"
+
+
+def render_before() -> str:
+    defaults = config.DEFAULTS
+    bant = config.BANT_QUESTIONS or defaults.get("bant_questions", {})
+    examples = config.CONVERSATION_EXAMPLES or defaults.get("conversation_examples", "")
+    return full_template.format(
+        agent_name=config.AGENT_NAME or defaults["agent_name"],
+        company=config.COMPANY or defaults["company"],
+        personality=config.PERSONALITY or defaults["personality"],
+        contact_context=CONTACT,
+        greeting_instruction=GREETING,
+        detected_country=COUNTRY,
+        bant_need=bant.get("need", "what they need"),
+        bant_timeline=bant.get("timeline", "when they need it"),
+        bant_budget=bant.get("budget", "their budget"),
+        bant_authority=bant.get("authority", "who decides"),
+        conversation_examples=examples,
+        summary_block="",
+        current_time=datetime.now().strftime("%d/%m/%Y %H:%M")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    compiler = PromptCompiler()
+
+    def render_after() -> str:
+        return compiler.render(CONTACT, GREETING, COUNTRY)
+
+    for label, fn in (("before (full format)", render_before), ("after (compiled)", render_after)):
+        seconds = min(timeit.repeat(fn, number=args.iterations, repeat=3))
+        print(label.ljust(22) + str(round(seconds / args.iterations * 1e6, 2)).rjust(8) + " us/render")
+
+    first = compiler.static_prefix()
+    second = compiler.static_prefix()
+    print("static prefix: " + str(len(first)) + " chars, identical across turns: " + str(first is second))
+    print("compiles: " + str(compiler.compile_count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Benchmark: RSS and lookup latency with many sessions,
+# InMemorySessionService vs SqliteSessionService.
+#
+# Each backend runs in its own process so RSS numbers are comparable.
+#
+# Usage:
+#   python benchmarks/bench_session_store.py --sessions 100000
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+APP_NAME = "real_estate_agent"
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run_backend(backend: str, sessions: int, lookups: int, max_hot: int):
+    from google.adk.events.event import Event
+    from google.genai.types import Content, Part
+
+    if backend == "memory":
+        from google.adk.sessions import InMemorySessionService
+        service = InMemorySessionService()
+        db_dir = None
+    else:
+        from services.session_store import SqliteSessionService
+        db_dir = tempfile.mkdtemp()
+        service = SqliteSessionService(db_path=os.path.join(db_dir, "bench.db"), max_hot_sessions=max_hot)
+
+    base_rss = rss_mb()
+    started = time.perf_counter()
+    for i in range(sessions):
+        phone = "569" + str(10000000 + i)
+        session = await service.create_session(app_name=APP_NAME, user_id=phone, session_id=phone, state={"user_id": phone})
+        for role, text in (("user", "Hola, busco un departamento en Santiago"), ("model", '{"message": "¡Hola! ¿Cuál es tu nombre?", "should_escalate": false}')):
+            await service.append_event(session, Event(
+                author="user" if role == "user" else "real_estate_agent",
+                invocation_id="inv-" + str(i),
+                content=Content(role=role, parts=[Part(text=text)])
+            ))
+    load_seconds = time.perf_counter() - started
+
+    # Recent conversations (hot) and random old ones (cold for SQLite)
+    recent = ["569" + str(10000000 + i) for i in range(max(0, sessions - max_hot // 2), sessions)]
+    latencies = {"recent": [], "random": []}
+    for _ in range(lookups):
+        for label, phone in (("recent", random.choice(recent)), ("random", "569" + str(10000000 + random.randrange(sessions)))):
+            t0 = time.perf_counter()
+            session = await service.get_session(app_name=APP_NAME, user_id=phone, session_id=phone)
+            latencies[label].append(time.perf_counter() - t0)
+            assert session is not None and len(session.events) == 2
+
+    print(
+        backend.ljust(7)
+        + " sessions=" + str(sessions)
+        + "  rss=" + str(round(rss_mb() - base_rss)) + "MB"
+        + "  load=" + str(round(load_seconds, 1)) + "s"
+        + "".join(
+            "  " + label + " p50=" + str(round(percentile(v, 0.5) * 1e6)) + "us p99=" + str(round(percentile(v, 0.99) * 1e6)) + "us"
+            for label, v in latencies.items()
+        )
+    )
+    if hasattr(service, "stats"):
+        print("        " + str(service.stats()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--max-hot", type=int, default=10000)
+    parser.add_argument("--backend", choices=["memory", "sqlite"])
+    args = parser.parse_args()
+
+    if args.backend:
+        asyncio.run(run_backend(args.backend, args.sessions, args.lookups, args.max_hot))
+        return
+
+    for backend in ("memory", "sqlite"):
+        subprocess.run([
+            sys.executable, __file__,
+            "--backend", backend,
+            "--sessions", str(args.sessions),
+            "--lookups", str(args.lookups),
+            "--max-hot", str(args.max_hot)
+        ], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Benchmark: per-message httpx client (old behavior) vs the shared pooled client.
+#
+# Starts a local stub of the SpicyTool send endpoint that counts TCP
+# connections and can add a delay to every new connection (to emulate the
+# TLS handshake round-trips against the real API).
+#
+# Usage:
+#   python benchmarks/bench_whatsapp_send.py --messages 500 --concurrency 20 --handshake-ms 30
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubServer:
+    """Minimal keep-alive HTTP/1.1 server answering 200 to every request."""
+
+    def __init__(self, handshake_delay: float):
+        self.handshake_delay = handshake_delay
+        self.connections = 0
+        self.server = None
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        await asyncio.sleep(self.handshake_delay)
+        try:
+            while True:
+                headers = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in headers.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                await reader.readexactly(length)
+                body = b'{"ok":true}'
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return "http://127.0.0.1:" + str(port) + "/sendMessage"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(label, send, messages, concurrency, server):
+    server.connections = 0
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await send("bench@example.com", "569" + str(i), "hola " + str(i))
+            assert result["success"], result
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    elapsed = time.perf_counter() - started
+    print(
+        label.ljust(22)
+        + " connections=" + str(server.connections).rjust(5)
+        + "  p50=" + str(round(percentile(latencies, 0.50) * 1000, 1)).rjust(6) + "ms"
+        + "  p99=" + str(round(percentile(latencies, 0.99) * 1000, 1)).rjust(6) + "ms"
+        + "  throughput=" + str(round(messages / elapsed)) + " msg/s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--handshake-ms", type=float, default=30.0)
+    args = parser.parse_args()
+
+    server = StubServer(args.handshake_ms / 1000)
+    url = await server.start()
+    os.environ["SPICYTOOL_API_URL"] = url
+
+    from services import whatsapp
+    whatsapp.SPICYTOOL_API_URL = url
+
+    async def send_new_client(user_email, conversation_id, message):
+        # Old behavior: a new client (and connection) per message
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                url,
+                json={"userEmail": user_email, "conversationId": conversation_id, "message": message},
+                timeout=30.0
+            )
+            return {"success": response.status_code == 200}
+
+    await run("client per message", send_new_client, args.messages, args.concurrency, server)
+
+    await whatsapp.open_client()
+    await run("shared pooled client", whatsapp.send_whatsapp_message, args.messages, args.concurrency, server)
+    print("pool stats:", whatsapp.pool_stats.to_dict())
+    await whatsapp.close_client()
+
+    await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,176 @@
+# Benchmark: several webhook workers sharing debounce buffers and per-phone
+# locks through the coordination backend.
+#
+# Messages of each phone are spread over the workers at random (like a load
+# balancer). Each worker runs the real Debouncer and ConversationQueue; a
+# turn is simulated as CPU work (prompt building, parsing) plus a model wait.
+# We check that every message is answered exactly once and that each burst
+# gets one reply, and report turn throughput per worker count.
+# "--backend local" shows what happens without coordination: bursts split
+# across workers get several replies.
+#
+# The default load does not saturate one core (a correctness check). Raise
+# --cpu-ms / --phones to saturate the workers and compare capacity; it only
+# scales with workers if the machine has that many cores. Saturated workers
+# also receive messages late, which splits some bursts even with one worker.
+#
+# Usage:
+#   python benchmarks/bench_workers.py --workers 1 2 4 --phones 200
+#   python benchmarks/bench_workers.py --workers 1 2 4 --phones 1000 --cpu-ms 10
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_schedule(phones: int, rounds: int, burst: int, round_gap: float, seed: int) -> list:
+    """(send_at, phone, text) for every message; each round is a burst per phone."""
+    rng = random.Random(seed)
+    schedule = []
+    for p in range(phones):
+        phone = "569" + str(10000000 + p)
+        for r in range(rounds):
+            start = r * round_gap + rng.uniform(0, round_gap / 4)
+            for b in range(burst):
+                schedule.append((start + b * 0.02, phone, phone + ":" + str(r) + ":" + str(b)))
+    schedule.sort()
+    return schedule
+
+
+async def run_worker(index: int, workers: int, args, db_dir: str, out_path: str, start_at: float):
+    from services.coordination import LocalCoordination, SqliteCoordination
+    from services.conversation_queue import ConversationQueue
+    from services.debouncer import Debouncer
+
+    if args.backend == "sqlite":
+        coordination = SqliteCoordination(db_path=os.path.join(db_dir, "coordination.db"))
+    else:
+        coordination = LocalCoordination()
+    debouncer = Debouncer(delay_seconds=args.delay, coordination=coordination)
+    queue = ConversationQueue(coordination=coordination)
+    out = open(out_path, "a")
+
+    async def turn(phone, text, payload):
+        async with queue.turn(phone):
+            deadline = time.perf_counter() + args.cpu_ms / 1000
+            while time.perf_counter() < deadline:
+                pass
+            await asyncio.sleep(args.llm_latency)
+            out.write(json.dumps({"phone": phone, "text": text, "at": time.time()}) + "\n")
+            out.flush()
+
+    rng = random.Random(args.seed + 1)
+    mine = [m for m in build_schedule(args.phones, args.rounds, args.burst, args.round_gap, args.seed)
+            if rng.randrange(workers) == index]
+    for send_at, phone, text in mine:
+        wait = start_at + send_at - time.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await debouncer.debounce(phone, text, {}, turn)
+    # Keep serving until the parent stops us
+    await asyncio.sleep(3600)
+
+
+def worker_main(index, workers, args, db_dir, out_path, ready, start):
+    # Import the app before the clock starts
+    import services  # noqa: F401
+    ready.put(index)
+    start_at = start.get()
+    asyncio.run(run_worker(index, workers, args, db_dir, out_path, start_at))
+
+
+def run(workers: int, args) -> dict:
+    db_dir = tempfile.mkdtemp()
+    os.environ["SESSION_DB_PATH"] = os.path.join(db_dir, "sessions.db")
+    out_path = os.path.join(db_dir, "replies.jsonl")
+    open(out_path, "w").close()
+    ready, start = multiprocessing.Queue(), multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker_main, args=(i, workers, args, db_dir, out_path, ready, start))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get()
+    start_at = time.time() + 0.5
+    for _ in processes:
+        start.put(start_at)
+
+    schedule = build_schedule(args.phones, args.rounds, args.burst, args.round_gap, args.seed)
+    last_send = start_at + schedule[-1][0]
+    all_messages = [m[2] for m in schedule]
+    replies = []
+    answered_texts = set()
+    quiet_since = time.time()
+    while time.time() < last_send + 300:
+        time.sleep(0.2)
+        with open(out_path) as f:
+            lines = f.readlines()
+        if len(lines) != len(replies):
+            for line in lines[len(replies):]:
+                replies.append(json.loads(line))
+                answered_texts.update(replies[-1]["text"].split(" "))
+            quiet_since = time.time()
+        # Done when every message got a reply (or nothing happens any more)
+        if len(answered_texts) >= len(all_messages) or (time.time() > last_send and time.time() - quiet_since > 10):
+            break
+    # Let duplicate replies, if any, come in
+    time.sleep(args.delay + args.llm_latency + 0.5)
+    with open(out_path) as f:
+        replies = [json.loads(line) for line in f]
+    for process in processes:
+        process.terminate()
+        process.join()
+    shutil.rmtree(db_dir)
+
+    answered = {}
+    bursts = {}  # (phone, round) -> turns that answered part of it
+    for turn_index, reply in enumerate(replies):
+        for text in reply["text"].split(" "):
+            answered[text] = answered.get(text, 0) + 1
+            bursts.setdefault(text.rsplit(":", 1)[0], set()).add(turn_index)
+    elapsed = max(r["at"] for r in replies) - start_at if replies else 0.0
+    return {
+        "workers": workers,
+        "backend": args.backend,
+        "messages": len(all_messages),
+        "turns": len(replies),
+        # A burst should be answered by one turn (rounds may merge under load)
+        "split_bursts": sum(1 for turns in bursts.values() if len(turns) > 1),
+        "messages_unanswered": sum(1 for m in all_messages if m not in answered),
+        "messages_answered_twice": sum(1 for m in all_messages if answered.get(m, 0) > 1),
+        "turns_per_second": round(len(replies) / elapsed, 1) if elapsed else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--backend", choices=["sqlite", "local"], default="sqlite")
+    parser.add_argument("--phones", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--burst", type=int, default=3)
+    parser.add_argument("--round-gap", type=float, default=1.0)
+    parser.add_argument("--delay", type=float, default=0.3)
+    parser.add_argument("--cpu-ms", type=float, default=2.0, help="CPU time per simulated turn")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print("cpus: " + str(os.cpu_count()))
+    for workers in args.workers:
+        print(json.dumps(run(workers, args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+# End-to-end load test of the webhook, fully offline.
+#
+# Three processes:
+#   - stubs: local stand-ins for the SpicyTool send endpoint (records every
+#     reply with its arrival time) and the CRM contact API, with configurable
+#     latency,
+#   - webhook: webhook.app under uvicorn, pointed at the stubs, with the
+#     agent on a scripted FakeLlm (latency, tool calls) and its databases in
+#     a temporary directory. Its loop monitor (observability/loop_monitor.py)
+#     measures event-loop lag and catches blocking calls,
+#   - load generator (this process): simulated phones send bursts of
+#     messages (SpicyTool-style deliveries with the whole conversation).
+#
+# Reported: accepted messages/s, replies/s, webhook ack latency, end-to-end
+# latency (last message of a burst sent -> reply received by the SpicyTool
+# stub, debounce delay included) and event-loop lag, as p50/p95/p99/max.
+# Results are saved as JSON; --compare prints the change against a saved run.
+# With --fail-on-blocking the run exits with status 1 if anything blocked the
+# loop for longer than --blocking-threshold-ms, and prints the call sites.
+#
+# Usage:
+#   python benchmarks/loadtest.py --phones 200 --rounds 3 --llm-latency 0.5
+#   python benchmarks/loadtest.py --tool-calls get_contact --compare benchmarks/results/before.json
+#   python benchmarks/loadtest.py --fail-on-blocking --blocking-threshold-ms 50
+#   python benchmarks/loadtest.py --llm-slow-rate 0.05 --llm-slow-latency 5 --hedge
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def at(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+    return {
+        "count": len(values),
+        "p50_ms": at(0.50),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": round(values[-1] * 1000, 1)
+    }
+
+
+# ---------- stubs process ----------
+
+def stubs_main(port: int, send_latency: float, crm_latency: float):
+    import uvicorn
+    from fastapi import FastAPI, Request
+
+    app = FastAPI()
+    deliveries = []
+    crm_calls = {"count": 0}
+
+    @app.post("/sendMessage")
+    async def send_message(request: Request):
+        body = await request.json()
+        if send_latency:
+            await asyncio.sleep(send_latency)
+        deliveries.append({"phone": body["conversationId"], "at": time.time()})
+        return {"ok": True}
+
+    @app.api_route("/crm/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+    async def crm(path: str):
+        crm_calls["count"] += 1
+        if crm_latency:
+            await asyncio.sleep(crm_latency)
+        if path.startswith("contact/"):
+            phone = path.split("/", 1)[1]
+            # Every other phone is a known contact
+            if phone[-1] in "02468":
+                return {"_id": phone, "name": "Cliente " + phone[-4:], "phoneNumber": phone}
+            return {"message": "Contact not found"}
+        return {"_id": "c-" + str(crm_calls["count"]), "ok": True}
+
+    @app.get("/_stats")
+    async def stats():
+        return {"deliveries": deliveries, "crm_calls": crm_calls["count"]}
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# ---------- webhook process ----------
+
+def webhook_main(port: int, stubs_url: str, db_dir: str, args):
+    os.environ.update({
+        "SPICYTOOL_API_URL": stubs_url + "/sendMessage",
+        "SPICY_API_TOKEN": "loadtest",
+        "SESSION_DB_PATH": os.path.join(db_dir, "sessions.db"),
+        "OUTBOX_DB_PATH": os.path.join(db_dir, "outbox.db"),
+        "COORDINATION_DB_PATH": os.path.join(db_dir, "coordination.db"),
+        "OUTBOX_RATE_PER_SECOND": "100000",
+        "OUTBOX_RATE_BURST": "100000",
+        "LLM_MAX_CONCURRENCY": str(args.llm_concurrency),
+        "LOOP_MONITOR_ENABLED": "true",
+        "LOOP_MONITOR_INTERVAL_MS": str(args.lag_interval * 1000),
+        "LOOP_LAG_THRESHOLD_MS": str(args.blocking_threshold_ms)
+    })
+    os.chdir(db_dir)  # load_dotenv must not pick up a developer .env
+
+    import uvicorn
+    import webhook
+    from real_estate_agent.agent import root_agent
+    from real_estate_agent.fake_llm import FakeLlm
+    from real_estate_agent.hedging import HedgedLlm
+    from real_estate_agent.tools import crm_async
+    from services import debouncer
+    from services.debounce_policy import AdaptiveDelay
+    from services.interrupts import turn_interrupts
+
+    crm_async.CRM_API_URL = stubs_url + "/crm"
+    tool_calls = [{"name": name, "args": {"contact_id": "1"}} for name in args.tool_calls]
+    random.seed(args.seed)  # which model calls are slow
+    root_agent.model = FakeLlm(
+        latency=args.llm_latency, slow_rate=args.llm_slow_rate, slow_latency=args.llm_slow_latency, tool_calls=tool_calls
+    )
+    if args.hedge:
+        # Duplicate calls on the same fake model; hedge after 3x the usual latency until the percentile is known
+        root_agent.model = HedgedLlm(
+            primary=root_agent.model, default_delay=args.llm_latency * 3, min_delay=args.llm_latency * 1.5
+        )
+    debouncer.delay_seconds = args.debounce
+    # Fixed delay unless asked: keeps runs comparable with older results
+    debouncer.policy = AdaptiveDelay(
+        initial_delay=args.debounce, min_delay=min(args.debounce, 0.2), max_delay=args.debounce * 2
+    ) if args.adaptive_debounce else None
+    turn_interrupts.enabled = args.interruptible_turns
+
+    if args.inject_blocking_ms:
+        # Simulated regression: a synchronous call on every webhook request
+        @webhook.app.middleware("http")
+        async def blocking_middleware(request, call_next):
+            time.sleep(args.inject_blocking_ms / 1000)
+            return await call_next(request)
+
+    async def serve():
+        config = uvicorn.Config(webhook.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+        await uvicorn.Server(config).serve()
+
+    # Keep the app's logs out of the report
+    from observability import log
+    log.configure(stream=open(os.path.join(db_dir, "webhook.log"), "w"))
+    asyncio.run(serve())
+
+
+# ---------- load generator ----------
+
+def build_schedule(args) -> list:
+    """(send_at, phone, round) for every message; each round is a burst per phone."""
+    rng = random.Random(args.seed)
+    schedule = []
+    for p in range(args.phones):
+        phone = "+569" + str(10000000 + p)
+        start = rng.uniform(0, args.round_gap)
+        for r in range(args.rounds):
+            at = start + r * args.round_gap
+            for _ in range(rng.randint(1, args.burst)):
+                schedule.append((at, phone, r))
+                at += rng.uniform(0, args.burst_gap)
+    schedule.sort()
+    return schedule
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("not ready: " + url)
+
+
+def delivery(phone: str, history: list, text: str) -> dict:
+    history.append({
+        "id": "wamid." + phone[1:] + "." + str(len(history)),
+        "body": text,
+        "fromMe": False,
+        "timestamp": int(time.time() * 1000) + len(history)
+    })
+    return {
+        "from": phone,
+        "userEmail": "loadtest@inmobiliaria.cl",
+        "contactId": None,
+        "conversation": history[-20:]
+    }
+
+
+async def generate_load(args, webhook_url: str, stubs_url: str) -> dict:
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(limits=limits, timeout=60.0) as client:
+        await wait_ready(client, stubs_url + "/_stats")
+        await wait_ready(client, webhook_url + "/health")
+
+        # First agent turn pays one-time setup: keep it out of the numbers
+        warmup = "+56900000000"
+        await client.post(webhook_url + "/webhook/whatsapp/sync", json=delivery(warmup, [], "hola"))
+        await client.get(webhook_url + "/debug/loop", params={"reset": True})
+
+        schedule = build_schedule(args)
+        histories = {}
+        sent = {}  # phone -> send times
+        acks = []
+        errors = 0
+        semaphore = asyncio.Semaphore(args.connections)
+
+        async def send(phone: str, text: str):
+            nonlocal errors
+            body = delivery(phone, histories.setdefault(phone, []), text)
+            async with semaphore:
+                started = time.perf_counter()
+                sent.setdefault(phone, []).append(time.time())
+                try:
+                    response = await client.post(webhook_url + "/webhook/whatsapp", json=body)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                acks.append(time.perf_counter() - started)
+
+        start = time.time()
+        tasks = []
+        for send_at, phone, round_index in schedule:
+            wait = start + send_at - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            tasks.append(asyncio.create_task(send(phone, "mensaje " + str(round_index))))
+        await asyncio.gather(*tasks)
+        sending_time = time.time() - start
+
+        # Wait for the replies to stop coming
+        seen, quiet_since = -1, time.time()
+        while time.time() - quiet_since < args.debounce + args.llm_latency + 2 and time.time() - start < args.timeout:
+            await asyncio.sleep(0.25)
+            stats = (await client.get(stubs_url + "/_stats")).json()
+            count = len(stats["deliveries"])
+            if count != seen:
+                seen, quiet_since = count, time.time()
+
+        health = (await client.get(webhook_url + "/health")).json()
+        loop_stats = (await client.get(webhook_url + "/debug/loop")).json()
+
+    # A reply answers the newest message of its phone sent before it
+    end_to_end = []
+    replies = [d for d in stats["deliveries"] if d["phone"] != warmup and d["at"] >= start]
+    for reply in replies:
+        before = [at for at in sent.get(reply["phone"], []) if at <= reply["at"]]
+        if before:
+            end_to_end.append(reply["at"] - before[-1])
+    elapsed = max([r["at"] for r in replies] + [start + sending_time]) - start
+    answered = {r["phone"] for r in replies}
+
+    return {
+        "messages": len(schedule),
+        "phones": args.phones,
+        "replies": len(replies),
+        "phones_unanswered": sum(1 for phone in sent if phone not in answered),
+        "webhook_errors": errors,
+        "crm_calls": stats["crm_calls"],
+        "throughput": {
+            "messages_per_second": round(len(schedule) / sending_time, 1),
+            "replies_per_second": round(len(replies) / elapsed, 1)
+        },
+        "ack_latency": percentiles(acks),
+        "end_to_end_latency": percentiles(end_to_end),
+        "event_loop_lag": loop_stats["lag"],
+        "loop_stalls": loop_stats["stalls"],
+        "blocking_call_sites": loop_stats["top_offenders"],
+        "health": health
+    }
+
+
+def compare(result: dict, baseline: dict):
+    rows = [
+        ("messages/s", ("throughput", "messages_per_second")),
+        ("replies/s", ("throughput", "replies_per_second")),
+        ("ack p99 ms", ("ack_latency", "p99_ms")),
+        ("e2e p50 ms", ("end_to_end_latency", "p50_ms")),
+        ("e2e p95 ms", ("end_to_end_latency", "p95_ms")),
+        ("e2e p99 ms", ("end_to_end_latency", "p99_ms")),
+        ("lag p99 ms", ("event_loop_lag", "p99_ms")),
+        ("lag max ms", ("event_loop_lag", "max_ms")),
+        ("stalls", ("loop_stalls",)),
+    ]
+    print("\n" + "metric".ljust(12) + "baseline".rjust(12) + "current".rjust(12) + "change".rjust(10))
+    for label, path in rows:
+        old, new = baseline["results"], result["results"]
+        for key in path:
+            old = old.get(key) if isinstance(old, dict) else None
+            new = new.get(key) if isinstance(new, dict) else None
+        change = ""
+        if old and new is not None:
+            change = ("+" if new >= old else "") + str(round((new - old) / old * 100, 1)) + "%"
+        print(label.ljust(12) + str(old).rjust(12) + str(new).rjust(12) + change.rjust(10))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phones", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--burst", type=int, default=3, help="max messages per burst")
+    parser.add_argument("--burst-gap", type=float, default=0.3, help="max seconds between messages of a burst")
+    parser.add_argument("--round-gap", type=float, default=3.0, help="seconds between bursts of a phone")
+    parser.add_argument("--debounce", type=float, default=1.0)
+    parser.add_argument("--adaptive-debounce", action="store_true", help="per-phone delay starting at --debounce")
+    parser.add_argument("--interruptible-turns", action="store_true", help="newer messages cancel running turns")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-slow-rate", type=float, default=0.0, help="share of model calls that are slow")
+    parser.add_argument("--llm-slow-latency", type=float, default=0.0, help="latency of the slow model calls")
+    parser.add_argument("--hedge", action="store_true", help="hedge slow model calls (real_estate_agent/hedging.py)")
+    parser.add_argument("--llm-concurrency", type=int, default=16)
+    parser.add_argument("--tool-calls", nargs="*", default=[], help="tools the fake model calls every turn")
+    parser.add_argument("--send-latency", type=float, default=0.05, help="SpicyTool stub latency")
+    parser.add_argument("--crm-latency", type=float, default=0.05, help="CRM stub latency")
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--lag-interval", type=float, default=0.02)
+    parser.add_argument("--blocking-threshold-ms", type=float, default=100.0, help="loop stall reported as blocking")
+    parser.add_argument("--fail-on-blocking", action="store_true", help="exit 1 if the loop was blocked")
+    parser.add_argument("--inject-blocking-ms", type=float, default=0.0, help="block the loop on every request (self-check)")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="results file (default: benchmarks/results/loadtest-<time>.json)")
+    parser.add_argument("--compare", help="saved results to compare against")
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp(prefix="loadtest-")
+    stubs_port, webhook_port = free_port(), free_port()
+    stubs_url = "http://127.0.0.1:" + str(stubs_port)
+    webhook_url = "http://127.0.0.1:" + str(webhook_port)
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=stubs_main, args=(stubs_port, args.send_latency, args.crm_latency)),
+        context.Process(target=webhook_main, args=(webhook_port, stubs_url, db_dir, args))
+    ]
+    for process in processes:
+        process.start()
+    try:
+        results = asyncio.run(generate_load(args, webhook_url, stubs_url))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+    result = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cpus": os.cpu_count(),
+        "config": vars(args),
+        "results": results
+    }
+    out = args.out or os.path.join(RESULTS_DIR, "loadtest-" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    summary = {k: v for k, v in results.items() if k not in ("health", "blocking_call_sites")}
+    print(json.dumps(summary, indent=2))
+    print("saved: " + out)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+    if args.fail_on_blocking and results["loop_stalls"]:
+        print("\nFAIL: event loop blocked " + str(results["loop_stalls"]) + " times (> "
+              + str(args.blocking_threshold_ms) + "ms)")
+        for site in results["blocking_call_sites"]:
+            print("\n" + site["site"] + "  count=" + str(site["count"]) + " blocked_ms=" + str(site["blocked_ms"]))
+            print(site["stack"])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
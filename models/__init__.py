@@ -3,13 +3,18 @@ from .payloads import (
     WebhookPayload,
     WhatsAppOutgoingMessage,
     AgentResponse,
-    WebhookResponse
+    WebhookResponse,
+    JobResponse
 )
+from .lean_payload import LazyConversation, parse_webhook_payload
 
 __all__ = [
     "Message",
     "WebhookPayload", 
     "WhatsAppOutgoingMessage",
     "AgentResponse",
-    "WebhookResponse"
+    "WebhookResponse",
+    "JobResponse",
+    "LazyConversation",
+    "parse_webhook_payload"
 ]
\ No newline at end of file
@@ -0,0 +1,105 @@
+# Lean parsing of webhook payloads
+#
+# SpicyTool sends the whole conversation on every delivery, but the webhook
+# only reads the newest messages (it scans from the end until it reaches
+# messages already processed). Validating every Message runs two Python
+# validators per item, which dominates the cost of a request on long chats.
+#
+# parse_webhook_payload decodes the raw body with orjson (json if missing),
+# validates the top-level fields with WebhookPayload, and wraps the raw
+# conversation in a LazyConversation that validates a Message only when it
+# is read. Untouched items get a cheap structural check that covers the only
+# ways Message validation can fail (non-dict item, non-string id or body);
+# anything else falls back to full validation, so the same payloads are
+# rejected with the same errors.
+
+import json
+from collections.abc import Sequence
+
+from .payloads import Message, WebhookPayload
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class LazyConversation(Sequence):
+    """Read-only list of Message built from raw dicts on first access."""
+
+    __slots__ = ("_raw", "_messages")
+
+    def __init__(self, raw: list):
+        self._raw = raw
+        self._messages = [None] * len(raw)
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._raw)))]
+        message = self._messages[index]
+        if message is None:
+            message = self._messages[index] = Message.model_validate(self._raw[index])
+        return message
+
+    def __iter__(self):
+        for i in range(len(self._raw)):
+            yield self[i]
+
+    def __reversed__(self):
+        for i in range(len(self._raw) - 1, -1, -1):
+            yield self[i]
+
+    @property
+    def materialized(self) -> int:
+        """Messages validated so far."""
+        return sum(1 for message in self._messages if message is not None)
+
+
+def _is_plain_message(item) -> bool:
+    """True if Message.model_validate(item) cannot fail."""
+    return (
+        type(item) is dict
+        and type(item.get("id", "")) is str
+        and type(item.get("body", "")) is str
+    )
+
+
+def loads(body: bytes):
+    """
+    Decodes a JSON body with orjson when installed. Bodies orjson rejects
+    (invalid, NaN, huge integers) go through json, so the same bodies are
+    accepted and errors read the same as with FastAPI's parser.
+
+    Raises:
+        ValueError: invalid JSON
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(body)
+
+
+def parse_webhook_payload(data) -> WebhookPayload:
+    """
+    Validates decoded webhook JSON like a FastAPI WebhookPayload body
+    parameter (model_validate with from_attributes=True), but the
+    conversation is a LazyConversation.
+
+    Raises:
+        pydantic.ValidationError: same errors as full validation
+    """
+    raw = data.get("conversation") if type(data) is dict else None
+    if type(raw) is not list or not all(map(_is_plain_message, raw)):
+        # Not the common shape: let the model produce the exact result/errors
+        return WebhookPayload.model_validate(data, from_attributes=True)
+
+    top_level = dict(data)
+    top_level["conversation"] = []
+    payload = WebhookPayload.model_validate(top_level, from_attributes=True)
+    payload.conversation = LazyConversation(raw)
+    return payload
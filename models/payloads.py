@@ -77,3 +77,10 @@ class WebhookResponse(BaseModel):
     whatsapp_api_status: Optional[int] = None
     should_escalate: bool = False
     escalation: Optional[dict] = None
+
+
+class JobResponse(BaseModel):
+    """Job created by /webhook/whatsapp/jobs; result is set once done."""
+    job_id: str
+    status: str  # "pending" or "done"
+    result: Optional[WebhookResponse] = None
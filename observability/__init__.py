@@ -0,0 +1,16 @@
+from .metrics import registry, span, observe_stage, stage_seconds, tool_seconds, whatsapp_sends
+from .log import get_logger, start_trace, elapsed_ms
+from .loop_monitor import loop_monitor
+
+__all__ = [
+    "registry",
+    "span",
+    "observe_stage",
+    "stage_seconds",
+    "tool_seconds",
+    "whatsapp_sends",
+    "get_logger",
+    "start_trace",
+    "elapsed_ms",
+    "loop_monitor"
+]
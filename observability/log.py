@@ -0,0 +1,244 @@
+# Structured, non-blocking logging
+#
+# print() on the hot path writes to stdout from the event loop: a slow pipe
+# (container log driver, terminal) stalls every conversation. Records are
+# instead appended to an in-memory queue and a background thread formats
+# them as JSON lines and writes them out in batches.
+#
+# The event loop only builds a tuple: no logging.LogRecord, no formatting,
+# no I/O. The writer wakes up every LOG_FLUSH_INTERVAL, so lines reach the
+# output with that much delay at most; shutdown() writes what is left.
+#
+# Each record is one JSON object:
+#   {"ts": ..., "level": "info", "logger": "webhook", "event": "message_received",
+#    "stage": "ingress", "duration_ms": 1.2, "phone_hash": "...", "trace_id": "...", ...}
+# Phone numbers are never written, only a salted hash (phone_hash), and
+# message bodies only when LOG_BODIES is enabled. Without LOG_PHONE_SALT a
+# random salt is drawn per process, so hashes cannot be reversed by hashing
+# every phone number, but do not match across workers or restarts.
+#
+# Usage:
+#   logger = get_logger(__name__)
+#   logger.info("turn_done", phone=phone_number, stage="agent", duration_ms=812.4)
+
+import atexit
+import contextvars
+import hashlib
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+_LEVEL_NAMES = {value: name.lower() for name, value in LEVELS.items()}
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Share of debug/info records kept (warnings and errors are always kept)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+# Include message bodies and agent replies in records
+LOG_BODIES = os.getenv("LOG_BODIES", "false").lower() in ("true", "1", "yes")
+# Secret salt of phone_hash; set it to correlate a phone's records across processes
+LOG_PHONE_SALT = os.getenv("LOG_PHONE_SALT", "") or secrets.token_hex(16)
+# Records waiting for the writer thread; beyond this new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "100000"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.05"))
+
+# Trace id of the current request or agent turn
+trace_id_var: contextvars.ContextVar = contextvars.ContextVar("trace_id", default=None)
+
+_level = LEVELS.get(LOG_LEVEL, 20)
+_writer: Optional["LogWriter"] = None
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def start_trace(trace_id: Optional[str] = None) -> str:
+    """Sets the trace id for the current task (and tasks it creates)."""
+    trace_id = trace_id or new_trace_id()
+    trace_id_var.set(trace_id)
+    return trace_id
+
+
+@lru_cache(maxsize=10000)
+def phone_hash(phone_number: str) -> str:
+    """Stable pseudonym of a phone number for log records."""
+    return hashlib.sha256((LOG_PHONE_SALT + phone_number).encode()).hexdigest()[:12]
+
+
+def format_record(record: tuple) -> str:
+    """(ts, level, logger, event, fields) -> one JSON line."""
+    created, level, name, event, fields = record
+    data = {"ts": round(created, 3), "level": _LEVEL_NAMES[level], "logger": name, "event": event}
+    data.update(fields)
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=str).decode() + "\n"
+        except TypeError:
+            pass  # e.g. non-string keys: json handles them
+    return json.dumps(data, ensure_ascii=False, default=str) + "\n"
+
+
+class LogWriter(threading.Thread):
+    """Background thread that drains queued records to a stream."""
+
+    def __init__(self, stream, max_queue: int = LOG_QUEUE_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL):
+        super().__init__(name="log-writer", daemon=True)
+        self.stream = stream
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.records = deque()
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self._stopping = threading.Event()
+
+    def put(self, record: tuple):
+        # deque.append is atomic; the length check may overshoot by a few records
+        if len(self.records) >= self.max_queue:
+            self.dropped += 1
+            return
+        self.records.append(record)
+
+    def run(self):
+        while True:
+            stopping = self._stopping.wait(self.flush_interval)
+            self._drain()
+            if stopping:
+                return
+
+    def _drain(self):
+        records = self.records
+        while records:
+            lines = []
+            try:
+                for _ in range(1000):
+                    lines.append(format_record(records.popleft()))
+            except IndexError:
+                pass
+            try:
+                self.stream.write("".join(lines))
+                self.stream.flush()
+                self.written += len(lines)
+            except (OSError, ValueError):
+                # Closed or broken output: the records are lost, the app keeps going
+                self.write_errors += 1
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+
+
+def configure(stream=None, level: str = LOG_LEVEL):
+    """
+    Starts the writer thread on a stream (stdout by default).
+    Called on first use; call again to change the stream (tests, benchmarks).
+    """
+    global _writer, _level
+    shutdown()
+    _level = LEVELS.get(level.upper(), 20)
+    _writer = LogWriter(stream or sys.stdout)
+    _writer.start()
+
+
+def start():
+    """Starts the writer thread if it is not running (e.g. after shutdown())."""
+    if _writer is None or not _writer.is_alive():
+        configure()
+
+
+def shutdown():
+    """Writes out the queued records and stops the writer thread."""
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+atexit.register(shutdown)
+
+
+class StructuredLogger:
+    """
+    Logger taking an event name and fields instead of a formatted string.
+
+    Records below the level, or dropped by sampling, cost one comparison.
+    A `phone` field is replaced by `phone_hash`; the current trace id is
+    added to every record.
+    """
+
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def _log(self, level: int, event: str, fields: dict, exc_info=None):
+        if level < _level:
+            return
+        if level < 30 and LOG_SAMPLE_RATE < 1.0 and random.random() >= LOG_SAMPLE_RATE:
+            return
+        phone = fields.pop("phone", None)
+        if phone:
+            fields["phone_hash"] = phone_hash(phone)
+        if not LOG_BODIES:
+            for key in ("body", "reply"):
+                value = fields.pop(key, None)
+                if value is not None:
+                    fields[key + "_chars"] = len(value)
+        trace_id = trace_id_var.get()
+        if trace_id:
+            fields["trace_id"] = trace_id
+        if exc_info is not None:
+            if exc_info is True:
+                exc_info = sys.exc_info()[1]
+            fields["exception"] = "".join(traceback.format_exception(exc_info)).rstrip()
+        writer = _writer
+        if writer is not None:
+            writer.put((time.time(), level, self.name, event, fields))
+
+    def debug(self, event: str, **fields):
+        self._log(10, event, fields)
+
+    def info(self, event: str, **fields):
+        self._log(20, event, fields)
+
+    def warning(self, event: str, **fields):
+        self._log(30, event, fields)
+
+    def error(self, event: str, exc_info=None, **fields):
+        self._log(40, event, fields, exc_info)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    start()
+    return StructuredLogger(name)
+
+
+def stats() -> dict:
+    return {
+        "level": _LEVEL_NAMES.get(_level, str(_level)),
+        "sample_rate": LOG_SAMPLE_RATE,
+        "queued": len(_writer.records) if _writer else 0,
+        "written": _writer.written if _writer else 0,
+        "dropped": _writer.dropped if _writer else 0,
+        "write_errors": _writer.write_errors if _writer else 0
+    }
+
+
+def elapsed_ms(started: float) -> float:
+    """Milliseconds since a time.perf_counter() value, for duration_ms fields."""
+    return round((time.perf_counter() - started) * 1000, 1)
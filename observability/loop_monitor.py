@@ -0,0 +1,206 @@
+# Event-loop lag monitor and blocking-call detector
+#
+# A heartbeat task on the event loop wakes up every interval and records how
+# late it woke up (loop lag). A watchdog thread checks the heartbeat: when
+# the loop has not beaten for longer than the threshold, something is
+# blocking it (sync I/O, CPU-heavy code), and the watchdog captures the
+# stack of the loop thread at that moment. The first project frame of that
+# stack (the call site) is counted as an offender, with the time it blocked.
+#
+# Exposed on /debug/loop (percentiles, top offenders with stacks), /health
+# and /metrics. The load test fails a run when the loop was blocked.
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, Optional
+
+from .metrics import registry
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() in ("true", "1", "yes")
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "50")) / 1000
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")) / 1000
+
+# Frames under this directory are "ours"; the call site is the innermost one
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_OWN_FILE = os.path.abspath(__file__)
+
+# Lag samples kept for percentiles (10 minutes at the default interval)
+_LAG_SAMPLES = 12000
+_MAX_OFFENDERS = 100
+
+lag_seconds = registry.histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a timer that was due.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+stalls_total = registry.counter(
+    "event_loop_stalls_total",
+    "Times the event loop was blocked longer than the lag threshold."
+)
+
+
+def _call_site(stack: traceback.StackSummary) -> str:
+    """Innermost frame of project code (not a dependency), as file:line in function."""
+    chosen = stack[-1] if stack else None
+    for frame in reversed(stack):
+        path = os.path.abspath(frame.filename)
+        if path.startswith(PROJECT_ROOT) and path != _OWN_FILE and "site-packages" not in path:
+            chosen = frame
+            break
+    if chosen is None:
+        return "unknown"
+    return os.path.relpath(chosen.filename, PROJECT_ROOT) + ":" + str(chosen.lineno) + " in " + chosen.name
+
+
+class Offender:
+    """A call site seen blocking the loop."""
+
+    __slots__ = ("site", "count", "blocked_seconds", "max_seconds", "stack")
+
+    def __init__(self, site: str, stack: str):
+        self.site = site
+        self.count = 0
+        self.blocked_seconds = 0.0
+        self.max_seconds = 0.0
+        self.stack = stack
+
+    def to_dict(self, with_stack: bool = True) -> dict:
+        data = {
+            "site": self.site,
+            "count": self.count,
+            "blocked_ms": round(self.blocked_seconds * 1000, 1),
+            "max_ms": round(self.max_seconds * 1000, 1)
+        }
+        if with_stack:
+            data["stack"] = self.stack
+        return data
+
+
+class LoopMonitor:
+    """Heartbeat on the loop plus a watchdog thread that catches blocking calls."""
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = deque(maxlen=_LAG_SAMPLES)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.offenders: Dict[str, Offender] = {}
+        self._beat = 0.0
+        self._stalled: Optional[Offender] = None  # captured, not yet attributed
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._loop_thread_id = 0
+
+    @property
+    def running(self) -> bool:
+        return self._heartbeat is not None and not self._heartbeat.done()
+
+    async def start(self):
+        """Starts the heartbeat and the watchdog. Called on webhook startup."""
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopping.clear()
+        self._heartbeat = asyncio.create_task(self._run_heartbeat())
+        self._watchdog = threading.Thread(target=self._run_watchdog, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    async def _run_heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self._beat = time.monotonic()
+            self.record(lag)
+
+    def record(self, lag: float):
+        self.samples.append(lag)
+        self.max_lag = max(self.max_lag, lag)
+        lag_seconds.observe(lag)
+        stalled, self._stalled = self._stalled, None
+        if stalled is not None:
+            stalled.blocked_seconds += lag
+            stalled.max_seconds = max(stalled.max_seconds, lag)
+
+    def _run_watchdog(self):
+        captured_beat = None
+        while not self._stopping.wait(self.interval / 2):
+            beat = self._beat
+            if time.monotonic() - beat < self.threshold or beat == captured_beat:
+                continue
+            # Loop has not beaten for longer than the threshold: one capture per stall
+            captured_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._capture(traceback.extract_stack(frame))
+
+    def _capture(self, stack: traceback.StackSummary):
+        site = _call_site(stack)
+        offender = self.offenders.get(site)
+        if offender is None:
+            if len(self.offenders) >= _MAX_OFFENDERS:
+                # Keep the worst ones
+                del self.offenders[min(self.offenders.values(), key=lambda o: o.blocked_seconds).site]
+            offender = self.offenders[site] = Offender(site, "".join(stack.format()))
+        offender.count += 1
+        self.stalls += 1
+        stalls_total.inc()
+        self._stalled = offender
+
+    def percentiles(self) -> dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"count": 0}
+
+        def at(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 1)
+
+        return {
+            "count": len(samples),
+            "p50_ms": at(0.50),
+            "p95_ms": at(0.95),
+            "p99_ms": at(0.99),
+            "max_ms": round(self.max_lag * 1000, 1)
+        }
+
+    def top_offenders(self, limit: int = 10, with_stack: bool = True) -> list:
+        worst = sorted(self.offenders.values(), key=lambda o: o.blocked_seconds, reverse=True)[:limit]
+        return [offender.to_dict(with_stack) for offender in worst]
+
+    def reset(self):
+        self.samples.clear()
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.offenders.clear()
+
+    def stats(self, with_stacks: bool = False) -> dict:
+        return {
+            "running": self.running,
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "lag": self.percentiles(),
+            "stalls": self.stalls,
+            "top_offenders": self.top_offenders(with_stack=with_stacks)
+        }
+
+
+# Global instance
+loop_monitor = LoopMonitor()
@@ -0,0 +1,211 @@
+# Latency spans and Prometheus metrics
+#
+# Every stage of a turn is timed with span() (or observe_stage() when the
+# start and end happen in different callbacks) into one histogram labelled
+# by stage. Gauges read live values (pending debounces, hot sessions,
+# in-flight LLM calls) only when /metrics is scraped.
+#
+# Written without prometheus_client so nothing is added to requirements:
+# the hot path is a perf_counter() pair, a bisect and three increments.
+# render() returns the Prometheus text exposition format (version 0.0.4).
+
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+# Seconds; covers in-process stages (sub-ms) up to slow LLM round-trips
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(names: Tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(name + '="' + value + '"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def samples(self) -> List[str]:
+        return [
+            self.name + _labels(self.labelnames, values) + " " + _number(value)
+            for values, value in sorted(self._values.items())
+        ]
+
+
+class _Series:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self, size: int):
+        self.buckets = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(buckets)
+        self._series: Dict[tuple, _Series] = {}
+
+    def observe(self, value: float, *labelvalues):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = _Series(len(self.bounds) + 1)
+        # Stored per bucket; made cumulative when rendered
+        series.buckets[bisect_left(self.bounds, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def count(self, *labelvalues) -> int:
+        series = self._series.get(labelvalues)
+        return series.count if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        names = self.labelnames + ("le",)
+        for values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, hits in zip(self.bounds + (float("inf"),), series.buckets):
+                cumulative += hits
+                lines.append(self.name + "_bucket" + _labels(names, values + (_number(bound),)) + " " + str(cumulative))
+            labels = _labels(self.labelnames, values)
+            lines.append(self.name + "_sum" + labels + " " + _number(series.sum))
+            lines.append(self.name + "_count" + labels + " " + str(series.count))
+        return lines
+
+
+class Gauge:
+    """Value read from a callback when metrics are rendered."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def samples(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        return [self.name + " " + _number(value)]
+
+
+class Registry:
+    """Metrics exposed on /metrics."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        # Re-registering a name (module reload, tests) replaces the metric
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, help_text, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append("# HELP " + metric.name + " " + metric.help_text)
+            lines.append("# TYPE " + metric.name + " " + metric.kind)
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "agent_stage_duration_seconds",
+    "Time spent in each stage of handling a message.",
+    ("stage",)
+)
+stage_errors = registry.counter(
+    "agent_stage_errors_total",
+    "Stages that ended with an exception.",
+    ("stage",)
+)
+tool_seconds = registry.histogram(
+    "agent_tool_duration_seconds",
+    "Duration of each agent tool call.",
+    ("tool",)
+)
+whatsapp_sends = registry.counter(
+    "whatsapp_sends_total",
+    "WhatsApp send attempts by HTTP status code.",
+    ("status_code",)
+)
+
+
+class span:
+    """
+    Times a block into agent_stage_duration_seconds{stage=...}.
+
+        with span("session_fetch"):
+            session = await get_or_create_session(phone_number)
+    """
+
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        stage_seconds.observe(time.perf_counter() - self.started, self.stage)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            stage_errors.inc(self.stage)
+        return False
+
+
+def observe_stage(stage: str, seconds: float):
+    """Records a stage timed elsewhere (e.g. across two callbacks)."""
+    stage_seconds.observe(seconds, stage)
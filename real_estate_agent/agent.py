@@ -1,7 +1,8 @@
 from google.adk.agents import Agent
 from google.genai import types
-from .tools import create_contact, get_contact, update_contact, list_contacts
-from .callbacks import before_model_callback
+from .tools import crm_async
+from .callbacks import before_model_callback, after_model_callback, on_model_error_callback, before_tool_callback, after_tool_callback
+from .hedging import agent_model
 from pydantic import BaseModel
 
 class AgentResponse(BaseModel):
@@ -10,11 +11,15 @@ class AgentResponse(BaseModel):
 
 root_agent = Agent(
     name="real_estate_agent",
-    model="gemini-2.0-flash",
+    model=agent_model("gemini-2.0-flash"),
     description="real estate agent that qualifies leads using the BANT criteria in a few steps.",
     instruction="",
-    tools =[create_contact, get_contact, update_contact, list_contacts],
+    tools =[crm_async.create_contact, crm_async.get_contact, crm_async.update_contact, crm_async.list_contacts],
     before_model_callback=before_model_callback,
+    after_model_callback=after_model_callback,
+    on_model_error_callback=on_model_error_callback,
+    before_tool_callback=before_tool_callback,
+    after_tool_callback=after_tool_callback,
     output_schema=AgentResponse,
     generate_content_config=types.GenerateContentConfig(temperature=0.7)
 )
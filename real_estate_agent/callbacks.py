@@ -1,18 +1,46 @@
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.models.llm_request import LlmRequest
-from .prompt import agent_prompt_template
-from .config import AGENT_NAME, COMPANY, PERSONALITY, DEFAULTS, BANT_QUESTIONS, CONVERSATION_EXAMPLES
-from .tools.crm import get_contact
-from .tools.location import detect_location
+from google.adk.models.llm_response import LlmResponse
+import os
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from observability import span, observe_stage, tool_seconds, get_logger
+from resilience import circuit_breaker, expired
+from .prompt import prompt_compiler
+from .context_cache import static_context_cache, token_usage
+from .tools.crm_async import get_contact
+from .tools.contact_cache import contact_cache
+from .tools.location import detect_location_cached_async, LOCATION_IP_FALLBACK
+from .tools.phone_country import resolve_country
 
+logger = get_logger("real_estate_agent.callbacks")
 
-def get_contact_context(phone_number: str = None) -> dict:
+# Turn being run (services/interrupts.py): callbacks add its tokens and mark
+# it committed once a tool that writes to the CRM starts
+current_turn = ContextVar("current_turn", default=None)
+
+# Gemini circuit breaker, fed with every model call (tool calls have their own
+# breakers). A call slower than LLM_SLOW_CALL_SECONDS counts as a failure.
+LLM_SLOW_CALL_SECONDS = float(os.getenv("LLM_SLOW_CALL_SECONDS", "20"))
+llm_breaker = circuit_breaker("llm", slow_call_seconds=LLM_SLOW_CALL_SECONDS)
+
+# Breaker attempts of the turn's model calls in flight. Set by
+# services/agent_runner.py, which ends any left over when the turn is
+# cancelled or runs out of time; model calls outside it are not counted.
+model_calls = ContextVar("model_calls", default=None)
+
+# Tools with side effects: a turn that called one is no longer interrupted
+SIDE_EFFECT_TOOLS = frozenset({"create_contact", "update_contact"})
+
+
+async def get_contact_context(phone_number: str = None) -> dict:
     """
     Get contact info from CRM
     Returns context and greeting instruction
     """
     if phone_number:
-        result = get_contact(phone_number)
+        result = await contact_cache.get(phone_number, get_contact)
 
         if result["status"] == "success" and result.get("contact"):
             contact = result["contact"]
@@ -36,9 +64,13 @@ def get_contact_context(phone_number: str = None) -> dict:
     }
 
     
-def get_location_context() -> dict:
-    """Detects user location."""
-    result = detect_location()
+async def get_location_context(phone_number: str = None) -> dict:
+    """Detects user location from the phone number's calling code."""
+    result = resolve_country(phone_number)
+
+    # Optional fallback: server IP lookup (cached once per process)
+    if result["status"] != "success" and LOCATION_IP_FALLBACK:
+        result = await detect_location_cached_async()
     
     if result["status"] == "success":
         return {
@@ -50,36 +82,107 @@ def get_location_context() -> dict:
     }
 
 
-def before_model_callback(callback_context: CallbackContext, llm_request: LlmRequest):
+async def before_model_callback(callback_context: CallbackContext, llm_request: LlmRequest):
     """Runs before sending the request to the LLM. Hidrates the template"""
 
     phone_number = callback_context.state.get("user_id", None)
-    crm_data = get_contact_context(phone_number)
-    location_data = get_location_context()
-
-     # GET BANT questions (or default config)
-    bant = BANT_QUESTIONS or DEFAULTS.get("bant_questions", {})
-
-     # Get conversation examples (or default config)
-    examples = CONVERSATION_EXAMPLES or DEFAULTS.get("conversation_examples", "")
-
-    final_instruction = agent_prompt_template.format(
-        agent_name=AGENT_NAME or DEFAULTS["agent_name"],
-        company=COMPANY or DEFAULTS["company"],
-        personality=PERSONALITY or DEFAULTS["personality"],
-        contact_context=crm_data["contact_context"],
-        greeting_instruction=crm_data["greeting_instruction"],
-        detected_country=location_data["detected_country"],
-        # BANT variables
-        bant_need=bant.get("need", "what they need"),
-        bant_timeline=bant.get("timeline", "when they need it"),
-        bant_budget=bant.get("budget", "their budget"),
-        bant_authority=bant.get("authority", "who decides"),
-        # conversation examples
-        conversation_examples=examples
-    )
+    with span("crm_lookup"):
+        crm_data = await get_contact_context(phone_number)
+    with span("location"):
+        location_data = await get_location_context(phone_number)
+
+    # Static prefix is cached; only the per-turn tail is formatted here
+    with span("prompt_render"):
+        static_prefix = prompt_compiler.static_prefix()
+        turn_tail = prompt_compiler.render_tail(
+            contact_context=crm_data["contact_context"],
+            greeting_instruction=crm_data["greeting_instruction"],
+            detected_country=location_data["detected_country"],
+            conversation_summary=callback_context.state.get("conversation_summary", "")
+        )
+
+    # Bounded LRU: entries of failed LLM calls are never popped, so the oldest go
+    _request_started.pop(callback_context.invocation_id, None)
+    _request_started[callback_context.invocation_id] = time.perf_counter()
+    while len(_request_started) > _REQUEST_STARTED_MAX:
+        _request_started.popitem(last=False)
+
+    # The model call starts here; CircuitOpenError (breaker open) ends the turn
+    calls = model_calls.get()
+    if calls is not None:
+        calls.append(llm_breaker.begin())
+
+    # Opt-in: reference the Gemini context cache instead of resending the prefix
+    if await static_context_cache.apply(llm_request, static_prefix, turn_tail):
+        return None
 
     if llm_request.config:
-        llm_request.config.system_instruction = final_instruction
+        llm_request.config.system_instruction = static_prefix + turn_tail
+
+    return None
+
+
+# invocation_id -> perf_counter() when the LLM request was sent, oldest first
+_request_started: "OrderedDict[str, float]" = OrderedDict()
+_REQUEST_STARTED_MAX = 10000
+
+
+def after_model_callback(callback_context: CallbackContext, llm_response: LlmResponse):
+    """Runs after the LLM answers. Reports prompt token counts and latency."""
+    calls = model_calls.get()
+    if calls and not llm_response.partial:
+        llm_breaker.end(calls.pop(), llm_response.error_code is not None)
+
+    started = _request_started.pop(callback_context.invocation_id, None)
+    usage = llm_response.usage_metadata
+    if started is None or usage is None or llm_response.partial:
+        return None
+
+    prompt_tokens = usage.prompt_token_count or 0
+    cached_tokens = usage.cached_content_token_count or 0
+    latency = time.perf_counter() - started
+    token_usage.record(prompt_tokens, cached_tokens, latency)
+    turn = current_turn.get()
+    if turn is not None:
+        turn.tokens += prompt_tokens + (usage.candidates_token_count or 0)
+    observe_stage("llm_round_trip", latency)
+    logger.info(
+        "llm_request", phone=callback_context.state.get("user_id"), stage="llm_round_trip",
+        duration_ms=round(latency * 1000, 1), prompt_tokens=prompt_tokens, cached_tokens=cached_tokens
+    )
+
+    return None
+
+
+def on_model_error_callback(callback_context: CallbackContext, llm_request: LlmRequest, error: Exception):
+    """Runs when the model call raised. Counts it against the Gemini breaker."""
+    _request_started.pop(callback_context.invocation_id, None)
+    calls = model_calls.get()
+    if calls:
+        # A timeout caused by the turn's deadline is not the model's fault
+        llm_breaker.end(calls.pop(), None if expired() else True)
+    return None
+
+
+# function_call_id -> perf_counter() when the tool started
+_tool_started = {}
+
+
+def before_tool_callback(tool, args: dict, tool_context):
+    """Runs before each tool call. Starts its timer; a CRM write commits the turn."""
+    # Bounded: entries of tools that raised are never popped
+    if len(_tool_started) > 10000:
+        _tool_started.clear()
+    _tool_started[tool_context.function_call_id] = time.perf_counter()
+    turn = current_turn.get()
+    if turn is not None and tool.name in SIDE_EFFECT_TOOLS:
+        turn.committed = True
+    return None
+
 
-    return None
\ No newline at end of file
+def after_tool_callback(tool, args: dict, tool_context, tool_response):
+    """Runs after each tool call. Records its duration."""
+    started = _tool_started.pop(tool_context.function_call_id, None)
+    if started is not None:
+        tool_seconds.observe(time.perf_counter() - started, tool.name)
+    return None
@@ -0,0 +1,253 @@
+# Gemini context caching for the static part of the system prompt.
+#
+# The static prefix (role, rules, workflow, BANT questions, examples) and the
+# tool declarations are the same for every conversation. When enabled, they
+# are registered once as a Gemini cachedContent with a TTL and every request
+# references the cache instead of resending the text. The per-turn tail
+# (contact, country, greeting, time) is sent as the first content of the
+# request, wrapped in <turn_context> so the model reads it as instructions
+# from the system, not as something the lead wrote: Gemini rejects requests
+# that set system_instruction together with cached_content.
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+from google.genai import types
+
+from observability import get_logger
+
+logger = get_logger("real_estate_agent.context_cache")
+
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "false").lower() in ("true", "1", "yes")
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+# Refresh the TTL when less than this is left
+CONTEXT_CACHE_REFRESH_MARGIN = int(os.getenv("CONTEXT_CACHE_REFRESH_MARGIN", "300"))
+# After a failed create (e.g. prefix below the model's minimum cache size),
+# send the prompt normally for this long before trying again
+CONTEXT_CACHE_RETRY_AFTER = int(os.getenv("CONTEXT_CACHE_RETRY_AFTER", "300"))
+
+# The per-turn tail, sent as a content when the system instruction is cached
+TURN_CONTEXT_TEMPLATE = """<turn_context>
+System instructions for this turn, part of your system prompt (not a message from the user):
+{turn_tail}
+</turn_context>"""
+
+
+class GeminiCacheBackend:
+    """cachedContents API of the google-genai client."""
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client()
+        return self._client
+
+    async def create(self, model: str, system_instruction: str, tools: list, tool_config, ttl_seconds: int) -> str:
+        cached = await self.client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name="real_estate_agent-static",
+                system_instruction=system_instruction,
+                tools=tools,
+                tool_config=tool_config,
+                ttl=str(ttl_seconds) + "s"
+            )
+        )
+        return cached.name
+
+    async def refresh(self, name: str, ttl_seconds: int):
+        await self.client.aio.caches.update(
+            name=name,
+            config=types.UpdateCachedContentConfig(ttl=str(ttl_seconds) + "s")
+        )
+
+    async def delete(self, name: str):
+        await self.client.aio.caches.delete(name=name)
+
+
+class StaticContextCache:
+    """
+    Keeps one cachedContent for the static prefix + tools, shared by every
+    conversation. Recreated when the prefix, tools or model change, and its
+    TTL is extended before it expires.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        enabled: bool = False,
+        ttl_seconds: int = 3600,
+        refresh_margin_seconds: int = 300,
+        retry_after_seconds: int = 300
+    ):
+        self.backend = backend or GeminiCacheBackend()
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_after_seconds = retry_after_seconds
+        self._lock = asyncio.Lock()
+        self._name: Optional[str] = None
+        self._key: Optional[str] = None
+        self._expires_at = 0.0
+        self._failed_until = 0.0
+        self.creates = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.cached_requests = 0
+        self.uncached_requests = 0
+
+    def enable(self, backend=None, ttl_seconds: int = None):
+        """Turns caching on (optionally with another backend, e.g. FakeCacheBackend)."""
+        if backend is not None:
+            self.backend = backend
+            self._name = None
+            self._key = None
+            self._lock = asyncio.Lock()
+        if ttl_seconds is not None:
+            self.ttl_seconds = ttl_seconds
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    async def apply(self, llm_request, static_prefix: str, turn_tail: str) -> bool:
+        """
+        Points llm_request at the cached static context and moves turn_tail,
+        wrapped in <turn_context>, into the request contents.
+
+        Returns False (request untouched) if caching is off or unavailable,
+        so the caller sends the full system instruction instead.
+        """
+        if not self.enabled or not llm_request.config:
+            return False
+
+        config = llm_request.config
+        name = await self._get_cache(llm_request.model, static_prefix, config.tools, config.tool_config)
+        if name is None:
+            self.uncached_requests += 1
+            return False
+
+        # The cache already holds the system instruction and tools
+        config.cached_content = name
+        config.system_instruction = None
+        config.tools = None
+        config.tool_config = None
+        turn_context = TURN_CONTEXT_TEMPLATE.format(turn_tail=turn_tail.strip())
+        llm_request.contents.insert(0, types.Content(role="user", parts=[types.Part(text=turn_context)]))
+        self.cached_requests += 1
+        return True
+
+    async def _get_cache(self, model: str, static_prefix: str, tools, tool_config) -> Optional[str]:
+        key = self._fingerprint(model, static_prefix, tools, tool_config)
+
+        async with self._lock:
+            now = time.monotonic()
+            if self._name and self._key == key:
+                if now < self._expires_at - self.refresh_margin_seconds:
+                    return self._name
+                try:
+                    await self.backend.refresh(self._name, self.ttl_seconds)
+                    self.refreshes += 1
+                    self._expires_at = now + self.ttl_seconds
+                    return self._name
+                except Exception as e:
+                    logger.warning("context_cache_refresh_failed", stage="llm", error=str(e))
+
+            if now < self._failed_until:
+                return None
+
+            old_name = self._name
+            try:
+                self._name = await self.backend.create(model, static_prefix, tools, tool_config, self.ttl_seconds)
+            except Exception as e:
+                self.failures += 1
+                self._name = None
+                self._key = None
+                self._failed_until = now + self.retry_after_seconds
+                logger.warning("context_cache_create_failed", stage="llm", error=str(e))
+                return None
+
+            self.creates += 1
+            self._key = key
+            self._expires_at = now + self.ttl_seconds
+
+        # The old cache (prefix or tools changed) is no longer referenced
+        if old_name and old_name != self._name:
+            try:
+                await self.backend.delete(old_name)
+            except Exception:
+                pass
+        return self._name
+
+    @staticmethod
+    def _fingerprint(model: str, static_prefix: str, tools, tool_config) -> str:
+        data = json.dumps({
+            "model": model,
+            "tools": [t.model_dump(mode="json", exclude_none=True) for t in tools or []],
+            "tool_config": tool_config.model_dump(mode="json", exclude_none=True) if tool_config else None
+        }, sort_keys=True)
+        return hashlib.sha256((data + static_prefix).encode("utf-8")).hexdigest()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "cache_name": self._name,
+            "ttl_remaining_seconds": max(0, round(self._expires_at - time.monotonic())) if self._name else 0,
+            "creates": self.creates,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "cached_requests": self.cached_requests,
+            "uncached_requests": self.uncached_requests
+        }
+
+
+class TokenUsageStats:
+    """Prompt token counts and latency per LLM request."""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.total_latency = 0.0
+        self.last = None
+
+    def record(self, prompt_tokens: int, cached_tokens: int, latency: float):
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.total_latency += latency
+        self.last = {
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "latency_ms": round(latency * 1000, 1)
+        }
+
+    def to_dict(self) -> dict:
+        if not self.requests:
+            return {"requests": 0}
+        return {
+            "requests": self.requests,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.requests, 1),
+            "avg_cached_tokens": round(self.cached_tokens / self.requests, 1),
+            "avg_uncached_prompt_tokens": round((self.prompt_tokens - self.cached_tokens) / self.requests, 1),
+            "avg_latency_ms": round(self.total_latency / self.requests * 1000, 1),
+            "last": self.last
+        }
+
+
+# Global instances
+static_context_cache = StaticContextCache(
+    enabled=CONTEXT_CACHE_ENABLED,
+    ttl_seconds=CONTEXT_CACHE_TTL,
+    refresh_margin_seconds=CONTEXT_CACHE_REFRESH_MARGIN,
+    retry_after_seconds=CONTEXT_CACHE_RETRY_AFTER
+)
+token_usage = TokenUsageStats()
@@ -0,0 +1,117 @@
+# Scripted model backend to run the agent offline (tests and benchmarks).
+#
+# Usage:
+#   from real_estate_agent.agent import root_agent
+#   from real_estate_agent.fake_llm import FakeLlm
+#   root_agent.model = FakeLlm(latency=0.5, tool_calls=[{"name": "get_contact", "args": {"contact_id": "569"}}])
+
+import asyncio
+import json
+import random
+from typing import Optional
+
+from google.adk.models._capabilities import LlmCapabilities
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+from pydantic import Field
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)."""
+    return len(text) // 4
+
+
+class FakeCacheBackend:
+    """In-memory stand-in for the Gemini cachedContents API."""
+
+    def __init__(self):
+        self.caches = {}  # name -> cached token count
+        self.created = 0
+        self.refreshed = 0
+        self.deleted = 0
+
+    async def create(self, model: str, system_instruction: str, tools: list, tool_config, ttl_seconds: int) -> str:
+        self.created += 1
+        name = "cachedContents/fake-" + str(self.created)
+        tools_text = json.dumps([t.model_dump(mode="json", exclude_none=True) for t in tools or []])
+        self.caches[name] = estimate_tokens(system_instruction) + estimate_tokens(tools_text)
+        return name
+
+    async def refresh(self, name: str, ttl_seconds: int):
+        if name not in self.caches:
+            raise KeyError(name)
+        self.refreshed += 1
+
+    async def delete(self, name: str):
+        self.deleted += 1
+        self.caches.pop(name, None)
+
+
+class FakeLlm(BaseLlm):
+    """
+    Fake model that answers with a fixed AgentResponse JSON.
+
+    - latency: seconds to wait on every call (to simulate a slow model)
+    - slow_rate, slow_latency: share of calls that take slow_latency instead
+      (occasional slow generations)
+    - tool_calls: function calls returned on the first round-trip of a turn;
+      the reply is returned after the tool responses come back
+    - cache_backend: FakeCacheBackend used to report cached tokens
+    """
+
+    model: str = "fake-llm"
+    latency: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 0.0
+    reply: str = "¡Hola! ¿En qué puedo ayudarte?"
+    should_escalate: bool = False
+    tool_calls: list = Field(default_factory=list)
+    cache_backend: Optional[FakeCacheBackend] = None
+    requests: list = Field(default_factory=list)
+
+    @property
+    def capabilities(self) -> LlmCapabilities:
+        return LlmCapabilities(output_schema_and_tools=True)
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        self.requests.append(llm_request)
+        latency = self.slow_latency if self.slow_rate and random.random() < self.slow_rate else self.latency
+        if latency:
+            await asyncio.sleep(latency)
+
+        last = llm_request.contents[-1] if llm_request.contents else None
+        answering_tool = last is not None and any(part.function_response for part in last.parts or [])
+
+        if self.tool_calls and not answering_tool:
+            parts = [
+                types.Part(function_call=types.FunctionCall(name=call["name"], args=call.get("args", {})))
+                for call in self.tool_calls
+            ]
+        else:
+            reply = json.dumps({"message": self.reply, "should_escalate": self.should_escalate})
+            parts = [types.Part(text=reply)]
+
+        yield LlmResponse(
+            content=types.Content(role="model", parts=parts),
+            usage_metadata=self._usage(llm_request)
+        )
+
+    def _usage(self, llm_request) -> types.GenerateContentResponseUsageMetadata:
+        """Token counts as Gemini would report them (cached tokens included in prompt)."""
+        config = llm_request.config
+        text = str(config.system_instruction or "") if config else ""
+        if config and config.tools:
+            text += json.dumps([t.model_dump(mode="json", exclude_none=True) for t in config.tools])
+        for content in llm_request.contents:
+            text += json.dumps(content.model_dump(mode="json", exclude_none=True))
+
+        cached = 0
+        if config and config.cached_content and self.cache_backend:
+            cached = self.cache_backend.caches.get(config.cached_content, 0)
+
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=estimate_tokens(text) + cached,
+            cached_content_token_count=cached or None,
+            candidates_token_count=20
+        )
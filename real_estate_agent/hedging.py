@@ -0,0 +1,279 @@
+# Hedged model calls: cut the tail latency of slow generations
+#
+# Most model calls return quickly, but an occasional slow generation takes
+# many times longer and dominates the p99 reply latency. HedgedLlm wraps the
+# agent's model: if a call has not returned after the LLM_HEDGE_PERCENTILE
+# latency of recent calls, a second call is sent (to LLM_FALLBACK_MODEL if
+# set, else a duplicate of the first) and the first valid response wins:
+# tool calls, or a reply that parses as an AgentResponse. The other call is
+# cancelled, unless it is the primary call: that one runs on in the
+# background (up to LLM_HEDGE_LOSER_TIMEOUT_SECONDS) so its real latency goes
+# into the percentile and into the latency saved. A call that fails or
+# returns an invalid reply starts the second call right away (fallback) or
+# waits for the one already running.
+#
+# No second call is sent:
+#   - once the turn ran a tool that writes to the CRM (SIDE_EFFECT_TOOLS),
+#   - for latency hedges beyond LLM_HEDGE_MAX_RATE of calls, so a slow model
+#     does not get twice the load,
+#   - for streaming calls.
+# Off by default (LLM_HEDGE_ENABLED): hedges cost extra tokens.
+
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Optional
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.registry import LLMRegistry
+from pydantic import Field
+
+from observability import registry, get_logger
+from .callbacks import current_turn, SIDE_EFFECT_TOOLS
+
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("true", "1", "yes")
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "90"))
+# Hedge delay until LLM_HEDGE_MIN_SAMPLES latencies were seen, and its floor
+LLM_HEDGE_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "4"))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "1"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.1"))
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+# A primary call that lost to its hedge keeps running this long, only to be timed
+LLM_HEDGE_LOSER_TIMEOUT_SECONDS = float(os.getenv("LLM_HEDGE_LOSER_TIMEOUT_SECONDS", "60"))
+
+logger = get_logger("real_estate_agent.hedging")
+
+hedges_total = registry.counter(
+    "llm_hedges_total",
+    "Model calls that sent a second (hedge or fallback) call, by which call won.",
+    ("winner",)
+)
+latency_saved_total = registry.counter(
+    "llm_hedge_latency_saved_seconds_total",
+    "Seconds of model latency saved by hedge calls that won."
+)
+
+
+class HedgeStats:
+    """Latency of recent model calls (for the hedge delay) and hedge counters."""
+
+    def __init__(self, window: int = LLM_HEDGE_WINDOW):
+        self.latencies = deque(maxlen=window)  # seconds per primary call
+        self.calls = 0
+        self.hedged = 0
+        self.fallbacks = 0
+        self.hedge_wins = 0
+        self.suppressed_side_effects = 0
+        self.suppressed_budget = 0
+        self.latency_saved = 0.0
+        self._losers = set()
+
+    def hedge_delay(self, percentile: float, default: float, floor: float) -> float:
+        if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return default
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return max(floor, ordered[index])
+
+    def time_loser(self, primary: asyncio.Task, started: float, won_at: float, timeout: float):
+        """Lets a primary call that lost to its hedge finish, then records its latency."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.call_later(timeout, primary.cancel)
+        self._losers.add(primary)
+
+        def finished(task: asyncio.Task):
+            deadline.cancel()
+            self._losers.discard(task)
+            latency = loop.time() - started
+            if task.cancelled():
+                if latency < timeout:
+                    return  # cancelled on shutdown
+                latency = timeout  # still running at the cap: a lower bound
+            elif task.exception() is not None:
+                return
+            else:
+                self.latencies.append(latency)
+            saved = max(0.0, latency - won_at)
+            self.latency_saved += saved
+            latency_saved_total.inc(amount=saved)
+
+        primary.add_done_callback(finished)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.calls, 3) if self.calls else 0.0,
+            "fallbacks": self.fallbacks,
+            "hedge_wins": self.hedge_wins,
+            "suppressed_side_effects": self.suppressed_side_effects,
+            "suppressed_budget": self.suppressed_budget,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+            "losers_running": len(self._losers),
+            "hedge_delay_seconds": round(self.hedge_delay(LLM_HEDGE_PERCENTILE, LLM_HEDGE_DELAY_SECONDS, LLM_HEDGE_MIN_DELAY_SECONDS), 3)
+        }
+
+
+# Global instance
+hedge_stats = HedgeStats()
+
+
+def valid_response(responses: list) -> bool:
+    """True for tool calls or a reply that parses as an AgentResponse."""
+    if not responses:
+        return False
+    last = responses[-1]
+    if last.error_code or not last.content or not last.content.parts:
+        return False
+    parts = last.content.parts
+    if any(part.function_call for part in parts):
+        return True
+    text = "".join(part.text or "" for part in parts if not part.thought)
+    try:
+        data = json.loads(text.replace("```json", "").replace("```", "").strip())
+    except json.JSONDecodeError:
+        return False
+    return isinstance(data, dict) and isinstance(data.get("message"), str)
+
+
+def wrote_to_crm(llm_request) -> bool:
+    """True once the current turn ran a tool with side effects."""
+    turn = current_turn.get()
+    if turn is not None and turn.committed:
+        return True
+    # Tool results since the user's message (works outside message_handler too)
+    for content in reversed(llm_request.contents):
+        parts = content.parts or []
+        if any(part.function_response and part.function_response.name in SIDE_EFFECT_TOOLS for part in parts):
+            return True
+        if content.role == "user" and any(part.text for part in parts):
+            return False
+    return False
+
+
+async def _collect(llm: BaseLlm, llm_request) -> list:
+    return [response async for response in llm.generate_content_async(llm_request, stream=False)]
+
+
+class HedgedLlm(BaseLlm):
+    """
+    Model wrapper that hedges slow calls (see the module comment).
+
+        root_agent.model = HedgedLlm(primary=FakeLlm(latency=5), fallback=FakeLlm())
+    """
+
+    model: str = ""
+    primary: BaseLlm
+    fallback: Optional[BaseLlm] = None
+    percentile: float = LLM_HEDGE_PERCENTILE
+    default_delay: float = LLM_HEDGE_DELAY_SECONDS
+    min_delay: float = LLM_HEDGE_MIN_DELAY_SECONDS
+    max_rate: float = LLM_HEDGE_MAX_RATE
+    stats: HedgeStats = Field(default_factory=lambda: hedge_stats)
+
+    def model_post_init(self, __context):
+        # ADK sends llm_request.model = this model's name
+        if not self.model:
+            self.model = self.primary.model
+
+    @property
+    def capabilities(self):
+        return self.primary.capabilities
+
+    def _second_call(self, llm_request) -> asyncio.Task:
+        """Starts the hedge: on the fallback model, or a duplicate on the primary."""
+        request = llm_request.model_copy(deep=True)
+        llm = self.primary
+        # A Gemini context cache belongs to the primary model
+        if self.fallback is not None and not (request.config and request.config.cached_content):
+            llm = self.fallback
+            request.model = self.fallback.model
+        return asyncio.create_task(_collect(llm, request))
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        if stream:
+            async for response in self.primary.generate_content_async(llm_request, stream=True):
+                yield response
+            return
+
+        stats = self.stats
+        stats.calls += 1
+        allowed = not wrote_to_crm(llm_request)
+        if not allowed:
+            stats.suppressed_side_effects += 1
+        delay = stats.hedge_delay(self.percentile, self.default_delay, self.min_delay)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        primary = asyncio.create_task(_collect(self.primary, llm_request))
+        second = None
+        pending = {primary}
+        winner = None
+        outcomes = {}  # task -> responses, or the exception it raised
+        try:
+            while pending:
+                timeout = None
+                if second is None and allowed:
+                    timeout = max(0.0, started + delay - loop.time())
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Primary is slower than the hedge delay
+                    if stats.hedged >= self.max_rate * stats.calls:
+                        stats.suppressed_budget += 1
+                        allowed = False
+                        continue
+                    second = self._second_call(llm_request)
+                    stats.hedged += 1
+                    pending.add(second)
+                    continue
+
+                for task in done:
+                    outcomes[task] = task.exception() or task.result()
+                    if task is primary and not isinstance(outcomes[task], BaseException):
+                        stats.latencies.append(loop.time() - started)
+                    if winner is None and not isinstance(outcomes[task], BaseException) and valid_response(outcomes[task]):
+                        winner = task
+                if winner is not None:
+                    break
+
+                if second is None and allowed:
+                    # Primary failed or replied with something unusable: fall back now
+                    second = self._second_call(llm_request)
+                    stats.fallbacks += 1
+                    pending.add(second)
+        finally:
+            if winner is not None and winner is second and primary in pending:
+                pending.discard(primary)
+                stats.time_loser(primary, started, loop.time() - started, LLM_HEDGE_LOSER_TIMEOUT_SECONDS)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        elapsed = loop.time() - started
+        if second is not None:
+            hedges_total.inc("hedge" if winner is second else "primary")
+        if winner is second and second is not None:
+            stats.hedge_wins += 1
+            logger.info("llm_hedge_won", stage="llm_round_trip", duration_ms=round(elapsed * 1000, 1))
+
+        if winner is None:
+            # Nothing valid: the primary's outcome, as without hedging
+            winner = primary
+        outcome = outcomes[winner]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        for response in outcome:
+            yield response
+
+
+def agent_model(model: str):
+    """The agent's model: the model name, or HedgedLlm around it when LLM_HEDGE_ENABLED."""
+    if not LLM_HEDGE_ENABLED:
+        return model
+    fallback = LLMRegistry.new_llm(LLM_FALLBACK_MODEL) if LLM_FALLBACK_MODEL else None
+    return HedgedLlm(primary=LLMRegistry.new_llm(model), fallback=fallback)
@@ -1,25 +1,23 @@
+import copy
 from datetime import datetime
+from . import config
 
-current_time = datetime.now().strftime("%d/%m/%Y %H:%M")
+# The system prompt is split in two:
+# - static_prompt_template: depends only on config.py. Rendered once (and
+#   again only if the config changes), so it is byte-identical on every turn
+#   and provider-side prefix caching can hit.
+# - turn_prompt_template: small tail with the per-turn fields (contact,
+#   country, greeting, current time), appended after the static prefix.
 
-agent_prompt_template = """
+static_prompt_template = """
 <role>
-You are {agent_name}, a real estate advisor for {company}. 
+You are {agent_name}, a real estate advisor for {company}.
 Personality: {personality}
 Your tone must sound human. Never reveal you are an AI, bot, or assistant.
 </role>
 
-<contact_context>
-{contact_context}
-</contact_context>
-
-<location_context>
-Detected country: {detected_country}
-YOU MUST respond in the language appropriate for {detected_country}. Use "tú" in Spanish (never "usted"). Only use "vos" if detected country is Argentina.
-</location_context>
-
 <critical_rules>
-1. Respond in the language of {detected_country}. Use "tú" in Spanish. Only use "vos" if Argentina.
+1. Respond in the language of the detected country in <location_context>. Use "tú" in Spanish. Only use "vos" if Argentina.
 2. NEVER invent information. If you don't have it, ask.
 3. If the user asks a question, ANSWER first before continuing the BANT flow.
 4. NEVER say you "detected" anything. Act natural.
@@ -27,7 +25,7 @@ YOU MUST respond in the language appropriate for {detected_country}. Use "tú" i
 </critical_rules>
 
 <workflow>
-1. GREETING: {greeting_instruction}
+1. GREETING: Follow the greeting instruction in <greeting>.
 2. NEED: Only ask what you do NOT know about: {bant_need}. If they already provided any of this info, do NOT ask again.
 3. TIMELINE + BUDGET: Only ask what you do NOT know about: {bant_timeline} and {bant_budget}.
 4. AUTHORITY (if relevant): Understand {bant_authority}.
@@ -65,5 +63,126 @@ Set should_escalate to TRUE when:
 
 Respond ONLY with the JSON object. No markdown, no backticks, no extra text.
 </output_format>
+"""
+
+turn_prompt_template = """
+<contact_context>
+{contact_context}
+</contact_context>
+
+<location_context>
+Detected country: {detected_country}
+YOU MUST respond in the language appropriate for {detected_country}. Use "tú" in Spanish (never "usted"). Only use "vos" if detected country is Argentina.
+</location_context>
+
+<greeting>
+{greeting_instruction}
+</greeting>
+{summary_block}
+Current date and time: {current_time}"""
+
+# Older turns folded by history compaction (services/compaction.py)
+summary_prompt_template = """
+<conversation_summary>
+Earlier messages of this conversation (already answered, do not ask again):
+{conversation_summary}
+</conversation_summary>
+"""
+
+
+def _config_snapshot() -> tuple:
+    """Values from config.py the static prefix depends on."""
+    return (
+        config.AGENT_NAME,
+        config.COMPANY,
+        config.PERSONALITY,
+        config.BANT_QUESTIONS,
+        config.CONVERSATION_EXAMPLES,
+        config.DEFAULTS
+    )
+
+
+class PromptCompiler:
+    """
+    Renders the system prompt.
+    The static prefix is compiled once and cached until config.py changes;
+    each turn only formats the small turn_prompt_template.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._static_prefix = None
+        self.compile_count = 0
+
+    def static_prefix(self) -> str:
+        """Returns the config-dependent part of the prompt, compiling it if needed."""
+        snapshot = _config_snapshot()
+        if self._static_prefix is None or snapshot != self._snapshot:
+            self._static_prefix = self._compile()
+            # Copy, so in-place edits of the config dicts are noticed too
+            self._snapshot = copy.deepcopy(snapshot)
+        return self._static_prefix
+
+    def _compile(self) -> str:
+        self.compile_count += 1
+        defaults = config.DEFAULTS
+        agent_name = config.AGENT_NAME or defaults["agent_name"]
+        company = config.COMPANY or defaults["company"]
+
+        # GET BANT questions (or default config)
+        bant = config.BANT_QUESTIONS or defaults.get("bant_questions", {})
+
+        # Get conversation examples (or default config)
+        examples = config.CONVERSATION_EXAMPLES or defaults.get("conversation_examples", "")
+        examples = examples.replace("{agent_name}", agent_name).replace("{company}", company)
+
+        return static_prompt_template.format(
+            agent_name=agent_name,
+            company=company,
+            personality=config.PERSONALITY or defaults["personality"],
+            # BANT variables
+            bant_need=bant.get("need", "what they need"),
+            bant_timeline=bant.get("timeline", "when they need it"),
+            bant_budget=bant.get("budget", "their budget"),
+            bant_authority=bant.get("authority", "who decides"),
+            # conversation examples
+            conversation_examples=examples
+        )
+
+    def render(
+        self,
+        contact_context: str,
+        greeting_instruction: str,
+        detected_country: str,
+        conversation_summary: str = "",
+        now: datetime = None
+    ) -> str:
+        """Returns the full system instruction: static prefix + turn tail."""
+        return self.static_prefix() + self.render_tail(
+            contact_context, greeting_instruction, detected_country, conversation_summary, now
+        )
+
+    def render_tail(
+        self,
+        contact_context: str,
+        greeting_instruction: str,
+        detected_country: str,
+        conversation_summary: str = "",
+        now: datetime = None
+    ) -> str:
+        """Returns only the per-turn part of the prompt."""
+        current_time = (now or datetime.now()).strftime("%d/%m/%Y %H:%M")
+        summary_block = ""
+        if conversation_summary:
+            summary_block = summary_prompt_template.format(conversation_summary=conversation_summary)
+        return turn_prompt_template.format(
+            contact_context=contact_context,
+            detected_country=detected_country,
+            greeting_instruction=greeting_instruction,
+            summary_block=summary_block,
+            current_time=current_time
+        )
+
 
-Current date and time: """ + current_time
\ No newline at end of file
+# Global compiler instance
+prompt_compiler = PromptCompiler()
@@ -1,3 +1,6 @@
 from .location import detect_location
+from .phone_country import resolve_country
 
-from .crm import create_contact, get_contact, update_contact, list_contacts
\ No newline at end of file
+from .crm import create_contact, get_contact, update_contact, list_contacts
+
+from . import crm_async
\ No newline at end of file
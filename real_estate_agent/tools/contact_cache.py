@@ -0,0 +1,148 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict
+
+# In-process cache for CRM contact lookups.
+# before_model_callback runs on every LLM request (including each round-trip
+# after a tool call), so the same phone number is looked up several times
+# per user turn. This cache keeps the result for a short time.
+
+CONTACT_CACHE_TTL = float(os.getenv("CONTACT_CACHE_TTL", "300"))
+CONTACT_CACHE_NEGATIVE_TTL = float(os.getenv("CONTACT_CACHE_NEGATIVE_TTL", "30"))
+CONTACT_CACHE_MAX_SIZE = int(os.getenv("CONTACT_CACHE_MAX_SIZE", "10000"))
+
+
+def normalize_phone(phone_number: str) -> str:
+    """Normalizes a phone number to digits only ("+56 9 1234" -> "5691234")."""
+    return "".join(ch for ch in str(phone_number) if ch.isdigit())
+
+
+class ContactCache:
+    """
+    Bounded TTL cache for get_contact results, keyed by normalized phone.
+
+    - "success" results are kept for ttl_seconds
+    - "not_found" results are kept for negative_ttl_seconds
+    - "error" results are never cached
+    - Concurrent misses for the same phone share a single CRM call
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 300.0,
+        negative_ttl_seconds: float = 30.0,
+        max_size: int = 10000
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, result)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def get(self, phone_number: str, loader: Callable[[str], Awaitable[dict]]) -> dict:
+        """
+        Returns the cached result for phone_number, or calls loader(phone_number)
+        on a miss and caches what it returns.
+        """
+        key = normalize_phone(phone_number)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                if result["status"] == "success":
+                    self.hits += 1
+                else:
+                    self.negative_hits += 1
+                return result
+            del self._entries[key]
+
+        # Another request is already loading this phone: wait for it
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Only re-raise if we were cancelled, not the loading request
+                if not inflight.cancelled():
+                    raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await loader(phone_number)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved if nobody else was waiting
+            future.exception()
+            raise
+        else:
+            # Skip caching if the entry was invalidated while loading
+            if self._inflight.get(key) is future:
+                self.set(phone_number, result)
+            future.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def set(self, phone_number: str, result: dict):
+        """Stores a get_contact result. Errors are not cached."""
+        status = result.get("status")
+        if status == "success":
+            ttl = self.ttl_seconds
+        elif status == "not_found":
+            ttl = self.negative_ttl_seconds
+        else:
+            return
+
+        key = normalize_phone(phone_number)
+        self._entries[key] = (time.monotonic() + ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, phone_number: str):
+        """Removes the cached entry for phone_number (after create/update)."""
+        if phone_number:
+            key = normalize_phone(phone_number)
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters, to check how many CRM calls the cache saves."""
+        lookups = self.hits + self.negative_hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": round((lookups - self.misses) / lookups, 3) if lookups else 0.0
+        }
+
+
+# Global cache instance
+contact_cache = ContactCache(
+    ttl_seconds=CONTACT_CACHE_TTL,
+    negative_ttl_seconds=CONTACT_CACHE_NEGATIVE_TTL,
+    max_size=CONTACT_CACHE_MAX_SIZE
+)
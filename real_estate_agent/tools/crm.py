@@ -1,5 +1,19 @@
 import requests
 import os
+from resilience import timeout_for
+from .crm_async import crm_breaker
+
+CRM_TIMEOUT = 10
+
+
+def _request(method: str, url: str, **kwargs) -> requests.Response:
+    """One CRM call, through the shared "crm" breaker and within the turn's deadline."""
+    with crm_breaker.attempt() as attempt:
+        response = requests.request(method, url, timeout=timeout_for(CRM_TIMEOUT), **kwargs)
+        if response.status_code >= 500:
+            attempt.fail()
+    return response
+
 
 def create_contact(name: str, email: str, phone_number: str) -> dict:
     """Creates a new contact in the CRM."""
@@ -17,7 +31,7 @@ def create_contact(name: str, email: str, phone_number: str) -> dict:
             "phoneNumber": phone_number
         }
         
-        response = requests.post(url, headers=headers, json=body, timeout=10)
+        response = _request("POST", url, headers=headers, json=body)
         data = response.json()
         
         return {
@@ -42,7 +56,7 @@ def get_contact(contact_id: str) -> dict:
             "Content-Type": "application/json"
         }
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = _request("GET", url, headers=headers)
         data = response.json()
         
         # If the CRM returns an error disguised as a success
@@ -81,7 +95,7 @@ def update_contact(contact_id: str, name: str = None, email: str = None, phone_n
         if phone_number:
             body["phoneNumber"] = phone_number
         
-        response = requests.put(url, headers=headers, json=body, timeout=10)
+        response = _request("PUT", url, headers=headers, json=body)
         data = response.json()
         
         return {
@@ -109,7 +123,7 @@ def list_contacts(search_term: str = None, page: int = 1, limit: int = 10) -> di
         if search_term:
             body["searchTerm"] = search_term
         
-        response = requests.post(url, headers=headers, json=body, timeout=10)
+        response = _request("POST", url, headers=headers, json=body)
         data = response.json()
         
         return {
@@ -133,7 +147,7 @@ def delete_contact(contact_id: str) -> dict:
             "Content-Type": "application/json"
         }
 
-        response = requests.delete(url, headers=headers, timeout=10)
+        response = _request("DELETE", url, headers=headers)
         data = response.json()
 
         return {
@@ -0,0 +1,247 @@
+import asyncio
+import os
+import weakref
+import httpx
+from resilience import circuit_breaker, timeout_for
+from .contact_cache import contact_cache
+
+# Async versions of the CRM tools in crm.py.
+# They share one keep-alive connection pool instead of opening a new
+# connection per request, so a slow CRM call never blocks the event loop.
+# Every call goes through the "crm" circuit breaker and is bounded by the
+# turn's deadline; while the CRM is down the tools return their error dict
+# right away (get_contact_context then treats the user as a new contact).
+
+CRM_API_URL = "https://api.spicytool.net/spicyapi/v1"
+
+CRM_TIMEOUT = float(os.getenv("CRM_TIMEOUT", "10"))
+CRM_MAX_CONNECTIONS = int(os.getenv("CRM_MAX_CONNECTIONS", "20"))
+CRM_MAX_KEEPALIVE = int(os.getenv("CRM_MAX_KEEPALIVE", "10"))
+# A CRM call slower than this counts as a failure for the breaker
+CRM_SLOW_CALL_SECONDS = float(os.getenv("CRM_SLOW_CALL_SECONDS", "3"))
+
+crm_breaker = circuit_breaker("crm", slow_call_seconds=CRM_SLOW_CALL_SECONDS)
+
+_client = None
+_client_loop = None
+
+# Clients created lazily outside the webhook, one per event loop (main.py's
+# sync runner starts a new loop per turn); each is closed when its loop shuts
+# down. loop -> (client, closer)
+_loop_clients = weakref.WeakKeyDictionary()
+
+
+def _new_client(transport: httpx.AsyncBaseTransport = None) -> httpx.AsyncClient:
+    """Creates the pooled client used by every CRM call."""
+    return httpx.AsyncClient(
+        base_url=CRM_API_URL,
+        timeout=CRM_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=CRM_MAX_CONNECTIONS,
+            max_keepalive_connections=CRM_MAX_KEEPALIVE
+        ),
+        transport=transport
+    )
+
+
+async def _close_on_loop_shutdown(client: httpx.AsyncClient):
+    """
+    Async generator left suspended at its yield: asyncio.run() closes the
+    loop's pending async generators before the loop (shutdown_asyncgens),
+    which runs the finally block while the loop can still close sockets.
+    """
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+async def open_client(transport: httpx.AsyncBaseTransport = None):
+    """
+    Opens the shared CRM client. Called on webhook startup.
+
+    Args:
+        transport: httpx transport to use instead of the network (tests)
+    """
+    global _client, _client_loop
+    if _client is None or _client.is_closed:
+        _client = _new_client(transport)
+        _client_loop = asyncio.get_running_loop()
+    return _client
+
+
+async def close_client():
+    """Closes the shared CRM client. Called on webhook shutdown."""
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+async def get_client() -> httpx.AsyncClient:
+    """
+    Returns the shared CRM client.
+    Outside the webhook (e.g. main.py) a client is created lazily for the
+    running event loop, and closed when that loop shuts down.
+    """
+    loop = asyncio.get_running_loop()
+    if _client is not None and not _client.is_closed and _client_loop is loop:
+        return _client
+
+    entry = _loop_clients.get(loop)
+    if entry is None or entry[0].is_closed:
+        client = _new_client()
+        closer = _close_on_loop_shutdown(client)
+        await closer.asend(None)
+        # The loop only holds a weak reference to the generator
+        entry = _loop_clients[loop] = (client, closer)
+    return entry[0]
+
+
+def _headers() -> dict:
+    headers = {"Content-Type": "application/json"}
+    token = os.getenv("SPICY_API_TOKEN")
+    if token:
+        headers["Authorization"] = token
+    return headers
+
+
+async def _request(method: str, path: str, **kwargs) -> httpx.Response:
+    """One CRM call, through the breaker and within the turn's deadline."""
+    with crm_breaker.attempt() as attempt:
+        client = await get_client()
+        response = await client.request(
+            method, path, headers=_headers(), timeout=timeout_for(CRM_TIMEOUT), **kwargs
+        )
+        if response.status_code >= 500:
+            attempt.fail()
+    return response
+
+
+async def create_contact(name: str, email: str, phone_number: str) -> dict:
+    """Creates a new contact in the CRM."""
+    try:
+        body = {
+            "name": name,
+            "email": email,
+            "phoneNumber": phone_number
+        }
+
+        response = await _request("POST", "/contact", json=body)
+        data = response.json()
+
+        # The next lookup must see the new contact, not a cached "not_found"
+        contact_cache.invalidate(phone_number)
+
+        return {
+            "status": "success",
+            "contact": data
+        }
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "error_message": "Could not create contact: " + str(e)
+        }
+
+
+async def get_contact(contact_id: str) -> dict:
+    """Gets a contact by ID from the CRM."""
+    try:
+        response = await _request("GET", "/contact/" + contact_id)
+        data = response.json()
+
+        # If the CRM returns an error disguised as a success
+        if data.get("message") or not data.get("name"):
+            return {
+                "status": "not_found",
+                "contact": None
+            }
+
+        return {
+            "status": "success",
+            "contact": data
+        }
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "error_message": "Could not get contact: " + str(e)
+        }
+
+
+async def update_contact(contact_id: str, name: str = None, email: str = None, phone_number: str = None) -> dict:
+    """Updates a contact in the CRM."""
+    try:
+        body = {}
+        if name:
+            body["name"] = name
+        if email:
+            body["email"] = email
+        if phone_number:
+            body["phoneNumber"] = phone_number
+
+        response = await _request("PUT", "/contact/" + contact_id, json=body)
+        data = response.json()
+
+        contact_cache.invalidate(contact_id)
+        contact_cache.invalidate(phone_number)
+
+        return {
+            "status": "success",
+            "contact": data
+        }
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "error_message": "Could not update contact: " + str(e)
+        }
+
+
+async def list_contacts(search_term: str = None, page: int = 1, limit: int = 10) -> dict:
+    """Lists contacts from the CRM."""
+    try:
+        body = {}
+        if search_term:
+            body["searchTerm"] = search_term
+
+        response = await _request(
+            "POST",
+            "/contacts",
+            params={"page": page, "limit": limit},
+            json=body
+        )
+        data = response.json()
+
+        return {
+            "status": "success",
+            "contacts": data
+        }
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "error_message": "Could not list contacts: " + str(e)
+        }
+
+
+async def delete_contact(contact_id: str) -> dict:
+    """Delete a contact from the CRM."""
+    try:
+        response = await _request("DELETE", "/contact/" + contact_id)
+        data = response.json()
+
+        contact_cache.invalidate(contact_id)
+
+        return {
+            "status": "success",
+            "message": data
+        }
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "error_message": "Could not delete contact: " + str(e)
+        }
@@ -1,9 +1,34 @@
+import asyncio
+import contextvars
+import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from resilience import circuit_breaker, timeout_for
+
+# The IP lookup geolocates the server, not the user, so it is only used as an
+# opt-in fallback when the phone number gives no country.
+LOCATION_IP_FALLBACK = os.getenv("LOCATION_IP_FALLBACK", "false").lower() in ("true", "1", "yes")
+
+_cached_location = None
+
+# A lookup slower than this counts as a failure; while the breaker is open
+# the lookup fails at once and callers fall back to "Unknown"
+LOCATION_TIMEOUT = 5
+LOCATION_SLOW_CALL_SECONDS = float(os.getenv("LOCATION_SLOW_CALL_SECONDS", "2"))
+
+location_breaker = circuit_breaker("location", slow_call_seconds=LOCATION_SLOW_CALL_SECONDS)
+
+# detect_location blocks (requests); the async variant runs it in this small pool
+_lookup_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="location-lookup")
+
 
 def detect_location() -> dict:
     """Detect the user's country based on their IP."""
     try:
-        response = requests.get("https://ipapi.co/json/", timeout=5)
+        with location_breaker.attempt() as attempt:
+            response = requests.get("https://ipapi.co/json/", timeout=timeout_for(LOCATION_TIMEOUT))
+            if response.status_code >= 500 or response.status_code == 429:
+                attempt.fail()
         data = response.json()
         
         return {
@@ -14,4 +39,27 @@ def detect_location() -> dict:
         return {
             "status": "error",
             "error_message": "Could not detect location: " + str(e)
-        }
\ No newline at end of file
+        }
+
+
+def detect_location_cached() -> dict:
+    """
+    Same as detect_location, but the IP lookup is done once per process.
+    Errors are not cached, so a failed lookup is retried next time.
+    """
+    global _cached_location
+    if _cached_location is None:
+        result = detect_location()
+        if result["status"] != "success":
+            return result
+        _cached_location = result
+    return _cached_location
+
+
+async def detect_location_cached_async() -> dict:
+    """detect_location_cached for async callers; the lookup runs off the event loop."""
+    if _cached_location is not None:
+        return _cached_location
+    # Run in a copy of the context so the lookup sees the turn's deadline
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_lookup_executor, context.run, detect_location_cached)
@@ -0,0 +1,159 @@
+# Offline country detection from the WhatsApp phone number.
+# Maps E.164 calling codes to countries with a longest-prefix match over a
+# trie. No I/O: a lookup walks at most len(phone) digits.
+
+# Calling code -> country name (same names ipapi.co returns in "country_name")
+CALLING_CODES = {
+    # North American Numbering Plan (+1). "1" alone defaults to the US,
+    # longer area-code prefixes select the other NANP countries.
+    "1": "United States",
+    "1204": "Canada", "1226": "Canada", "1236": "Canada", "1249": "Canada",
+    "1250": "Canada", "1263": "Canada", "1289": "Canada", "1306": "Canada",
+    "1343": "Canada", "1354": "Canada", "1365": "Canada", "1367": "Canada",
+    "1368": "Canada", "1382": "Canada", "1403": "Canada", "1416": "Canada",
+    "1418": "Canada", "1428": "Canada", "1431": "Canada", "1437": "Canada",
+    "1438": "Canada", "1450": "Canada", "1468": "Canada", "1474": "Canada",
+    "1506": "Canada", "1514": "Canada", "1519": "Canada", "1548": "Canada",
+    "1579": "Canada", "1581": "Canada", "1584": "Canada", "1587": "Canada",
+    "1604": "Canada", "1613": "Canada", "1639": "Canada", "1647": "Canada",
+    "1672": "Canada", "1683": "Canada", "1705": "Canada", "1709": "Canada",
+    "1742": "Canada", "1753": "Canada", "1778": "Canada", "1780": "Canada",
+    "1782": "Canada", "1807": "Canada", "1819": "Canada", "1825": "Canada",
+    "1867": "Canada", "1873": "Canada", "1879": "Canada", "1902": "Canada",
+    "1905": "Canada",
+    "1242": "Bahamas", "1246": "Barbados", "1264": "Anguilla",
+    "1268": "Antigua and Barbuda", "1284": "British Virgin Islands",
+    "1340": "U.S. Virgin Islands", "1345": "Cayman Islands", "1441": "Bermuda",
+    "1473": "Grenada", "1649": "Turks and Caicos Islands", "1658": "Jamaica",
+    "1664": "Montserrat", "1670": "Northern Mariana Islands", "1671": "Guam",
+    "1684": "American Samoa", "1721": "Sint Maarten", "1758": "Saint Lucia",
+    "1767": "Dominica", "1784": "Saint Vincent and the Grenadines",
+    "1787": "Puerto Rico", "1939": "Puerto Rico",
+    "1809": "Dominican Republic", "1829": "Dominican Republic", "1849": "Dominican Republic",
+    "1868": "Trinidad and Tobago", "1869": "Saint Kitts and Nevis", "1876": "Jamaica",
+
+    # Zone 2: Africa
+    "20": "Egypt", "211": "South Sudan", "212": "Morocco", "213": "Algeria",
+    "216": "Tunisia", "218": "Libya", "220": "Gambia", "221": "Senegal",
+    "222": "Mauritania", "223": "Mali", "224": "Guinea", "225": "Ivory Coast",
+    "226": "Burkina Faso", "227": "Niger", "228": "Togo", "229": "Benin",
+    "230": "Mauritius", "231": "Liberia", "232": "Sierra Leone", "233": "Ghana",
+    "234": "Nigeria", "235": "Chad", "236": "Central African Republic",
+    "237": "Cameroon", "238": "Cape Verde", "239": "Sao Tome and Principe",
+    "240": "Equatorial Guinea", "241": "Gabon", "242": "Republic of the Congo",
+    "243": "DR Congo", "244": "Angola", "245": "Guinea-Bissau",
+    "246": "British Indian Ocean Territory", "248": "Seychelles", "249": "Sudan",
+    "250": "Rwanda", "251": "Ethiopia", "252": "Somalia", "253": "Djibouti",
+    "254": "Kenya", "255": "Tanzania", "256": "Uganda", "257": "Burundi",
+    "258": "Mozambique", "260": "Zambia", "261": "Madagascar", "262": "Reunion",
+    "263": "Zimbabwe", "264": "Namibia", "265": "Malawi", "266": "Lesotho",
+    "267": "Botswana", "268": "Eswatini", "269": "Comoros", "27": "South Africa",
+    "290": "Saint Helena", "291": "Eritrea", "297": "Aruba", "298": "Faroe Islands",
+    "299": "Greenland",
+
+    # Zones 3-4: Europe
+    "30": "Greece", "31": "Netherlands", "32": "Belgium", "33": "France",
+    "34": "Spain", "350": "Gibraltar", "351": "Portugal", "352": "Luxembourg",
+    "353": "Ireland", "354": "Iceland", "355": "Albania", "356": "Malta",
+    "357": "Cyprus", "358": "Finland", "359": "Bulgaria", "36": "Hungary",
+    "370": "Lithuania", "371": "Latvia", "372": "Estonia", "373": "Moldova",
+    "374": "Armenia", "375": "Belarus", "376": "Andorra", "377": "Monaco",
+    "378": "San Marino", "379": "Vatican City", "380": "Ukraine", "381": "Serbia",
+    "382": "Montenegro", "383": "Kosovo", "385": "Croatia", "386": "Slovenia",
+    "387": "Bosnia and Herzegovina", "389": "North Macedonia", "39": "Italy",
+    "40": "Romania", "41": "Switzerland", "420": "Czechia", "421": "Slovakia",
+    "423": "Liechtenstein", "43": "Austria", "44": "United Kingdom",
+    "45": "Denmark", "46": "Sweden", "47": "Norway", "48": "Poland", "49": "Germany",
+
+    # Zone 5: Latin America
+    "500": "Falkland Islands", "501": "Belize", "502": "Guatemala",
+    "503": "El Salvador", "504": "Honduras", "505": "Nicaragua",
+    "506": "Costa Rica", "507": "Panama", "508": "Saint Pierre and Miquelon",
+    "509": "Haiti", "51": "Peru", "52": "Mexico", "53": "Cuba", "54": "Argentina",
+    "55": "Brazil", "56": "Chile", "57": "Colombia", "58": "Venezuela",
+    "590": "Guadeloupe", "591": "Bolivia", "592": "Guyana", "593": "Ecuador",
+    "594": "French Guiana", "595": "Paraguay", "596": "Martinique",
+    "597": "Suriname", "598": "Uruguay", "599": "Curacao",
+
+    # Zone 6: Southeast Asia and Oceania
+    "60": "Malaysia", "61": "Australia", "62": "Indonesia", "63": "Philippines",
+    "64": "New Zealand", "65": "Singapore", "66": "Thailand", "670": "Timor-Leste",
+    "672": "Norfolk Island", "673": "Brunei", "674": "Nauru",
+    "675": "Papua New Guinea", "676": "Tonga", "677": "Solomon Islands",
+    "678": "Vanuatu", "679": "Fiji", "680": "Palau", "681": "Wallis and Futuna",
+    "682": "Cook Islands", "683": "Niue", "685": "Samoa", "686": "Kiribati",
+    "687": "New Caledonia", "688": "Tuvalu", "689": "French Polynesia",
+    "690": "Tokelau", "691": "Micronesia", "692": "Marshall Islands",
+
+    # Zone 7: Russia and Kazakhstan
+    "7": "Russia", "76": "Kazakhstan", "77": "Kazakhstan",
+
+    # Zone 8: East Asia
+    "81": "Japan", "82": "South Korea", "84": "Vietnam", "850": "North Korea",
+    "852": "Hong Kong", "853": "Macao", "855": "Cambodia", "856": "Laos",
+    "86": "China", "880": "Bangladesh", "886": "Taiwan",
+
+    # Zone 9: West, Central and South Asia
+    "90": "Turkey", "91": "India", "92": "Pakistan", "93": "Afghanistan",
+    "94": "Sri Lanka", "95": "Myanmar", "960": "Maldives", "961": "Lebanon",
+    "962": "Jordan", "963": "Syria", "964": "Iraq", "965": "Kuwait",
+    "966": "Saudi Arabia", "967": "Yemen", "968": "Oman", "970": "Palestine",
+    "971": "United Arab Emirates", "972": "Israel", "973": "Bahrain",
+    "974": "Qatar", "975": "Bhutan", "976": "Mongolia", "977": "Nepal",
+    "98": "Iran", "992": "Tajikistan", "993": "Turkmenistan", "994": "Azerbaijan",
+    "995": "Georgia", "996": "Kyrgyzstan", "998": "Uzbekistan",
+}
+
+
+class PhonePrefixTrie:
+    """Digit trie for longest-prefix matching of calling codes."""
+
+    _VALUE = "$"  # key used for the value stored at a node
+
+    def __init__(self, codes: dict = None):
+        self._root = {}
+        for prefix, country in (codes or {}).items():
+            self.insert(prefix, country)
+
+    def insert(self, prefix: str, country: str):
+        node = self._root
+        for digit in prefix:
+            node = node.setdefault(digit, {})
+        node[self._VALUE] = country
+
+    def longest_match(self, digits: str):
+        """Returns the country of the longest prefix of digits, or None."""
+        node = self._root
+        match = None
+        for digit in digits:
+            node = node.get(digit)
+            if node is None:
+                break
+            match = node.get(self._VALUE, match)
+        return match
+
+
+_trie = PhonePrefixTrie(CALLING_CODES)
+
+
+def resolve_country(phone_number: str) -> dict:
+    """
+    Resolves the user's country from their phone number (E.164, with or
+    without "+", spaces or dashes).
+    """
+    digits = "".join(ch for ch in str(phone_number or "") if ch.isdigit())
+    # International prefix written as "00" instead of "+"
+    if digits.startswith("00"):
+        digits = digits[2:]
+
+    country = _trie.longest_match(digits)
+    if country:
+        return {
+            "status": "success",
+            "country": country
+        }
+
+    return {
+        "status": "not_found",
+        "country": "Unknown"
+    }
@@ -0,0 +1,15 @@
+from .breaker import CircuitBreaker, CircuitOpenError, circuit_breaker, breaker_stats
+from .deadline import DeadlineExceeded, deadline, remaining, expired, timeout_for, TURN_DEADLINE_SECONDS
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "circuit_breaker",
+    "breaker_stats",
+    "DeadlineExceeded",
+    "deadline",
+    "remaining",
+    "expired",
+    "timeout_for",
+    "TURN_DEADLINE_SECONDS"
+]
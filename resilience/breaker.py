@@ -0,0 +1,257 @@
+# Circuit breakers for external dependencies (SpicyTool CRM and send API,
+# IP geolocation, Gemini)
+#
+# Without them a degraded dependency makes every request wait out its full
+# timeout, turn after turn, until no capacity is left. Each dependency has
+# one breaker, fed with the outcome of every call:
+#   - closed: calls go through; the last BREAKER_WINDOW outcomes are kept.
+#     With at least BREAKER_MIN_CALLS of them, a failure rate of
+#     BREAKER_FAILURE_RATE opens the breaker. A call slower than the
+#     dependency's slow_call_seconds counts as a failure even if it
+#     succeeded (latency-based tripping).
+#   - open: calls fail at once with CircuitOpenError and callers take their
+#     degraded path. After BREAKER_OPEN_SECONDS the breaker half-opens.
+#   - half-open: BREAKER_HALF_OPEN_PROBES calls go through as probes; a
+#     success closes the breaker, a failure opens it again.
+# Calls cut short by the caller (cancelled, or the turn's deadline passed)
+# say nothing about the dependency and are not counted, unless already slow.
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+
+from observability import registry, get_logger
+from .deadline import DeadlineExceeded, expired
+
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+logger = get_logger("resilience.breaker")
+
+rejected_total = registry.counter(
+    "circuit_breaker_rejected_total",
+    "Calls not made because the dependency's breaker was open.",
+    ("dependency",)
+)
+opened_total = registry.counter(
+    "circuit_breaker_opened_total",
+    "Times a dependency's breaker opened.",
+    ("dependency",)
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(name + " unavailable (circuit open, retry in " + str(round(retry_in, 1)) + "s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class Attempt:
+    """Handle of one call; fail() marks a call that returned an error response."""
+
+    __slots__ = ("failed", "probe", "started", "ended")
+
+    def __init__(self, probe: bool = False):
+        self.failed = False
+        self.probe = probe
+        self.started = time.monotonic()
+        self.ended = False
+
+    def fail(self):
+        self.failed = True
+
+
+class CircuitBreaker:
+    """
+    Breaker of one dependency.
+
+        with crm_breaker.attempt() as attempt:
+            response = await client.get(...)
+            if response.status_code >= 500:
+                attempt.fail()
+    """
+
+    def __init__(
+        self,
+        name: str,
+        slow_call_seconds: float = float("inf"),
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        open_seconds: float = BREAKER_OPEN_SECONDS,
+        half_open_probes: int = BREAKER_HALF_OPEN_PROBES
+    ):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.failure_rate = failure_rate
+        self.min_calls = max(1, min_calls)
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._outcomes = deque(maxlen=max(1, window))  # True = failed
+        self._failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def retry_in(self) -> float:
+        if self._state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    @contextmanager
+    def attempt(self):
+        """Wraps one call. Raises CircuitOpenError if the call must not be made."""
+        attempt = self.begin()
+        try:
+            yield attempt
+        except (asyncio.CancelledError, DeadlineExceeded):
+            self.end(attempt, None)
+            raise
+        except Exception:
+            # A timeout caused by the turn's deadline is the caller's limit
+            self.end(attempt, None if expired() else True)
+            raise
+        else:
+            self.end(attempt, attempt.failed)
+
+    def begin(self) -> Attempt:
+        """
+        Starts one call that ends elsewhere (e.g. in a callback); every begin()
+        needs an end(). Raises CircuitOpenError if the call must not be made.
+        """
+        state = self.state
+        if state == OPEN or (state == HALF_OPEN and self._probes >= self.half_open_probes):
+            self.rejected += 1
+            rejected_total.inc(self.name)
+            raise CircuitOpenError(self.name, self.retry_in())
+        probe = state == HALF_OPEN
+        if probe:
+            self._probes += 1
+        return Attempt(probe)
+
+    def end(self, attempt: Attempt, failed):
+        """Records a call started with begin(). failed: True / False, or None when cut short by the caller."""
+        if attempt.ended:
+            return
+        attempt.ended = True
+        self._finish(attempt.probe, failed, time.monotonic() - attempt.started)
+
+    def _finish(self, probe: bool, failed, elapsed: float):
+        """failed: True / False, or None when the call was cut short by the caller."""
+        if probe:
+            self._probes -= 1
+        slow = elapsed >= self.slow_call_seconds
+        if failed is None:
+            if not slow:
+                return
+            failed = True
+        failed = failed or slow
+        self.calls += 1
+        self.failures += failed
+        self.slow_calls += slow
+
+        if probe or self._state == HALF_OPEN:
+            if failed:
+                self._open()
+            elif probe:
+                self._close()
+            return
+        if self._state != CLOSED:
+            return  # late result of a call started before the breaker opened
+
+        if len(self._outcomes) == self._outcomes.maxlen:
+            self._failures -= self._outcomes[0]
+        self._outcomes.append(failed)
+        self._failures += failed
+        if len(self._outcomes) >= self.min_calls and self._failures >= self.failure_rate * len(self._outcomes):
+            self._open()
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._failures = 0
+        self.opened += 1
+        opened_total.inc(self.name)
+        logger.warning("circuit_opened", dependency=self.name, open_seconds=self.open_seconds)
+
+    def _close(self):
+        self._state = CLOSED
+        self._outcomes.clear()
+        self._failures = 0
+        logger.info("circuit_closed", dependency=self.name)
+
+    def reset(self):
+        """Back to closed with no history (tests, manual recovery)."""
+        self._state = CLOSED
+        self._outcomes.clear()
+        self._failures = 0
+        self._probes = 0
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "retry_in_seconds": round(self.retry_in(), 1),
+            "window_failure_rate": round(self._failures / len(self._outcomes), 3) if self._outcomes else 0.0,
+            "calls": self.calls,
+            "failures": self.failures,
+            "slow_calls": self.slow_calls,
+            "rejected": self.rejected,
+            "opened": self.opened
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def circuit_breaker(name: str, **config) -> CircuitBreaker:
+    """The dependency's breaker, created on first use."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name, **config)
+    return breaker
+
+
+def breaker_stats() -> dict:
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
+
+
+class _StateGauge:
+    """circuit_breaker_state{dependency}: 0 closed, 1 half-open, 2 open."""
+
+    kind = "gauge"
+    name = "circuit_breaker_state"
+    help_text = "Breaker state per dependency (0 closed, 1 half-open, 2 open)."
+
+    def samples(self) -> list:
+        return [
+            self.name + '{dependency="' + name + '"} ' + str(_STATE_VALUES[breaker.state])
+            for name, breaker in _breakers.items()
+        ]
+
+
+registry.register(_StateGauge())
@@ -0,0 +1,58 @@
+# Deadline of the current agent turn, seen by every call made for it
+#
+# Each dependency has its own timeout (10s CRM, 5s location, 20s send...),
+# and a turn makes several calls. The turn sets one deadline
+# (TURN_DEADLINE_SECONDS) and every call below it uses the smaller of its
+# own timeout and the time left, so a slow dependency cannot make the turn
+# outlive its budget. Held in a contextvar: callbacks, tools and executor
+# jobs of the turn (run with contextvars.copy_context()) see it.
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+TURN_DEADLINE_SECONDS = float(os.getenv("TURN_DEADLINE_SECONDS", "45"))
+
+# time.monotonic() at which the current turn must be done, None outside a turn
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The turn's deadline passed before the call could start."""
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Sets the deadline for the block (never later than an enclosing one)."""
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None and current < at:
+        at = current
+    token = _deadline.set(at)
+    try:
+        yield at
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the deadline (may be negative), None without one."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def timeout_for(default: float) -> float:
+    """Timeout for a call: its own default, or less if the deadline is closer."""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("turn deadline exceeded")
+    return min(default, left)
@@ -1,16 +1,45 @@
 # Service to run the agent and process responses
 
+import asyncio
 import json
-from google.adk.sessions import InMemorySessionService
+import os
+from contextlib import aclosing
 from google.adk.runners import Runner
 from google.genai.types import Content, Part
 from real_estate_agent.agent import root_agent
+from real_estate_agent.callbacks import current_turn, llm_breaker, model_calls
 from models.payloads import AgentResponse
+from observability import span, get_logger
+from resilience import CircuitOpenError, remaining
+from .session_store import SqliteSessionService
+from .compaction import compact_history
+from .conversation_queue import llm_limiter
+from .coordination import coordination
 
 APP_NAME = "real_estate_agent"
 
-# Services (in production this uses real persistence)
-session_service = InMemorySessionService()
+logger = get_logger("services.agent_runner")
+
+# While the Gemini breaker (real_estate_agent/callbacks.py, fed per model
+# call) is open, or when the turn's deadline passes, the user gets
+# LLM_HOLDING_REPLY right away and the turn is escalated to a human.
+# An empty value (e.g. a .env copied from .env.example) keeps the default
+LLM_HOLDING_REPLY = os.getenv("LLM_HOLDING_REPLY") or (
+    "¡Gracias por tu mensaje! En este momento tenemos mucha demanda; un asesor te responderá en unos minutos."
+)
+
+# Sessions persist in SQLite; only recently active ones are kept in memory.
+# With several workers they share the file and revalidate cached sessions.
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_MAX_HOT = int(os.getenv("SESSION_MAX_HOT", "10000"))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+
+session_service = SqliteSessionService(
+    db_path=SESSION_DB_PATH,
+    max_hot_sessions=SESSION_MAX_HOT,
+    idle_seconds=SESSION_IDLE_SECONDS,
+    shared=coordination.shared
+)
 
 runner = Runner(
     agent=root_agent,
@@ -48,6 +77,11 @@ async def get_or_create_session(phone_number: str):
         return session
 
 
+def holding_response() -> AgentResponse:
+    """Reply sent when the model is unavailable; a human takes the conversation."""
+    return AgentResponse(message=LLM_HOLDING_REPLY, should_escalate=True)
+
+
 def parse_agent_response(response_text: str) -> AgentResponse:
     """
     Parses the agent's JSON response.
@@ -72,6 +106,13 @@ async def process_message(phone_number: str, message_text: str) -> AgentResponse
     """
     Processes a user message with the agent.
 
+    Runs entirely on the event loop (ADK async runner). Cancelling the caller
+    cancels the turn: the pending model or tool call is interrupted and the
+    runner is closed. If the turn was interrupted by a newer message, the
+    events it added to the session are discarded. While the model is
+    unavailable (circuit open) or past the turn's deadline, a holding reply
+    is returned instead.
+
     Args:
         phone_number: User's phone number
         message_text: Message text
@@ -80,7 +121,12 @@ async def process_message(phone_number: str, message_text: str) -> AgentResponse
         AgentResponse with message and should_escalate
     """
     # Get or create session
-    await get_or_create_session(phone_number)
+    with span("session_fetch"):
+        session = await get_or_create_session(phone_number)
+
+    # Fold old turns into the session summary so the prompt stays bounded
+    with span("history_compaction"):
+        await compact_history(session_service, session)
     
     # Prepare message for the agent
     content = Content(
@@ -88,21 +134,47 @@ async def process_message(phone_number: str, message_text: str) -> AgentResponse
         parts=[Part(text=message_text)]
     )
     
-    # Run the agent
-    events = runner.run(
-        user_id=phone_number,
-        session_id=phone_number,
-        new_message=content
-    )
-    
-    # Get final response
-    for event in events:
-        if event.is_final_response() and event.content:
-            response_text = event.content.parts[0].text
-            return parse_agent_response(response_text)
-    
+    # Run the agent (async path, so tools share the webhook's event loop).
+    # Turns across all conversations share the LLM concurrency slots.
+    # The whole turn, slot wait included, must end by the turn's deadline.
+    calls = []
+    calls_token = model_calls.set(calls)
+    try:
+        async with asyncio.timeout(remaining()):
+            async with llm_limiter.slot():
+                events = runner.run_async(
+                    user_id=phone_number,
+                    session_id=phone_number,
+                    new_message=content
+                )
+
+                # Get final response
+                try:
+                    async with aclosing(events):
+                        async for event in events:
+                            if event.is_final_response() and event.content:
+                                response_text = event.content.parts[0].text
+                                return parse_agent_response(response_text)
+                except asyncio.CancelledError:
+                    turn = current_turn.get()
+                    if turn is not None and turn.interrupted:
+                        # The merged text is answered by a new turn
+                        await asyncio.shield(session_service.discard_events(session, turn.wall_started_at))
+                    raise
+    except CircuitOpenError as e:
+        logger.warning("llm_unavailable", phone=phone_number, stage="agent", retry_in_s=round(e.retry_in, 1))
+        return holding_response()
+    except TimeoutError:
+        logger.warning("turn_deadline_exceeded", phone=phone_number, stage="agent")
+        return holding_response()
+    finally:
+        model_calls.reset(calls_token)
+        # Model calls cut short by cancellation or the deadline
+        for attempt in calls:
+            llm_breaker.end(attempt, None)
+
     # If there was no response
     return AgentResponse(
         message="Sorry, I couldn't process your message. Could you please try again?",
         should_escalate=False
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,206 @@
+# Rolling-window compaction of long conversation histories
+#
+# Every turn replays the whole session history to the model. For leads that
+# chat for days this grows without bound. Before each turn, turns older than
+# the last HISTORY_KEEP_TURNS are folded into a short text summary held in
+# session state (shown to the model in the prompt) and removed from the
+# history. Their tool-call / tool-response events go with them: the tool
+# results are already reflected in the summary.
+#
+# When the summary outgrows HISTORY_SUMMARY_MAX_CHARS, its first
+# HISTORY_SUMMARY_HEAD_CHARS (the start of the conversation, where leads give
+# their name, email and what they look for) are always kept, and the lines
+# after them are dropped oldest first, leaving a "[...]" gap line.
+
+import json
+import os
+
+HISTORY_COMPACTION_ENABLED = os.getenv("HISTORY_COMPACTION_ENABLED", "true").lower() in ("true", "1", "yes")
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "8"))
+HISTORY_SUMMARY_MAX_CHARS = int(os.getenv("HISTORY_SUMMARY_MAX_CHARS", "2000"))
+# Start of the summary never dropped when it is trimmed
+HISTORY_SUMMARY_HEAD_CHARS = int(os.getenv("HISTORY_SUMMARY_HEAD_CHARS", "600"))
+
+# Longest text kept per summarized message
+_LINE_MAX_CHARS = 200
+# Marks where lines were dropped between the head and the recent lines
+_GAP_LINE = "[...]"
+
+SUMMARY_STATE_KEY = "conversation_summary"
+# Tokens of all folded events, to report what the history would cost uncompacted
+ARCHIVED_TOKENS_STATE_KEY = "archived_history_tokens"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)."""
+    return len(text) // 4
+
+
+def _is_user_turn(event) -> bool:
+    """A turn starts with a user text message (not a tool response)."""
+    return (
+        event.author == "user"
+        and event.content is not None
+        and any(part.text for part in event.content.parts or [])
+    )
+
+
+def _event_text(event) -> str:
+    """Text of an event as the model sees it (text, tool calls and results)."""
+    if event.content is None:
+        return ""
+    return json.dumps(event.content.model_dump(mode="json", exclude_none=True), ensure_ascii=False)
+
+
+def _summary_lines(event) -> list:
+    """Short lines describing an event for the summary."""
+    if event.content is None:
+        return []
+    lines = []
+    for part in event.content.parts or []:
+        if part.text and not part.thought:
+            text = part.text
+            if event.author == "user":
+                lines.append("User: " + _shorten(text))
+            else:
+                # Agent replies are AgentResponse JSON
+                try:
+                    text = json.loads(text.replace("```json", "").replace("```", "").strip()).get("message", text)
+                except (json.JSONDecodeError, AttributeError):
+                    pass
+                lines.append("Agent: " + _shorten(text))
+        elif part.function_response:
+            result = part.function_response.response or {}
+            status = result.get("status", "done") if isinstance(result, dict) else "done"
+            lines.append("Tool " + str(part.function_response.name) + ": " + str(status))
+    return lines
+
+
+def _shorten(text: str) -> str:
+    text = " ".join(text.split())
+    if len(text) > _LINE_MAX_CHARS:
+        return text[:_LINE_MAX_CHARS - 3] + "..."
+    return text
+
+
+def _fold(previous_summary: str, events: list, max_chars: int = None, head_chars: int = None) -> str:
+    if max_chars is None:
+        max_chars = HISTORY_SUMMARY_MAX_CHARS
+    if head_chars is None:
+        head_chars = HISTORY_SUMMARY_HEAD_CHARS
+    head_chars = min(head_chars, max_chars // 2)
+
+    lines = previous_summary.splitlines() if previous_summary else []
+    for event in events:
+        lines.extend(_summary_lines(event))
+    summary = "\n".join(lines)
+    if len(summary) <= max_chars:
+        return summary
+
+    # The head: the earliest lines, up to head_chars (the same lines on every fold)
+    head = []
+    size = 0
+    for line in lines:
+        if line == _GAP_LINE or size + len(line) + 1 > head_chars:
+            break
+        head.append(line)
+        size += len(line) + 1
+    rest = lines[len(head):]
+    if rest and rest[0] == _GAP_LINE:
+        rest = rest[1:]
+
+    # Then the most recent lines that fit
+    budget = max_chars - size - len(_GAP_LINE) - 1
+    recent = []
+    for line in reversed(rest):
+        if len(line) + 1 > budget:
+            break
+        recent.append(line)
+        budget -= len(line) + 1
+    recent.reverse()
+    return "\n".join(head + [_GAP_LINE] + recent)
+
+
+class CompactionStats:
+    """
+    History tokens per turn: "before" is the full history as it would be sent
+    without compaction, "after" is the summary plus the kept turns.
+    """
+
+    def __init__(self):
+        self.turns = 0
+        self.compactions = 0
+        self.events_folded = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.last = None
+
+    def record(self, tokens_before: int, tokens_after: int, events_folded: int):
+        self.turns += 1
+        self.tokens_before += tokens_before
+        self.tokens_after += tokens_after
+        if events_folded:
+            self.compactions += 1
+            self.events_folded += events_folded
+        self.last = {
+            "history_tokens_before": tokens_before,
+            "history_tokens_after": tokens_after,
+            "events_folded": events_folded
+        }
+
+    def to_dict(self) -> dict:
+        if not self.turns:
+            return {"turns": 0}
+        return {
+            "turns": self.turns,
+            "compactions": self.compactions,
+            "events_folded": self.events_folded,
+            "avg_history_tokens_before": round(self.tokens_before / self.turns, 1),
+            "avg_history_tokens_after": round(self.tokens_after / self.turns, 1),
+            "last": self.last
+        }
+
+
+compaction_stats = CompactionStats()
+
+
+async def compact_history(session_service, session, keep_turns: int = None) -> int:
+    """
+    Folds turns older than the last keep_turns into the session summary.
+
+    Args:
+        session_service: Session service (must support archive_events)
+        session: The conversation's session
+        keep_turns: Turns kept verbatim (default HISTORY_KEEP_TURNS)
+
+    Returns:
+        Number of events folded into the summary
+    """
+    if keep_turns is None:
+        keep_turns = HISTORY_KEEP_TURNS
+    keep_turns = max(1, keep_turns)
+
+    events = session.events
+    previous_summary = session.state.get(SUMMARY_STATE_KEY, "")
+    archived_tokens = session.state.get(ARCHIVED_TOKENS_STATE_KEY, 0)
+    event_tokens = [estimate_tokens(_event_text(e)) for e in events]
+    tokens_before = archived_tokens + sum(event_tokens)
+
+    turn_starts = [i for i, event in enumerate(events) if _is_user_turn(event)]
+    # The new user message is not in the history yet, so it counts as a turn
+    cut = 0
+    if HISTORY_COMPACTION_ENABLED and hasattr(session_service, "archive_events") and len(turn_starts) >= keep_turns:
+        cut = turn_starts[len(turn_starts) - keep_turns + 1] if keep_turns > 1 else len(events)
+
+    if cut:
+        summary = _fold(previous_summary, events[:cut])
+        await session_service.archive_events(session, cut, {
+            SUMMARY_STATE_KEY: summary,
+            ARCHIVED_TOKENS_STATE_KEY: archived_tokens + sum(event_tokens[:cut])
+        })
+    else:
+        summary = previous_summary
+
+    tokens_after = estimate_tokens(summary) + sum(event_tokens[cut:])
+    compaction_stats.record(tokens_before, tokens_after, cut)
+    return cut
@@ -0,0 +1,160 @@
+# Per-conversation ordering and a global cap on concurrent agent turns
+#
+# A message that arrives after the debounce fired, while the agent is still
+# answering, starts a second turn for the same phone. Each phone has a FIFO
+# mailbox: a turn waits until the previous turns of that conversation are
+# done. Agent turns across all conversations share LLM_MAX_CONCURRENCY slots.
+
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from .coordination import coordination as default_coordination
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+# Recent wait times kept for percentiles
+_WAIT_SAMPLES = 1000
+
+
+class WaitStats:
+    """Wait time counters (average, max and recent percentiles)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent = deque(maxlen=_WAIT_SAMPLES)
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+        self.recent.append(seconds)
+
+    def to_dict(self) -> dict:
+        if not self.count:
+            return {"count": 0}
+        recent = sorted(self.recent)
+        return {
+            "count": self.count,
+            "avg_wait_ms": round(self.total_wait / self.count * 1000, 1),
+            "p95_wait_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 1),
+            "max_wait_ms": round(self.max_wait * 1000, 1)
+        }
+
+
+class ConversationQueue:
+    """
+    Runs the turns of one conversation strictly in arrival order.
+
+    Conversations are independent; a mailbox only exists while the phone has
+    a turn running or queued. With several workers, the turn also holds the
+    phone's lock in the coordination backend.
+    """
+
+    def __init__(self, coordination=None):
+        self.coordination = coordination or default_coordination
+        self._mailboxes: Dict[str, deque] = {}
+        self.max_depth = 0
+        self.waits = WaitStats()
+
+    @asynccontextmanager
+    async def turn(self, phone_number: str):
+        """Waits for the phone's earlier turns, then holds its turn."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        ticket = loop.create_future()
+
+        mailbox = self._mailboxes.get(phone_number)
+        if mailbox is None:
+            mailbox = self._mailboxes[phone_number] = deque()
+        mailbox.append(ticket)
+        self.max_depth = max(self.max_depth, len(mailbox))
+        if len(mailbox) == 1:
+            self._grant(mailbox)
+
+        try:
+            await ticket
+            async with self.coordination.lock(phone_number):
+                self.waits.record(loop.time() - started)
+                yield
+        finally:
+            self._leave(phone_number, mailbox, ticket)
+
+    def _grant(self, mailbox: deque):
+        """Lets the first waiter still waiting run; cancelled tickets are dropped."""
+        while mailbox and mailbox[0].cancelled():
+            mailbox.popleft()
+        if mailbox and not mailbox[0].done():
+            mailbox[0].set_result(None)
+
+    def _leave(self, phone_number: str, mailbox: deque, ticket: asyncio.Future):
+        was_running = bool(mailbox) and mailbox[0] is ticket
+        try:
+            mailbox.remove(ticket)
+        except ValueError:
+            pass  # cancelled ticket already dropped by _grant
+        if was_running:
+            self._grant(mailbox)
+        if not mailbox and self._mailboxes.get(phone_number) is mailbox:
+            del self._mailboxes[phone_number]
+
+    def depth(self, phone_number: str) -> int:
+        """Turns running or queued for the phone."""
+        mailbox = self._mailboxes.get(phone_number)
+        return len(mailbox) if mailbox else 0
+
+    def stats(self) -> dict:
+        return {
+            "active_conversations": len(self._mailboxes),
+            "queued_turns": sum(len(m) - 1 for m in self._mailboxes.values()),
+            "max_depth": self.max_depth,
+            "turn_wait": self.waits.to_dict()
+        }
+
+
+class LlmLimiter:
+    """Caps how many agent turns call the model at the same time."""
+
+    def __init__(self, limit: int = LLM_MAX_CONCURRENCY):
+        self.limit = max(1, limit)
+        self._semaphore = asyncio.Semaphore(self.limit)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.waiting = 0
+        self.waits = WaitStats()
+
+    @asynccontextmanager
+    async def slot(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.waits.record(loop.time() - started)
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "waiting": self.waiting,
+            "slot_wait": self.waits.to_dict()
+        }
+
+
+# Global instances
+conversation_queue = ConversationQueue()
+llm_limiter = LlmLimiter()
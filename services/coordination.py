@@ -0,0 +1,245 @@
+# Coordination between webhook workers (uvicorn --workers N, several pods)
+#
+# With one worker, the Debouncer's buffers and the in-process conversation
+# queue are enough (LocalCoordination). With several workers, messages of
+# one phone can reach different processes, so they share:
+#   - debounce buffers: every message is appended to a shared buffer and
+#     stamped with a token; when a worker's debounce timer fires it can only
+#     claim the buffer if its token is still the latest one. The worker that
+#     received the last message answers, once, with all the messages.
+#   - per-phone locks: a lease held for the whole turn, renewed while held.
+#   - message ids taken from webhook deliveries, so a retried delivery is
+#     only processed by one worker.
+#   - session lookup: the session store revalidates cached sessions (see
+#     SqliteSessionService(shared=True)).
+#
+# SqliteCoordination keeps this in a SQLite file, for workers on one host.
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from .db import transaction
+
+COORDINATION_BACKEND = os.getenv("COORDINATION_BACKEND", "local")  # local | sqlite
+COORDINATION_DB_PATH = os.getenv("COORDINATION_DB_PATH", "coordination.db")
+COORDINATION_LOCK_TTL = float(os.getenv("COORDINATION_LOCK_TTL", "60"))
+# How long taken message ids are remembered (retries come within minutes)
+COORDINATION_SEEN_TTL = float(os.getenv("COORDINATION_SEEN_TTL", "86400"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS debounce_buffers (
+    phone_number TEXT PRIMARY KEY,
+    messages TEXT NOT NULL,
+    payload_data TEXT NOT NULL,
+    token TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS seen_messages (
+    phone_number TEXT NOT NULL,
+    message_key TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (phone_number, message_key)
+);
+CREATE TABLE IF NOT EXISTS phone_locks (
+    phone_number TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Lock polling interval bounds (seconds)
+_LOCK_POLL_MIN = 0.02
+_LOCK_POLL_MAX = 0.5
+
+
+class LocalCoordination:
+    """Single worker: debounce buffers stay in the Debouncer, locks are in-process."""
+
+    shared = False
+
+    @asynccontextmanager
+    async def lock(self, phone_number: str):
+        yield
+
+    def stats(self) -> dict:
+        return {"backend": "local"}
+
+    def close(self):
+        pass
+
+
+class SqliteCoordination:
+    """
+    Coordination through a SQLite file shared by all workers on a host.
+
+    Calls run on a single background thread, like the session store.
+    """
+
+    shared = True
+
+    def __init__(self, db_path: str = COORDINATION_DB_PATH, lock_ttl: float = COORDINATION_LOCK_TTL):
+        self.db_path = db_path
+        self.lock_ttl = lock_ttl
+        self.worker_id = uuid.uuid4().hex[:12]
+        self._tokens = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="coordination")
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self.buffered = 0
+        self.claimed = 0
+        self.superseded = 0
+        self.lock_waits = 0
+        self._claims = 0
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # ---------- debounce buffers ----------
+
+    def _db_buffer(self, phone_number: str, message_text: str, payload_data: dict, token: str):
+        with transaction(self._conn):
+            row = self._conn.execute(
+                "SELECT messages FROM debounce_buffers WHERE phone_number = ?", (phone_number,)
+            ).fetchone()
+            messages = json.loads(row[0]) if row else []
+            messages.append(message_text)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO debounce_buffers (phone_number, messages, payload_data, token, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (phone_number, json.dumps(messages), json.dumps(payload_data), token, time.time())
+            )
+
+    def _db_claim(self, phone_number: str, token: str) -> Optional[tuple]:
+        with transaction(self._conn):
+            row = self._conn.execute(
+                "SELECT messages, payload_data FROM debounce_buffers WHERE phone_number = ? AND token = ?",
+                (phone_number, token)
+            ).fetchone()
+            if row:
+                self._conn.execute("DELETE FROM debounce_buffers WHERE phone_number = ?", (phone_number,))
+        return (json.loads(row[0]), json.loads(row[1])) if row else None
+
+    async def buffer_message(self, phone_number: str, message_text: str, payload_data: dict) -> str:
+        """Appends a message to the phone's shared buffer. Returns the new buffer token."""
+        self._tokens += 1
+        token = self.worker_id + "-" + str(self._tokens)
+        await self._run(self._db_buffer, phone_number, message_text, payload_data, token)
+        self.buffered += 1
+        return token
+
+    async def claim_buffer(self, phone_number: str, token: str) -> Optional[tuple]:
+        """
+        Takes the phone's buffer if token is still the latest one.
+
+        Returns:
+            (messages, payload_data), or None if a newer message (on any
+            worker) took over the buffer
+        """
+        claimed = await self._run(self._db_claim, phone_number, token)
+        if claimed is None:
+            self.superseded += 1
+        else:
+            self.claimed += 1
+        return claimed
+
+    # ---------- delivered message ids ----------
+
+    def _db_claim_messages(self, phone_number: str, keys: list) -> list:
+        now = time.time()
+        taken = []
+        with transaction(self._conn):
+            for key in keys:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO seen_messages (phone_number, message_key, seen_at) VALUES (?, ?, ?)",
+                    (phone_number, key, now)
+                )
+                if cursor.rowcount:
+                    taken.append(key)
+            self._claims += 1
+            if self._claims % 1000 == 0:
+                self._conn.execute("DELETE FROM seen_messages WHERE seen_at < ?", (now - COORDINATION_SEEN_TTL,))
+        return taken
+
+    async def claim_messages(self, phone_number: str, keys: list) -> list:
+        """Marks message ids as taken. Returns the ones no worker had taken before."""
+        return await self._run(self._db_claim_messages, phone_number, keys)
+
+    # ---------- per-phone locks ----------
+
+    def _db_try_lock(self, phone_number: str, owner: str) -> bool:
+        now = time.time()
+        with transaction(self._conn):
+            self._conn.execute(
+                "DELETE FROM phone_locks WHERE phone_number = ? AND expires_at < ?", (phone_number, now)
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO phone_locks (phone_number, owner, expires_at) VALUES (?, ?, ?)",
+                (phone_number, owner, now + self.lock_ttl)
+            )
+            row = self._conn.execute("SELECT owner FROM phone_locks WHERE phone_number = ?", (phone_number,)).fetchone()
+        return row is not None and row[0] == owner
+
+    def _db_renew(self, phone_number: str, owner: str):
+        self._conn.execute(
+            "UPDATE phone_locks SET expires_at = ? WHERE phone_number = ? AND owner = ?",
+            (time.time() + self.lock_ttl, phone_number, owner)
+        )
+
+    def _db_unlock(self, phone_number: str, owner: str):
+        self._conn.execute("DELETE FROM phone_locks WHERE phone_number = ? AND owner = ?", (phone_number, owner))
+
+    async def _keep_alive(self, phone_number: str, owner: str):
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            await self._run(self._db_renew, phone_number, owner)
+
+    @asynccontextmanager
+    async def lock(self, phone_number: str):
+        """Holds the phone's lease across all workers (renewed until released)."""
+        owner = self.worker_id + "-" + uuid.uuid4().hex[:8]
+        delay = _LOCK_POLL_MIN
+        while not await self._run(self._db_try_lock, phone_number, owner):
+            self.lock_waits += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _LOCK_POLL_MAX)
+
+        renewer = asyncio.create_task(self._keep_alive(phone_number, owner))
+        try:
+            yield
+        finally:
+            renewer.cancel()
+            await asyncio.shield(self._run(self._db_unlock, phone_number, owner))
+
+    def stats(self) -> dict:
+        return {
+            "backend": "sqlite",
+            "worker_id": self.worker_id,
+            "buffered": self.buffered,
+            "claimed": self.claimed,
+            "superseded": self.superseded,
+            "lock_waits": self.lock_waits
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+
+
+def create_coordination():
+    """Backend selected by COORDINATION_BACKEND."""
+    if COORDINATION_BACKEND == "sqlite":
+        return SqliteCoordination()
+    return LocalCoordination()
+
+
+# Global instance shared by the debouncer, conversation queue and session store
+coordination = create_coordination()
@@ -0,0 +1,21 @@
+# SQLite helpers shared by the session store, coordination and outbox
+
+import sqlite3
+from contextlib import contextmanager
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection, mode: str = "IMMEDIATE"):
+    """
+    One explicit transaction on a connection opened with isolation_level=None.
+    Any error (SQLITE_BUSY, a value json.dumps cannot encode...) rolls it
+    back, so the connection is never left inside a failed transaction.
+    """
+    conn.execute("BEGIN " + mode)
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
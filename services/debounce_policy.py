@@ -0,0 +1,154 @@
+# Adaptive debounce delay, per phone number
+#
+# A fixed delay makes every reply wait for it, even when the user sent one
+# complete question. The delay is instead estimated from each user's own
+# habits:
+#   - gaps between their messages shorter than DEBOUNCE_MAX_DELAY are
+#     gaps inside a burst; a smoothed mean and deviation of those gaps give
+#     the delay (mean + 2 * deviation, like a retransmission timeout),
+#   - a turn that got no follow-up message pulls the estimate down, so users
+#     who write one message per turn get short delays,
+#   - a message that ends with "?" or is long enough to be complete uses
+#     the minimum delay (end-of-turn signal).
+# The delay is always within DEBOUNCE_MIN_DELAY..DEBOUNCE_MAX_DELAY. A new
+# phone starts at DEBOUNCE_DELAY. Phones idle for DEBOUNCE_IDLE_SECONDS are
+# forgotten (and at most DEBOUNCE_MAX_PHONES are kept).
+#
+# A message arriving shortly after its phone was flushed means the delay
+# was too short and the burst was split into two agent turns: those are
+# counted (split_turns) to tune the latency / extra LLM calls trade-off.
+
+import os
+from collections import OrderedDict
+
+DEBOUNCE_MIN_DELAY = float(os.getenv("DEBOUNCE_MIN_DELAY", "1.5"))
+DEBOUNCE_MAX_DELAY = float(os.getenv("DEBOUNCE_MAX_DELAY", "10"))
+# Messages at least this long are treated as complete
+DEBOUNCE_COMPLETE_CHARS = int(os.getenv("DEBOUNCE_COMPLETE_CHARS", "80"))
+DEBOUNCE_MAX_PHONES = int(os.getenv("DEBOUNCE_MAX_PHONES", "100000"))
+DEBOUNCE_IDLE_SECONDS = float(os.getenv("DEBOUNCE_IDLE_SECONDS", "1800"))
+
+# Weight of the newest observation in the smoothed gap
+_ALPHA = 0.3
+
+# The timings dict keeps its table after deletes: rebuilt once under 1/4 of its peak
+_SHRINK_MIN = 1024
+
+
+class _PhoneTiming:
+    __slots__ = ("last_at", "flushed_at", "mean", "dev")
+
+    def __init__(self, mean: float, dev: float):
+        self.last_at = None
+        self.flushed_at = None
+        self.mean = mean
+        self.dev = dev
+
+    def observe(self, gap: float):
+        self.dev += _ALPHA * (abs(gap - self.mean) - self.dev)
+        self.mean += _ALPHA * (gap - self.mean)
+
+
+class AdaptiveDelay:
+    """Per-phone debounce delay from observed inter-message gaps."""
+
+    def __init__(
+        self,
+        initial_delay: float,
+        min_delay: float = DEBOUNCE_MIN_DELAY,
+        max_delay: float = DEBOUNCE_MAX_DELAY,
+        complete_chars: int = DEBOUNCE_COMPLETE_CHARS,
+        max_phones: int = DEBOUNCE_MAX_PHONES,
+        idle_seconds: float = DEBOUNCE_IDLE_SECONDS
+    ):
+        self.initial_delay = min(max(initial_delay, min_delay), max_delay)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.complete_chars = complete_chars
+        self.max_phones = max_phones
+        self.idle_seconds = idle_seconds
+        self._timings: "OrderedDict[str, _PhoneTiming]" = OrderedDict()
+        self._peak_phones = 0
+        self.end_of_turn = 0
+        self.split_turns = 0
+        self.evicted = 0
+
+    def _timing(self, phone_number: str) -> _PhoneTiming:
+        timing = self._timings.get(phone_number)
+        if timing is None:
+            # mean + 2 * dev == initial_delay
+            timing = self._timings[phone_number] = _PhoneTiming(self.initial_delay / 2, self.initial_delay / 4)
+            while len(self._timings) > self.max_phones:
+                self._timings.popitem(last=False)
+                self.evicted += 1
+            self._peak_phones = max(self._peak_phones, len(self._timings))
+        else:
+            self._timings.move_to_end(phone_number)
+        return timing
+
+    def is_end_of_turn(self, message_text: str) -> bool:
+        text = message_text.rstrip()
+        return text.endswith("?") or len(text) >= self.complete_chars
+
+    def delay_for(self, phone_number: str, message_text: str, now: float, new_turn: bool) -> float:
+        """
+        Delay to wait after this message (seconds). Call once per message.
+
+        Args:
+            now: loop time of the arrival
+            new_turn: no messages of this phone are buffered
+        """
+        self.evict_idle(now)
+        timing = self._timing(phone_number)
+        if timing.last_at is not None:
+            gap = now - timing.last_at
+            if gap <= self.max_delay:
+                timing.observe(gap)
+                if new_turn and timing.flushed_at is not None and timing.flushed_at >= timing.last_at:
+                    # The previous burst was answered before this follow-up
+                    self.split_turns += 1
+        timing.last_at = now
+
+        if self.is_end_of_turn(message_text):
+            self.end_of_turn += 1
+            return self.min_delay
+        return self.current_delay(phone_number)
+
+    def evict_idle(self, now: float):
+        """Forgets phones without a message for idle_seconds."""
+        # Least recently active first: stop at the first one that is not idle
+        while self._timings:
+            timing = next(iter(self._timings.values()))
+            if now - timing.last_at < self.idle_seconds:
+                break
+            self._timings.popitem(last=False)
+            self.evicted += 1
+        if self._peak_phones > _SHRINK_MIN and len(self._timings) < self._peak_phones // 4:
+            self._timings = OrderedDict(self._timings)
+            self._peak_phones = len(self._timings)
+
+    def current_delay(self, phone_number: str) -> float:
+        timing = self._timings.get(phone_number)
+        if timing is None:
+            return self.initial_delay
+        return min(max(timing.mean + 2 * timing.dev, self.min_delay), self.max_delay)
+
+    def on_flush(self, phone_number: str, message_count: int, now: float):
+        """Called when the phone's buffer is processed."""
+        timing = self._timings.get(phone_number)
+        if timing is None:
+            return
+        timing.flushed_at = now
+        if message_count == 1:
+            # Nothing followed within the delay: this user tends to send single messages
+            timing.observe(0.0)
+
+    def stats(self) -> dict:
+        return {
+            "min_delay_seconds": self.min_delay,
+            "max_delay_seconds": self.max_delay,
+            "tracked_phones": len(self._timings),
+            "evicted_phones": self.evicted,
+            "end_of_turn_flushes": self.end_of_turn,
+            "split_turns": self.split_turns
+        }
@@ -1,40 +1,114 @@
 # Debouncing service to handle rapid consecutive messages
 
 import asyncio
-from typing import Dict, Optional, Callable, Any
-from dataclasses import dataclass
-from datetime import datetime
+import heapq
+import itertools
+import os
+from typing import Dict, List, Optional, Callable, Any
+from dataclasses import dataclass, field
 
+from observability import observe_stage, get_logger, registry
+from .coordination import coordination as default_coordination
+from .conversation_queue import WaitStats
+from .debounce_policy import AdaptiveDelay
+from .interrupts import turn_interrupts as default_interrupts
 
-@dataclass
+logger = get_logger("services.debouncer")
+
+# Delay after the last message (fixed), or for a new phone (adaptive)
+DEBOUNCE_DELAY = float(os.getenv("DEBOUNCE_DELAY", "7"))
+DEBOUNCE_ADAPTIVE = os.getenv("DEBOUNCE_ADAPTIVE", "true").lower() in ("true", "1", "yes")
+
+flushes_total = registry.counter("debounce_flushes_total", "Debounced buffers processed (one agent turn each).")
+messages_total = registry.counter("debounce_messages_total", "Messages merged into debounced buffers.")
+split_turns_total = registry.counter(
+    "debounce_split_turns_total",
+    "Messages that arrived right after their phone was flushed (a burst answered in two turns)."
+)
+
+# Flushes fired before the scheduler yields to the event loop
+_FLUSH_BATCH = 256
+
+# A dict keeps its table after deletes: rebuilt once under 1/4 of its peak
+_SHRINK_MIN = 1024
+
+
+@dataclass(slots=True)
 class PendingMessage:
-    """Stores pending message data waiting to be processed."""
+    """
+    Buffered messages of one phone number waiting to be processed.
+    Removed when processed: only phones with a buffer take memory here.
+    """
     phone_number: str
-    message_text: str
     payload_data: dict
-    timestamp: datetime
-    task: Optional[asyncio.Task] = None
+    process_callback: Callable[[str, str, dict], Any]
+    deadline: float
+    token: int
+    buffer_token: Optional[str] = None  # latest token in the shared buffer
+    first_at: float = 0.0  # loop time of the first buffered message
+    restarts: int = 0  # turns of these messages interrupted so far
+    messages: List[str] = field(default_factory=list)
+    waiters: Optional[List[asyncio.Future]] = None  # debounce_and_wait callers
 
 
 class Debouncer:
     """
     Debouncer for handling rapid consecutive messages.
-    
+
     Waits for a pause in messages before processing.
     If new message arrives, resets the timer.
+
+    A single scheduler task serves every phone number: deadlines live in a
+    heap, and a new message only moves its phone's deadline forward (O(1),
+    no task cancellation). Outdated heap entries are re-pushed lazily when
+    they reach the top.
+
+    With a shared coordination backend (several workers), messages are also
+    appended to a shared buffer; when the timer fires the buffer is only
+    processed if this worker received the phone's latest message.
+
+    A message for a phone whose agent turn is still running may interrupt
+    that turn (services/interrupts.py): its text is put back at the front of
+    the new buffer.
     """
-    
-    def __init__(self, delay_seconds: float = 2.0):
+
+    def __init__(
+        self,
+        delay_seconds: float = 2.0,
+        tick_seconds: float = 0.01,
+        coordination=None,
+        policy=None,
+        interrupts=None
+    ):
         """
         Initialize debouncer.
-        
+
         Args:
             delay_seconds: Time to wait after last message before processing
+            tick_seconds: Scheduler resolution; deadlines this close together
+                are fired in the same wakeup (at most this late)
+            coordination: Backend shared with other workers (default: the
+                global one from services.coordination)
+            policy: Per-phone delay (AdaptiveDelay); None waits
+                delay_seconds after every message
+            interrupts: Running turns (default: the global TurnInterrupts)
         """
         self.delay_seconds = delay_seconds
+        self.policy = policy
+        self.flushes = 0
+        self.merged_messages = 0
+        self.wait_stats = WaitStats()
+        self.tick_seconds = tick_seconds
+        self.coordination = coordination or default_coordination
+        self.interrupts = interrupts or default_interrupts
         self.pending_messages: Dict[str, PendingMessage] = {}
-        self.message_buffers: Dict[str, list] = {}  # Store multiple messages
-    
+        self._peak_pending = 0
+        self._heap: list = []  # (deadline, token, phone_number)
+        self._tokens = itertools.count()
+        self._scheduler: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Future] = None
+        self._flush_tasks: set = set()
+
     async def debounce(
         self,
         phone_number: str,
@@ -44,64 +118,22 @@ class Debouncer:
     ) -> Optional[Any]:
         """
         Debounce a message.
-        
+
         Args:
             phone_number: User identifier
             message_text: The message content
             payload_data: Additional payload data
             process_callback: Async function to call when debounce completes
-            
+
         Returns:
             None if debouncing (waiting), or callback result if processed
         """
-        
-        # Cancel existing pending task for this user
-        if phone_number in self.pending_messages:
-            pending = self.pending_messages[phone_number]
-            if pending.task and not pending.task.done():
-                pending.task.cancel()
-                try:
-                    await pending.task
-                except asyncio.CancelledError:
-                    pass
-        
-        # Add message to buffer
-        if phone_number not in self.message_buffers:
-            self.message_buffers[phone_number] = []
-        self.message_buffers[phone_number].append(message_text)
-        
-        # Create new pending message
-        pending = PendingMessage(
-            phone_number=phone_number,
-            message_text=message_text,
-            payload_data=payload_data,
-            timestamp=datetime.now()
-        )
-        
-        # Create debounce task
-        async def debounce_task():
-            await asyncio.sleep(self.delay_seconds)
-            
-            # Combine all buffered messages
-            combined_message = " ".join(self.message_buffers.get(phone_number, [message_text]))
-            
-            # Clear buffer
-            self.message_buffers[phone_number] = []
-            
-            # Remove from pending
-            if phone_number in self.pending_messages:
-                del self.pending_messages[phone_number]
-            
-            # Execute callback
-            return await process_callback(phone_number, combined_message, payload_data)
-        
-        # Store and start task
-        pending.task = asyncio.create_task(debounce_task())
-        self.pending_messages[phone_number] = pending
-        
+        pending = self._add(phone_number, message_text, payload_data, process_callback)
+        await self._share(pending, message_text, payload_data)
+
         # Return immediately (don't wait for debounce)
         return None
-    
+
     async def debounce_and_wait(
         self,
         phone_number: str,
@@ -111,66 +143,220 @@ class Debouncer:
     ) -> Any:
         """
         Debounce a message and wait for result.
-        
+
         Same as debounce() but waits for the task to complete.
         Use this when you need the response.
+
+        Returns None if a newer message for the same phone superseded this one.
         """
-        
-        # Cancel existing pending task for this user
-        if phone_number in self.pending_messages:
-            pending = self.pending_messages[phone_number]
-            if pending.task and not pending.task.done():
-                pending.task.cancel()
+        pending = self._add(phone_number, message_text, payload_data, process_callback)
+
+        # Earlier waiters are superseded by this message
+        _resolve_all(pending.waiters, None)
+        waiter = asyncio.get_running_loop().create_future()
+        pending.waiters = [waiter]
+        await self._share(pending, message_text, payload_data)
+
+        return await waiter
+
+    def _add(
+        self,
+        phone_number: str,
+        message_text: str,
+        payload_data: dict,
+        process_callback: Callable[[str, str, dict], Any]
+    ) -> PendingMessage:
+        """Buffers the message and moves the phone's deadline forward."""
+        loop = asyncio.get_running_loop()
+        self._ensure_scheduler(loop)
+        now = loop.time()
+        pending = self.pending_messages.get(phone_number)
+        if self.policy is not None:
+            split_turns = self.policy.split_turns
+            deadline = now + self.policy.delay_for(phone_number, message_text, now, new_turn=pending is None)
+            if self.policy.split_turns != split_turns:
+                split_turns_total.inc()
+        else:
+            deadline = now + self.delay_seconds
+
+        if pending is None:
+            pending = PendingMessage(
+                phone_number=phone_number,
+                payload_data=payload_data,
+                process_callback=process_callback,
+                deadline=deadline,
+                token=next(self._tokens),
+                first_at=now
+            )
+            interrupted = self.interrupts.interrupt(phone_number)
+            if interrupted is not None:
+                # Answered again, together with the new message
+                pending.messages.append(interrupted.message_text)
+                pending.restarts = interrupted.restarts + 1
+            self.pending_messages[phone_number] = pending
+            self._peak_pending = max(self._peak_pending, len(self.pending_messages))
+            self._push(deadline, pending.token, phone_number)
+        else:
+            if deadline < pending.deadline:
+                # Shorter delay (end-of-turn signal): the heap entry would fire too late
+                self._push(deadline, pending.token, phone_number)
+            # Otherwise O(1): the heap entry is fixed up when it reaches the top
+            pending.deadline = deadline
+            pending.payload_data = payload_data
+            pending.process_callback = process_callback
+
+        pending.messages.append(message_text)
+        return pending
+
+    async def _share(self, pending: PendingMessage, message_text: str, payload_data: dict):
+        """Appends the message to the shared buffer (multi-worker only)."""
+        if self.coordination.shared:
+            pending.buffer_token = await self.coordination.buffer_message(
+                pending.phone_number, message_text, payload_data
+            )
+
+    def _push(self, deadline: float, token: int, phone_number: str):
+        heapq.heappush(self._heap, (deadline, token, phone_number))
+        # Wake the scheduler if this is now the earliest deadline
+        if self._heap[0][1] == token and self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    def _ensure_scheduler(self, loop: asyncio.AbstractEventLoop):
+        if self._scheduler is None or self._scheduler.done() or self._scheduler.get_loop() is not loop:
+            self._scheduler = loop.create_task(self._run_scheduler())
+
+    async def _run_scheduler(self):
+        """Single task that fires every due deadline."""
+        loop = asyncio.get_running_loop()
+        fired = 0
+        while True:
+            if not self._heap:
+                self._wakeup = loop.create_future()
+                await self._wakeup
+                continue
+
+            deadline, token, phone_number = self._heap[0]
+            now = loop.time()
+            if deadline > now:
+                self._wakeup = loop.create_future()
+                timer = loop.call_at(deadline + self.tick_seconds, _resolve, self._wakeup)
                 try:
-                    await pending.task
-                except asyncio.CancelledError:
-                    pass
-        
-        # Add message to buffer
-        if phone_number not in self.message_buffers:
-            self.message_buffers[phone_number] = []
-        self.message_buffers[phone_number].append(message_text)
-        
-        # Wait for debounce delay
-        await asyncio.sleep(self.delay_seconds)
-        
-        # Check if this is still the latest message (no new messages arrived)
-        # If buffer has more messages, we were superseded
-        current_buffer = self.message_buffers.get(phone_number, [])
-        
-        if current_buffer and current_buffer[-1] == message_text:
-            # This is the latest message, process all buffered messages
-            combined_message = " ".join(current_buffer)
-            
-            # Clear buffer
-            self.message_buffers[phone_number] = []
-            
-            # Remove from pending
-            if phone_number in self.pending_messages:
-                del self.pending_messages[phone_number]
-            
-            # Execute callback
-            return await process_callback(phone_number, combined_message, payload_data)
-        
-        # Superseded by newer message, return None
-        return None
-    
+                    await self._wakeup
+                finally:
+                    timer.cancel()
+                continue
+
+            heapq.heappop(self._heap)
+            pending = self.pending_messages.get(phone_number)
+            if pending is None or pending.token != token:
+                continue  # already flushed or cancelled
+            if pending.deadline > now:
+                # Deadline was extended by a newer message
+                heapq.heappush(self._heap, (pending.deadline, token, phone_number))
+                continue
+            self._flush(pending)
+
+            # Let flushed callbacks start when many deadlines expire together
+            fired += 1
+            if fired % _FLUSH_BATCH == 0:
+                await asyncio.sleep(0)
+
+    def _flush(self, pending: PendingMessage):
+        """Removes the phone's buffer and runs the callback in its own task."""
+        del self.pending_messages[pending.phone_number]
+        if self._peak_pending > _SHRINK_MIN and len(self.pending_messages) < self._peak_pending // 4:
+            self.pending_messages = dict(self.pending_messages)
+            self._peak_pending = len(self.pending_messages)
+        now = asyncio.get_running_loop().time()
+        observe_stage("debounce_wait", now - pending.first_at)
+        self.wait_stats.record(now - pending.first_at)
+        self.flushes += 1
+        self.merged_messages += len(pending.messages)
+        flushes_total.inc()
+        messages_total.inc(amount=len(pending.messages))
+        if self.policy is not None:
+            self.policy.on_flush(pending.phone_number, len(pending.messages), now)
+        task = asyncio.create_task(self._process(pending))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _process(self, pending: PendingMessage):
+        messages, payload_data = pending.messages, pending.payload_data
+        waiters = pending.waiters or []
+        try:
+            if self.coordination.shared:
+                claimed = await self.coordination.claim_buffer(pending.phone_number, pending.buffer_token)
+                if claimed is None:
+                    # A newer message reached another worker, which answers
+                    _resolve_all(waiters, None)
+                    return
+                messages, payload_data = claimed
+
+            if pending.restarts:
+                payload_data = {**payload_data, "turn_restarts": pending.restarts}
+
+            # Combine all buffered messages
+            combined_message = " ".join(messages)
+            result = await pending.process_callback(pending.phone_number, combined_message, payload_data)
+        except asyncio.CancelledError:
+            _resolve_all(waiters, None)
+            raise
+        except Exception as e:
+            if not waiters:
+                logger.error("turn_failed", exc_info=e, phone=pending.phone_number, stage="debounce", error=str(e))
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        _resolve_all(waiters, result)
+
     def get_pending_count(self) -> int:
         """Get number of pending messages."""
         return len(self.pending_messages)
-    
+
+    def stats(self) -> dict:
+        return {
+            "mode": "adaptive" if self.policy is not None else "fixed",
+            "delay_seconds": self.delay_seconds,
+            "pending": len(self.pending_messages),
+            "flushes": self.flushes,
+            "messages": self.merged_messages,
+            # Messages per agent turn: higher means fewer LLM calls
+            "merge_ratio": round(self.merged_messages / self.flushes, 2) if self.flushes else 0.0,
+            "wait": self.wait_stats.to_dict(),
+            "adaptive": self.policy.stats() if self.policy is not None else None
+        }
+
     def is_pending(self, phone_number: str) -> bool:
         """Check if user has pending message."""
         return phone_number in self.pending_messages
-    
+
     async def cancel_all(self):
         """Cancel all pending tasks."""
-        for phone_number, pending in self.pending_messages.items():
-            if pending.task and not pending.task.done():
-                pending.task.cancel()
+        for pending in self.pending_messages.values():
+            _resolve_all(pending.waiters, None)
         self.pending_messages.clear()
-        self.message_buffers.clear()
+        self._heap.clear()
+        for task in list(self._flush_tasks):
+            task.cancel()
+        if self._scheduler is not None and not self._scheduler.done():
+            self._scheduler.cancel()
+        self._scheduler = None
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _resolve_all(waiters: Optional[List[asyncio.Future]], result: Any):
+    for waiter in waiters or ():
+        if not waiter.done():
+            waiter.set_result(result)
 
 
 # Global debouncer instance
-debouncer = Debouncer(delay_seconds=7.0)
\ No newline at end of file
+debouncer = Debouncer(
+    delay_seconds=DEBOUNCE_DELAY,
+    policy=AdaptiveDelay(initial_delay=DEBOUNCE_DELAY) if DEBOUNCE_ADAPTIVE else None
+)
@@ -0,0 +1,106 @@
+# Idempotent ingestion of webhook deliveries
+#
+# SpicyTool sends the whole conversation on every delivery and retries
+# deliveries. Only user messages not seen before are fed to the debouncer:
+#   - a bounded LRU of message ids already taken (per phone),
+#   - a per-phone high-water mark (newest timestamp taken), so older history
+#     is never scanned past.
+# The conversation is scanned from the end and stops at the first message
+# already seen. For a phone with no mark yet (new conversation or restart)
+# the scan stops at the agent's last reply: only unanswered messages are new.
+
+import os
+from collections import OrderedDict
+from typing import List
+
+from models.payloads import Message
+from .coordination import coordination as default_coordination
+
+INGEST_DEDUPE_MAX_IDS = int(os.getenv("INGEST_DEDUPE_MAX_IDS", "100000"))
+INGEST_MAX_PHONES = int(os.getenv("INGEST_MAX_PHONES", "100000"))
+
+
+def message_key(message: Message) -> str:
+    """Message id, or timestamp + body for messages without one."""
+    return message.id or str(message.timestamp) + ":" + message.body
+
+
+class MessageDeduper:
+    """Selects the user messages of a delivery that were not processed yet."""
+
+    def __init__(self, max_ids: int = INGEST_DEDUPE_MAX_IDS, max_phones: int = INGEST_MAX_PHONES, coordination=None):
+        self.max_ids = max_ids
+        self.max_phones = max_phones
+        self.coordination = coordination or default_coordination
+        self._seen: "OrderedDict[tuple, None]" = OrderedDict()  # (phone, key)
+        self._marks: "OrderedDict[str, int]" = OrderedDict()  # phone -> newest timestamp
+        self.deliveries = 0
+        self.duplicates = 0
+        self.new_messages = 0
+        self.batched = 0
+
+    def _scan(self, phone_number: str, conversation: List[Message]) -> List[Message]:
+        mark = self._marks.get(phone_number)
+        new = []
+        for message in reversed(conversation):
+            if message.fromMe:
+                if mark is None:
+                    break  # agent's last reply: everything before was answered
+                continue
+            if (phone_number, message_key(message)) in self._seen:
+                break
+            if mark is not None and message.timestamp and message.timestamp < mark:
+                break
+            new.append(message)
+        new.reverse()
+        return new
+
+    def _remember(self, phone_number: str, messages: List[Message]):
+        for message in messages:
+            self._seen[(phone_number, message_key(message))] = None
+        while len(self._seen) > self.max_ids:
+            self._seen.popitem(last=False)
+
+        newest = max([m.timestamp for m in messages] + [self._marks.get(phone_number, 0)])
+        self._marks[phone_number] = newest
+        self._marks.move_to_end(phone_number)
+        while len(self._marks) > self.max_phones:
+            self._marks.popitem(last=False)
+
+    async def select_new(self, phone_number: str, conversation: List[Message]) -> List[Message]:
+        """
+        Returns the unseen user messages of a delivery (oldest first) and
+        marks them as seen. An empty list means the delivery is a duplicate.
+        """
+        self.deliveries += 1
+        new = self._scan(phone_number, conversation)
+        # Marked before any await, so a concurrent retry in this worker sees it
+        if new:
+            self._remember(phone_number, new)
+
+        if new and self.coordination.shared:
+            # Another worker may already have taken a retry of this delivery
+            taken = set(await self.coordination.claim_messages(phone_number, [message_key(m) for m in new]))
+            new = [m for m in new if message_key(m) in taken]
+
+        if not new:
+            self.duplicates += 1
+        else:
+            self.new_messages += len(new)
+            if len(new) > 1:
+                self.batched += 1
+        return new
+
+    def stats(self) -> dict:
+        return {
+            "deliveries": self.deliveries,
+            "duplicates": self.duplicates,
+            "new_messages": self.new_messages,
+            "batched_deliveries": self.batched,
+            "tracked_phones": len(self._marks),
+            "tracked_ids": len(self._seen)
+        }
+
+
+# Global instance
+message_deduper = MessageDeduper()
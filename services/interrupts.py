@@ -0,0 +1,157 @@
+# Interruptible agent turns
+#
+# A message can arrive after the debounce fired, while the agent is still
+# answering the phone's previous messages. Without interrupts that turn
+# finishes and its (now stale) reply is sent, then a second turn answers the
+# new message: two replies and two paid LLM turns.
+#
+# With TURN_INTERRUPTS_ENABLED the running turn is cancelled instead and its
+# text joins the new message's debounce buffer, so one turn answers the
+# merged text. A turn is only interrupted while it has no side effects:
+#   - not after a tool that writes to the CRM started (SIDE_EFFECT_TOOLS),
+#   - not after its reply was produced (it is already being queued),
+#   - not more than TURN_MAX_RESTARTS times in a row (a user who keeps
+#     typing still gets an answer).
+# The events the cancelled turn added to the session are discarded.
+#
+# Both modes count superseded turns, so they can be compared: tokens paid
+# for stale replies (interrupts off, or turn not interruptible) vs tokens
+# avoided and turn time lost by interrupting.
+
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from observability import registry
+from real_estate_agent.callbacks import current_turn
+from .conversation_queue import WaitStats
+from .coordination import coordination as default_coordination
+
+TURN_INTERRUPTS_ENABLED = os.getenv("TURN_INTERRUPTS_ENABLED", "false").lower() in ("true", "1", "yes")
+TURN_MAX_RESTARTS = int(os.getenv("TURN_MAX_RESTARTS", "1"))
+
+interrupts_total = registry.counter("agent_turn_interrupts_total", "Agent turns cancelled by a newer message.")
+superseded_total = registry.counter(
+    "agent_turns_superseded_total",
+    "Agent turns that sent a reply although a newer message had arrived."
+)
+
+
+class Turn:
+    """An agent turn running for a phone."""
+
+    __slots__ = ("phone_number", "message_text", "restarts", "task", "started_at", "wall_started_at",
+                 "tokens", "committed", "superseded", "interrupted")
+
+    def __init__(self, phone_number: str, message_text: str, restarts: int):
+        self.phone_number = phone_number
+        self.message_text = message_text
+        self.restarts = restarts
+        self.task = asyncio.current_task()
+        self.started_at = time.perf_counter()
+        self.wall_started_at = time.time()  # session events of the turn are newer
+        self.tokens = 0  # prompt + output tokens of its LLM calls so far
+        self.committed = False
+        self.superseded = False
+        self.interrupted = False
+
+
+class TurnInterrupts:
+    """Tracks running turns; cancels one when a newer message arrives."""
+
+    def __init__(self, enabled: bool = TURN_INTERRUPTS_ENABLED, max_restarts: int = TURN_MAX_RESTARTS, coordination=None):
+        self.enabled = enabled
+        self.max_restarts = max_restarts
+        self.coordination = coordination or default_coordination
+        self._turns: Dict[str, Turn] = {}
+        self.completed = 0
+        self.completed_tokens = 0
+        self.superseded = 0
+        self.stale_tokens = 0
+        self.interrupted = 0
+        self.interrupted_tokens = 0
+        self.tokens_avoided = 0
+        self.refused_committed = 0
+        self.refused_restarts = 0
+        self.restarted_completed = 0
+        self.lost_time = WaitStats()
+
+    @contextmanager
+    def running(self, phone_number: str, message_text: str, restarts: int = 0):
+        """Marks the phone's turn as running (interruptible) until the reply is ready."""
+        turn = Turn(phone_number, message_text, restarts)
+        self._turns[phone_number] = turn
+        token = current_turn.set(turn)
+        try:
+            yield turn
+        finally:
+            current_turn.reset(token)
+            if self._turns.get(phone_number) is turn:
+                del self._turns[phone_number]
+            if not turn.interrupted:
+                self.completed += 1
+                self.completed_tokens += turn.tokens
+                if turn.restarts:
+                    self.restarted_completed += 1
+                if turn.superseded:
+                    self.stale_tokens += turn.tokens
+
+    def interrupt(self, phone_number: str) -> Optional[Turn]:
+        """
+        Called when a message arrives for the phone. Cancels its running turn
+        if allowed and returns it (its text must be answered again), else None.
+        """
+        turn = self._turns.get(phone_number)
+        if turn is None or turn.superseded:
+            return None
+        turn.superseded = True
+        if not self.enabled or self.coordination.shared:
+            # Multi-worker: the shared buffer only has the new message
+            superseded_total.inc()
+            self.superseded += 1
+            return None
+        if turn.committed or turn.restarts >= self.max_restarts:
+            if turn.committed:
+                self.refused_committed += 1
+            else:
+                self.refused_restarts += 1
+            superseded_total.inc()
+            self.superseded += 1
+            return None
+
+        del self._turns[phone_number]
+        turn.interrupted = True
+        turn.task.cancel()
+        interrupts_total.inc()
+        self.interrupted += 1
+        self.interrupted_tokens += turn.tokens
+        # Estimate: an average turn, minus what this one already spent
+        if self.completed:
+            self.tokens_avoided += max(0, round(self.completed_tokens / self.completed) - turn.tokens)
+        self.lost_time.record(time.perf_counter() - turn.started_at)
+        return turn
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": len(self._turns),
+            "completed": self.completed,
+            "avg_turn_tokens": round(self.completed_tokens / self.completed) if self.completed else 0,
+            # Stale replies: turns answered although a newer message arrived
+            "superseded": self.superseded,
+            "stale_reply_tokens": self.stale_tokens,
+            "interrupted": self.interrupted,
+            "interrupted_tokens_spent": self.interrupted_tokens,
+            "tokens_avoided_estimate": self.tokens_avoided,
+            "refused_committed": self.refused_committed,
+            "refused_max_restarts": self.refused_restarts,
+            "restarted_completed": self.restarted_completed,
+            # Turn time thrown away: extra latency of the merged answer
+            "lost_turn_time": self.lost_time.to_dict()
+        }
+
+
+# Global instance
+turn_interrupts = TurnInterrupts()
@@ -0,0 +1,171 @@
+# Jobs: webhook deliveries whose reply the caller wants back
+#
+# POST /webhook/whatsapp/jobs returns a job id right away instead of holding
+# the connection for the debounce delay plus the agent turn. The result (a
+# WebhookResponse) is read from GET /jobs/{id}, long-polled (?wait=seconds)
+# or streamed as Server-Sent Events (Accept: text/event-stream).
+#
+# Results live in a bounded in-memory store: a finished job expires
+# JOB_RESULT_TTL_SECONDS after it finished, and past JOB_MAX_JOBS the oldest
+# jobs are dropped (their turn still runs; only the result is forgotten).
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Optional
+
+from models.payloads import JobResponse, WebhookResponse
+from observability import get_logger
+
+JOB_MAX_JOBS = int(os.getenv("JOB_MAX_JOBS", "10000"))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "300"))
+# Longest a single GET /jobs/{id} long-poll waits
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", "30"))
+# SSE comment sent while the job runs, so proxies keep the stream open
+SSE_KEEPALIVE_SECONDS = 15.0
+
+logger = get_logger("services.jobs")
+
+
+class Job:
+    """One delivery waiting for its WebhookResponse."""
+
+    __slots__ = ("id", "phone_number", "created_at", "finished_at", "response", "error", "_done")
+
+    def __init__(self, phone_number: str):
+        self.id = uuid.uuid4().hex
+        self.phone_number = phone_number
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.response: Optional[WebhookResponse] = None
+        self.error: Optional[BaseException] = None
+        self._done = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the job is finished (or timeout seconds). Returns done."""
+        if not self.done:
+            try:
+                await asyncio.wait_for(self._done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.done
+
+    def to_response(self) -> JobResponse:
+        return JobResponse(job_id=self.id, status="done" if self.done else "pending", result=self.response)
+
+
+class JobStore:
+    """Bounded store of jobs, oldest first; a job moves to the end when it finishes."""
+
+    def __init__(self, max_jobs: int = JOB_MAX_JOBS, ttl_seconds: float = JOB_RESULT_TTL_SECONDS):
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._tasks: set = set()
+        self.created = 0
+        self.completed = 0
+        self.failed = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def create(self, phone_number: str) -> Job:
+        self._expire(time.monotonic())
+        job = Job(phone_number)
+        self._jobs[job.id] = job
+        self.created += 1
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+            self.evicted += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """The job, or None if unknown, expired or evicted."""
+        self._expire(time.monotonic())
+        return self._jobs.get(job_id)
+
+    def finish(self, job: Job, response: WebhookResponse):
+        job.response = response
+        self._finished(job)
+        self.completed += 1
+
+    def run(self, job: Job, answer: Awaitable[WebhookResponse]):
+        """Runs `answer` in its own task; the job finishes with its result."""
+        task = asyncio.create_task(self._run(job, answer))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: Job, answer: Awaitable[WebhookResponse]):
+        try:
+            response = await answer
+        except asyncio.CancelledError:
+            self._fail(job, None)
+            raise
+        except Exception as e:
+            logger.error("job_failed", exc_info=e, phone=job.phone_number, stage="jobs", job_id=job.id)
+            self._fail(job, e)
+            return
+        self.finish(job, response)
+
+    def _fail(self, job: Job, error: Optional[BaseException]):
+        job.error = error
+        job.response = WebhookResponse(status="error")
+        self._finished(job)
+        self.failed += 1
+
+    def _finished(self, job: Job):
+        job.finished_at = time.monotonic()
+        job._done.set()
+        # Finished jobs stay in the order they finished, for _expire
+        if job.id in self._jobs:
+            self._jobs.move_to_end(job.id)
+
+    def _expire(self, now: float):
+        # Skip running jobs; finished ones are in finish order, so stop at the
+        # first one not expired yet
+        expired = []
+        for job_id, job in self._jobs.items():
+            if job.finished_at is None:
+                continue
+            if now - job.finished_at < self.ttl_seconds:
+                break
+            expired.append(job_id)
+        for job_id in expired:
+            del self._jobs[job_id]
+        self.expired += len(expired)
+
+    async def cancel_all(self):
+        """Cancels running jobs (shutdown); their waiters get an error result."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "jobs": len(self._jobs),
+            "running": len(self._tasks),
+            "max_jobs": self.max_jobs,
+            "created": self.created,
+            "completed": self.completed,
+            "failed": self.failed,
+            "expired": self.expired,
+            "evicted": self.evicted
+        }
+
+
+async def sse_events(job: Job, keepalive: float = SSE_KEEPALIVE_SECONDS):
+    """Server-Sent Events for a job: a keepalive comment while it runs, then one `result` event."""
+    while not await job.wait(keepalive):
+        yield ": keepalive\n\n"
+    yield "event: result\ndata: " + json.dumps(job.to_response().model_dump(mode="json")) + "\n\n"
+
+
+# Global instance
+job_store = JobStore()
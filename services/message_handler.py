@@ -1,13 +1,24 @@
 # Handler for processing messages and sending responses
 
+import time
+
+from observability import get_logger, start_trace, elapsed_ms
+from resilience import deadline, TURN_DEADLINE_SECONDS
 from .agent_runner import process_message
-from .whatsapp import send_whatsapp_message
+from .outbox import outbox
+from .conversation_queue import conversation_queue
+from .interrupts import turn_interrupts
+
+logger = get_logger("services.message_handler")
 
 
 async def process_and_respond(phone_number: str, message_text: str, payload_data: dict) -> dict:
     """
-    Process message with agent and send response to WhatsApp.
+    Process message with agent and queue the response for WhatsApp.
     This is called after debounce delay.
+    Turns of the same phone number run one at a time, in order.
+    Returns once the reply is stored in the outbox; sender workers deliver
+    it (with retries, see services/outbox.py).
     
     Args:
         phone_number: User phone number
@@ -15,37 +26,58 @@ async def process_and_respond(phone_number: str, message_text: str, payload_data
         payload_data: Additional data (userEmail, contactId, etc)
         
     Returns:
-        dict with agent_response and whatsapp_result
+        dict with agent_response and whatsapp_result (202 once queued)
     """
-    print("🔄 Processing debounced message from " + phone_number + ": " + message_text)
-    
-    # Process with agent
-    agent_response = await process_message(
-        phone_number=phone_number,
-        message_text=message_text
-    )
+    # Same trace as the webhook request that delivered the last message
+    start_trace(payload_data.get("trace_id"))
+    started = time.perf_counter()
+    if conversation_queue.depth(phone_number):
+        logger.info("turn_queued", phone=phone_number, stage="queue", depth=conversation_queue.depth(phone_number))
+
+    async with conversation_queue.turn(phone_number):
+        logger.info(
+            "turn_started", phone=phone_number, stage="agent", body=message_text,
+            queue_wait_ms=elapsed_ms(started)
+        )
+        agent_started = time.perf_counter()
     
-    print("🤖 Agent response: " + agent_response.message[:50] + "...")
+        # Process with agent; a newer message may cancel it (services/interrupts.py).
+        # The turn's budget starts now, after its wait in the queue: every
+        # CRM/location/model call of the turn is bounded by it.
+        with (
+            turn_interrupts.running(phone_number, message_text, payload_data.get("turn_restarts", 0)),
+            deadline(TURN_DEADLINE_SECONDS)
+        ):
+            agent_response = await process_message(
+                phone_number=phone_number,
+                message_text=message_text
+            )
     
-    # Send response to WhatsApp
-    whatsapp_result = await send_whatsapp_message(
-        user_email=payload_data.get("userEmail", ""),
-        conversation_id=phone_number,
-        message=agent_response.message
-    )
+        logger.info(
+            "agent_replied", phone=phone_number, stage="agent", reply=agent_response.message,
+            duration_ms=elapsed_ms(agent_started)
+        )
     
-    # Log result
-    if whatsapp_result["success"]:
-        print("✅ Message sent to " + phone_number)
-    else:
-        print("❌ Failed to send message: " + str(whatsapp_result["status_code"]))
+        # Queue response for WhatsApp
+        outbox_id = await outbox.enqueue(
+            user_email=payload_data.get("userEmail", ""),
+            conversation_id=phone_number,
+            message=agent_response.message
+        )
+        whatsapp_result = {
+            "success": True,
+            "status_code": 202,
+            "response": "queued",
+            "outbox_id": outbox_id
+        }
+        logger.info("reply_queued", phone=phone_number, stage="outbox", outbox_id=outbox_id, duration_ms=elapsed_ms(started))
     
-    # Handle escalation
-    if agent_response.should_escalate:
-        print("⚠️ ESCALATION NEEDED for " + phone_number)
-        # TODO: Notify human agent (Slack, email, CRM, etc.)
+        # Handle escalation
+        if agent_response.should_escalate:
+            logger.warning("escalation_needed", phone=phone_number, stage="agent")
+            # TODO: Notify human agent (Slack, email, CRM, etc.)
     
-    return {
-        "agent_response": agent_response,
-        "whatsapp_result": whatsapp_result
-    }
\ No newline at end of file
+        return {
+            "agent_response": agent_response,
+            "whatsapp_result": whatsapp_result
+        }
\ No newline at end of file
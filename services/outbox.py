@@ -0,0 +1,400 @@
+# Durable outbox for outgoing WhatsApp replies
+#
+# A reply costs an LLM call, so it is not dropped when SpicyTool times out
+# or fails. process_and_respond stores the reply in a SQLite outbox and
+# returns; a pool of sender workers drains it:
+#   - failed sends (timeouts, 429, 5xx) are retried with jittered
+#     exponential backoff, up to OUTBOX_MAX_ATTEMPTS; other errors are final,
+#   - each account (userEmail) has a token bucket, so one busy account
+#     cannot exceed SpicyTool's rate limit or starve the others,
+#   - replies of one conversation are delivered in order (a reply waits
+#     while an older one of the same conversation is unsent),
+#   - a reply being sent is leased, so rows left by a crashed worker are
+#     sent again after the lease expires,
+#   - an unexpected error while sending is logged and counts as a failed
+#     attempt; the worker keeps running.
+# The file can be shared by several workers on one host (rows are claimed
+# in a write transaction).
+
+import asyncio
+import os
+import random
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from observability import get_logger
+from .conversation_queue import WaitStats
+from .db import transaction
+from .whatsapp import send_whatsapp_message
+
+OUTBOX_DB_PATH = os.getenv("OUTBOX_DB_PATH", "outbox.db")
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "1"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "300"))
+# Messages per second per account, and how many can go out in a burst
+OUTBOX_RATE_PER_SECOND = float(os.getenv("OUTBOX_RATE_PER_SECOND", "5"))
+OUTBOX_RATE_BURST = float(os.getenv("OUTBOX_RATE_BURST", "10"))
+# A claimed reply is sent again if its worker does not finish in time
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+# Delivered and failed rows are kept this long (seconds)
+OUTBOX_RETENTION = float(os.getenv("OUTBOX_RETENTION", "86400"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_email TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_owner TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    last_status_code INTEGER,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS outbox_conversation ON outbox (conversation_id, status);
+"""
+
+logger = get_logger("services.outbox")
+
+# Row statuses
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+# Longest a worker sleeps before checking for due rows again (seconds)
+_IDLE_POLL = 1.0
+# Queue depth is re-counted at most this often (seconds)
+_DEPTH_REFRESH = 1.0
+
+
+def is_retryable(status_code: int) -> bool:
+    """Timeouts, rate limiting and server errors are worth retrying."""
+    return status_code in (408, 425, 429) or status_code >= 500
+
+
+def backoff_delay(attempts: int, base: float = OUTBOX_BACKOFF_BASE, cap: float = OUTBOX_BACKOFF_MAX) -> float:
+    """Full-jitter exponential backoff after the given number of failed attempts."""
+    return random.uniform(0, min(cap, base * 2 ** (attempts - 1)))
+
+
+class TokenBucket:
+    """Allows `rate` events per second with bursts of up to `burst`."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Takes one token if available.
+
+        Returns:
+            0 if taken, otherwise the seconds until a token is available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Outbox:
+    """
+    SQLite outbox of replies plus the sender workers that deliver them.
+
+    Database calls run on a single background thread, like the session store.
+    """
+
+    def __init__(
+        self,
+        db_path: str = OUTBOX_DB_PATH,
+        workers: int = OUTBOX_WORKERS,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        rate_per_second: float = OUTBOX_RATE_PER_SECOND,
+        rate_burst: float = OUTBOX_RATE_BURST,
+        send=None
+    ):
+        self.db_path = db_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.rate_per_second = rate_per_second
+        self.rate_burst = rate_burst
+        self.send = send or send_whatsapp_message
+        self.worker_id = uuid.uuid4().hex[:12]
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self._conn = None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._depth = 0
+        self._depth_at = 0.0
+        self._finished = 0
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.throttled = 0
+        self.deferred = 0
+        self.errors = 0
+        self.delivery_latency = WaitStats()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=10.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # ---------- database ----------
+
+    def _db_enqueue(self, user_email: str, conversation_id: str, message: str) -> int:
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO outbox (user_email, conversation_id, message, status, next_attempt_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (user_email, conversation_id, message, PENDING, now, now)
+        )
+        return cursor.lastrowid
+
+    def _db_claim(self, owner: str) -> tuple:
+        """Takes the next due reply. Returns (row or None, seconds until the next one is due)."""
+        conn = self._connection()
+        now = time.time()
+        with transaction(conn):
+            # Leases of crashed or stopped workers
+            conn.execute(
+                "UPDATE outbox SET status = ?, lease_owner = NULL WHERE status = ? AND next_attempt_at <= ?",
+                (PENDING, SENDING, now)
+            )
+            row = conn.execute(
+                "SELECT id, user_email, conversation_id, message, attempts, created_at FROM outbox AS o "
+                "WHERE status = ? AND next_attempt_at <= ? AND NOT EXISTS ("
+                "  SELECT 1 FROM outbox AS older WHERE older.conversation_id = o.conversation_id "
+                "  AND older.status IN (?, ?) AND older.id < o.id"
+                ") ORDER BY next_attempt_at LIMIT 1",
+                (PENDING, now, PENDING, SENDING)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE outbox SET status = ?, lease_owner = ?, next_attempt_at = ? WHERE id = ?",
+                    (SENDING, owner, now + OUTBOX_LEASE_SECONDS, row[0])
+                )
+                next_due = 0.0
+            else:
+                due = conn.execute(
+                    "SELECT MIN(next_attempt_at) FROM outbox WHERE status IN (?, ?)", (PENDING, SENDING)
+                ).fetchone()[0]
+                next_due = _IDLE_POLL if due is None else min(_IDLE_POLL, max(0.0, due - now))
+        return row, next_due
+
+    def _db_release(self, row_id: int, owner: str, delay: float):
+        """Puts a claimed reply back without counting an attempt (rate limited, shutdown)."""
+        self._connection().execute(
+            "UPDATE outbox SET status = ?, lease_owner = NULL, next_attempt_at = ? WHERE id = ? AND lease_owner = ?",
+            (PENDING, time.time() + delay, row_id, owner)
+        )
+
+    def _db_finish(self, row_id: int, owner: str, status: str, attempts: int, status_code: Optional[int], error: Optional[str], retry_in: float):
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "UPDATE outbox SET status = ?, attempts = ?, lease_owner = NULL, next_attempt_at = ?, "
+            "finished_at = ?, last_status_code = ?, last_error = ? WHERE id = ? AND lease_owner = ?",
+            (status, attempts, now + retry_in, now if status in (SENT, FAILED) else None,
+             status_code, error, row_id, owner)
+        )
+        self._finished += 1
+        if self._finished % 1000 == 0:
+            conn.execute(
+                "DELETE FROM outbox WHERE status IN (?, ?) AND finished_at < ?",
+                (SENT, FAILED, now - OUTBOX_RETENTION)
+            )
+
+    def _db_depth(self) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM outbox WHERE status IN (?, ?)", (PENDING, SENDING)
+        ).fetchone()[0]
+
+    # ---------- API ----------
+
+    async def enqueue(self, user_email: str, conversation_id: str, message: str) -> int:
+        """Stores a reply for delivery. Returns the outbox id once it is on disk."""
+        row_id = await self._run(self._db_enqueue, user_email, conversation_id, message)
+        self.enqueued += 1
+        self._depth += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return row_id
+
+    async def start(self):
+        """Starts the sender workers. Called on webhook startup."""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._depth = await self._run(self._db_depth)
+        self._tasks = [
+            asyncio.create_task(self._worker(self.worker_id + "-" + str(i)))
+            for i in range(self.workers)
+        ]
+        if self._depth:
+            logger.info("outbox_recovered", stage="outbox", pending=self._depth)
+
+    async def stop(self):
+        """Stops the sender workers; unsent replies stay in the outbox."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- sender workers ----------
+
+    def _bucket(self, user_email: str) -> TokenBucket:
+        bucket = self._buckets.get(user_email)
+        if bucket is None:
+            bucket = self._buckets[user_email] = TokenBucket(self.rate_per_second, self.rate_burst)
+        return bucket
+
+    async def _worker(self, owner: str):
+        failures = 0  # in a row, for the backoff when the database itself fails
+        while True:
+            row = None
+            try:
+                row, next_due = await self._run(self._db_claim, owner)
+                if row is None:
+                    await self._idle(next_due)
+                else:
+                    await self._deliver(owner, row)
+                failures = 0
+            except asyncio.CancelledError:
+                if row is not None:
+                    await asyncio.shield(self._run(self._db_release, row[0], owner, 0.0))
+                raise
+            except Exception as e:
+                # A bug or a database error must not kill the worker
+                failures += 1
+                await self._recover(owner, row, e, failures)
+
+    async def _recover(self, owner: str, row: Optional[tuple], error: Exception, failures: int):
+        """Backs off the reply whose delivery raised (counting an attempt), or the worker if none was claimed."""
+        self.errors += 1
+        if row is None:
+            delay = max(_IDLE_POLL, backoff_delay(failures))
+            logger.error("outbox_worker_error", exc_info=error, stage="outbox", error=str(error), retry_in_s=round(delay, 1))
+            await asyncio.sleep(delay)
+            return
+
+        row_id, conversation_id, attempts = row[0], row[2], row[4] + 1
+        status = PENDING if attempts < self.max_attempts else FAILED
+        delay = backoff_delay(attempts) if status == PENDING else 0.0
+        logger.error(
+            "outbox_worker_error", exc_info=error, phone=conversation_id, stage="outbox", outbox_id=row_id,
+            error=str(error), attempts=attempts, retry_in_s=round(delay, 1)
+        )
+        try:
+            await self._run(self._db_finish, row_id, owner, status, attempts, None, repr(error)[:500], delay)
+        except Exception:
+            # Left leased: claimed again once OUTBOX_LEASE_SECONDS pass
+            await asyncio.sleep(max(_IDLE_POLL, backoff_delay(failures)))
+            return
+        if status == FAILED:
+            self.failed += 1
+            self._depth -= 1
+
+    async def _idle(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+        if time.monotonic() - self._depth_at > _DEPTH_REFRESH:
+            self._depth_at = time.monotonic()
+            self._depth = await self._run(self._db_depth)
+
+    async def _deliver(self, owner: str, row: tuple):
+        row_id, user_email, conversation_id, message, attempts, created_at = row
+
+        wait = self._bucket(user_email).take()
+        if wait:
+            # Over the account's rate: leave the worker free for other accounts
+            self.throttled += 1
+            await self._run(self._db_release, row_id, owner, wait)
+            return
+
+        result = await self.send(user_email=user_email, conversation_id=conversation_id, message=message)
+        if result.get("retry_in") is not None:
+            # SpicyTool circuit open: nothing was sent, so no attempt is used up
+            self.deferred += 1
+            await self._run(self._db_release, row_id, owner, result["retry_in"])
+            return
+        attempts += 1
+        status_code = result["status_code"]
+
+        if result["success"]:
+            await self._run(self._db_finish, row_id, owner, SENT, attempts, status_code, None, 0.0)
+            self.sent += 1
+            self._depth -= 1
+            self.delivery_latency.record(time.time() - created_at)
+            logger.info(
+                "message_sent", phone=conversation_id, stage="whatsapp_send", attempts=attempts,
+                duration_ms=round((time.time() - created_at) * 1000, 1)
+            )
+        elif is_retryable(status_code) and attempts < self.max_attempts:
+            delay = backoff_delay(attempts)
+            await self._run(self._db_finish, row_id, owner, PENDING, attempts, status_code, result["response"][:500], delay)
+            self.retries += 1
+            logger.warning(
+                "send_retry", phone=conversation_id, stage="whatsapp_send", status_code=status_code,
+                attempts=attempts, retry_in_s=round(delay, 1)
+            )
+        else:
+            await self._run(self._db_finish, row_id, owner, FAILED, attempts, status_code, result["response"][:500], 0.0)
+            self.failed += 1
+            self._depth -= 1
+            logger.error(
+                "send_failed", phone=conversation_id, stage="whatsapp_send", status_code=status_code,
+                attempts=attempts
+            )
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "depth": max(0, self._depth),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "deferred": self.deferred,
+            "errors": self.errors,
+            "delivery_latency": self.delivery_latency.to_dict()
+        }
+
+
+# Global instance
+outbox = Outbox()
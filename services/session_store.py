@@ -0,0 +1,499 @@
+# Persistent session service: SQLite (WAL) on disk + bounded LRU hot tier in memory
+
+import asyncio
+import copy
+import json
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events.event import Event
+from google.adk.sessions.base_session_service import BaseSessionService, GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.session import Session
+from google.adk.sessions.state import State
+
+from .db import transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    last_update_time REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (app_name, user_id, session_id)
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    archived INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS events_by_session ON events (app_name, user_id, session_id, seq);
+CREATE TABLE IF NOT EXISTS app_states (
+    app_name TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_states (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id)
+);
+"""
+
+
+def _split_state(state: dict) -> tuple:
+    """Splits a state dict into (app, user, session) parts by key prefix."""
+    app, user, session = {}, {}, {}
+    for key, value in (state or {}).items():
+        if key.startswith(State.APP_PREFIX):
+            app[key[len(State.APP_PREFIX):]] = value
+        elif key.startswith(State.USER_PREFIX):
+            user[key[len(State.USER_PREFIX):]] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session[key] = value
+    return app, user, session
+
+
+def _light_copy(session: Session) -> Session:
+    """Copy of the session whose events list and state can be changed safely."""
+    copied = session.model_copy(deep=False)
+    copied.events = list(session.events)
+    copied.state = dict(session.state)
+    return copied
+
+
+class SqliteSessionService(BaseSessionService):
+    """
+    Session service backed by SQLite in WAL mode.
+
+    - Every write goes to disk: a new event is one INSERT (history is never
+      rewritten) plus an UPDATE of the session row's state.
+    - Recently used sessions are kept in a bounded LRU hot tier, so a lookup
+      for an active conversation does not touch the database.
+    - Sessions idle for more than idle_seconds, or beyond max_hot_sessions,
+      are dropped from memory (they are already on disk).
+    - Database calls run on a single background thread so they never block
+      the event loop. Each write is one transaction, rolled back on any
+      error. The in-memory app:/user: state is only changed on the event
+      loop; the store thread hands back new dicts.
+    - shared=True when several workers use the same file: each write bumps
+      the session's version, and a hot session is reloaded if another
+      worker changed it.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "sessions.db",
+        max_hot_sessions: int = 10000,
+        idle_seconds: float = 1800.0,
+        shared: bool = False
+    ):
+        self.db_path = db_path
+        self.max_hot_sessions = max_hot_sessions
+        self.idle_seconds = idle_seconds
+        self.shared = shared
+        self._hot: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (last_access, Session, version)
+        self._app_state: dict = {}
+        self._user_state: dict = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-store")
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self.hot_hits = 0
+        self.cold_loads = 0
+        self.evictions = 0
+        self.stale_reloads = 0
+
+    def _migrate(self):
+        """Adds columns missing from databases created by older versions."""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(events)")]
+        if "archived" not in columns:
+            self._conn.execute("ALTER TABLE events ADD COLUMN archived INTEGER NOT NULL DEFAULT 0")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")]
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    # ---------- helpers ----------
+
+    async def _run(self, fn, *args):
+        """Runs a database function on the store's thread."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _remember(self, key: tuple, session: Session, version: int):
+        now = time.monotonic()
+        self._hot[key] = (now, session, version)
+        self._hot.move_to_end(key)
+        self._evict(now)
+
+    def _evict(self, now: float):
+        while len(self._hot) > self.max_hot_sessions:
+            self._hot.popitem(last=False)
+            self.evictions += 1
+        # Oldest entries are first: stop at the first one that is not idle
+        while self._hot:
+            key, entry = next(iter(self._hot.items()))
+            if now - entry[0] < self.idle_seconds:
+                break
+            self._hot.popitem(last=False)
+            self.evictions += 1
+
+    def _merge_state(self, session: Session) -> Session:
+        """Returns a copy of the session with app: and user: state merged in."""
+        copied = _light_copy(session)
+        for key, value in self._app_state.get(session.app_name, {}).items():
+            copied.state[State.APP_PREFIX + key] = value
+        for key, value in self._user_state.get((session.app_name, session.user_id), {}).items():
+            copied.state[State.USER_PREFIX + key] = value
+        return copied
+
+    def _install_scoped(self, app_name: str, user_id: str, scoped: tuple):
+        """
+        Keeps app: and user: state read by the store thread (event loop only).
+        Only users that have user state are kept, so memory does not grow
+        with every phone number seen.
+        """
+        app_state, user_state = scoped
+        if app_state is not None:
+            self._app_state[app_name] = app_state
+        if user_state is not None:
+            self._user_state[(app_name, user_id)] = user_state
+
+    def _read_scoped(self, app_name: str, user_id: str) -> tuple:
+        """(app state, user state or None) as stored; new dicts."""
+        row = self._conn.execute("SELECT state FROM app_states WHERE app_name = ?", (app_name,)).fetchone()
+        app_state = json.loads(row[0]) if row else {}
+        row = self._conn.execute(
+            "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+        ).fetchone()
+        return app_state, json.loads(row[0]) if row else None
+
+    def _write_scoped(self, app_name: str, user_id: str, app_delta: dict, user_delta: dict) -> tuple:
+        """Applies the deltas to the stored app:/user: state (inside a transaction)."""
+        app_state, user_state = self._read_scoped(app_name, user_id)
+        if app_delta:
+            app_state.update(app_delta)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO app_states (app_name, state) VALUES (?, ?)",
+                (app_name, json.dumps(app_state))
+            )
+        if user_delta:
+            user_state = {**(user_state or {}), **user_delta}
+            self._conn.execute(
+                "INSERT OR REPLACE INTO user_states (app_name, user_id, state) VALUES (?, ?, ?)",
+                (app_name, user_id, json.dumps(user_state))
+            )
+        return app_state, user_state
+
+    # ---------- database operations (run on the store's thread) ----------
+
+    def _db_create(self, session: Session, app_delta: dict, user_delta: dict) -> Optional[tuple]:
+        """Returns the app:/user: state, or None if the session already exists."""
+        try:
+            with transaction(self._conn):
+                self._conn.execute(
+                    "INSERT INTO sessions (app_name, user_id, session_id, state, last_update_time) VALUES (?, ?, ?, ?, ?)",
+                    (session.app_name, session.user_id, session.id, json.dumps(session.state), session.last_update_time)
+                )
+                return self._write_scoped(session.app_name, session.user_id, app_delta, user_delta)
+        except sqlite3.IntegrityError:
+            return None
+
+    def _db_version(self, app_name: str, user_id: str, session_id: str) -> Optional[int]:
+        row = self._conn.execute(
+            "SELECT version FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?",
+            (app_name, user_id, session_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _db_load(self, app_name: str, user_id: str, session_id: str) -> Optional[tuple]:
+        """Returns (Session, version, app:/user: state), or None if the session does not exist."""
+        # One read transaction: session row and events from the same snapshot
+        with transaction(self._conn, "DEFERRED"):
+            row = self._conn.execute(
+                "SELECT state, last_update_time, version FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (app_name, user_id, session_id)
+            ).fetchone()
+            if row is None:
+                return None
+            events = [
+                Event.model_validate_json(event_row[0])
+                for event_row in self._conn.execute(
+                    "SELECT event FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? AND archived = 0 ORDER BY seq",
+                    (app_name, user_id, session_id)
+                )
+            ]
+            session = Session(
+                app_name=app_name,
+                user_id=user_id,
+                id=session_id,
+                state=json.loads(row[0]),
+                events=events,
+                last_update_time=row[1]
+            )
+            return session, row[2], self._read_scoped(app_name, user_id)
+
+    def _db_append(self, session: Session, event_json: str, state: Optional[dict], app_delta: dict, user_delta: dict) -> tuple:
+        """Returns (version, app:/user: state or None if unchanged)."""
+        scoped = None
+        with transaction(self._conn):
+            self._conn.execute(
+                "INSERT INTO events (app_name, user_id, session_id, event) VALUES (?, ?, ?, ?)",
+                (session.app_name, session.user_id, session.id, event_json)
+            )
+            if state is not None:
+                self._conn.execute(
+                    "UPDATE sessions SET state = ?, last_update_time = ?, version = version + 1 "
+                    "WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                    (json.dumps(state), session.last_update_time, session.app_name, session.user_id, session.id)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE sessions SET last_update_time = ?, version = version + 1 "
+                    "WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                    (session.last_update_time, session.app_name, session.user_id, session.id)
+                )
+            if app_delta or user_delta:
+                scoped = self._write_scoped(session.app_name, session.user_id, app_delta, user_delta)
+            version = self._db_version(session.app_name, session.user_id, session.id)
+        return version, scoped
+
+    def _db_archive(self, session: Session, count: int, state: dict) -> int:
+        with transaction(self._conn):
+            self._conn.execute(
+                "UPDATE events SET archived = 1 WHERE seq IN ("
+                "SELECT seq FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? AND archived = 0 "
+                "ORDER BY seq LIMIT ?)",
+                (session.app_name, session.user_id, session.id, count)
+            )
+            self._conn.execute(
+                "UPDATE sessions SET state = ?, version = version + 1 WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (json.dumps(state), session.app_name, session.user_id, session.id)
+            )
+            return self._db_version(session.app_name, session.user_id, session.id)
+
+    def _db_discard(self, session: Session, since: float) -> int:
+        with transaction(self._conn):
+            self._conn.execute(
+                "UPDATE events SET archived = 1 WHERE app_name = ? AND user_id = ? AND session_id = ? AND archived = 0 "
+                "AND json_extract(event, '$.timestamp') >= ?",
+                (session.app_name, session.user_id, session.id, since)
+            )
+            self._conn.execute(
+                "UPDATE sessions SET version = version + 1 WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (session.app_name, session.user_id, session.id)
+            )
+            return self._db_version(session.app_name, session.user_id, session.id)
+
+    def _db_delete(self, app_name: str, user_id: str, session_id: str):
+        with transaction(self._conn):
+            self._conn.execute(
+                "DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", (app_name, user_id, session_id)
+            )
+            self._conn.execute(
+                "DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?", (app_name, user_id, session_id)
+            )
+
+    def _db_list(self, app_name: str, user_id: Optional[str]) -> list:
+        if user_id is None:
+            rows = self._conn.execute(
+                "SELECT user_id, session_id, state, last_update_time FROM sessions WHERE app_name = ?", (app_name,)
+            ).fetchall()
+        else:
+            rows = self._conn.execute(
+                "SELECT user_id, session_id, state, last_update_time FROM sessions WHERE app_name = ? AND user_id = ?",
+                (app_name, user_id)
+            ).fetchall()
+        return [(row, self._read_scoped(app_name, row[0])) for row in rows]
+
+    # ---------- BaseSessionService ----------
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None
+    ) -> Session:
+        app_delta, user_delta, session_state = _split_state(state)
+        session = Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=(session_id or "").strip() or str(uuid.uuid4()),
+            state=session_state,
+            last_update_time=time.time()
+        )
+        scoped = await self._run(self._db_create, session, app_delta, user_delta)
+        if scoped is None:
+            raise AlreadyExistsError("Session with id " + session.id + " already exists.")
+        self._install_scoped(app_name, user_id, scoped)
+
+        self._remember((app_name, user_id, session.id), session, 0)
+        return self._merge_state(session)
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None
+    ) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        entry = self._hot.get(key)
+        if entry is not None and self.shared:
+            # Another worker may have written to this session
+            if await self._run(self._db_version, app_name, user_id, session_id) != entry[2]:
+                self.stale_reloads += 1
+                self._hot.pop(key, None)
+                entry = None
+        if entry is not None:
+            self.hot_hits += 1
+            session = entry[1]
+            self._remember(key, session, entry[2])
+        else:
+            loaded = await self._run(self._db_load, app_name, user_id, session_id)
+            if loaded is None:
+                return None
+            session, version, scoped = loaded
+            self._install_scoped(app_name, user_id, scoped)
+            self.cold_loads += 1
+            self._remember(key, session, version)
+
+        result = self._merge_state(session)
+        if config:
+            if config.num_recent_events is not None:
+                result.events = result.events[-config.num_recent_events:] if config.num_recent_events else []
+            if config.after_timestamp is not None:
+                result.events = [e for e in result.events if e.timestamp >= config.after_timestamp]
+        return result
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        rows = []
+        for row, scoped in await self._run(self._db_list, app_name, user_id):
+            self._install_scoped(app_name, row[0], scoped)
+            rows.append(row)
+        sessions = [
+            self._merge_state(Session(
+                app_name=app_name,
+                user_id=row[0],
+                id=row[1],
+                state=json.loads(row[2]),
+                last_update_time=row[3]
+            ))
+            for row in rows
+        ]
+        sessions.sort(key=lambda s: (s.last_update_time, s.user_id, s.id))
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self._hot.pop((app_name, user_id, session_id), None)
+        await self._run(self._db_delete, app_name, user_id, session_id)
+
+    async def get_user_state(self, *, app_name: str, user_id: str) -> dict[str, Any]:
+        self._install_scoped(app_name, user_id, await self._run(self._read_scoped, app_name, user_id))
+        return copy.deepcopy(self._user_state.get((app_name, user_id), {}))
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+
+        # Updates the caller's session object (state + events)
+        event = await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+
+        app_delta, user_delta, session_delta = _split_state(event.actions.state_delta if event.actions else None)
+
+        key = (session.app_name, session.user_id, session.id)
+        entry = self._hot.get(key)
+        stored = entry[1] if entry is not None else None
+        if stored is not None and stored is not session:
+            stored.events.append(event)
+            stored.state.update(session_delta)
+            stored.last_update_time = event.timestamp
+
+        # Full session state is small; events are only ever appended
+        full_state = None
+        if session_delta:
+            full_state = dict(stored.state) if stored is not None else _split_state(session.state)[2]
+
+        version, scoped = await self._run(
+            self._db_append,
+            session,
+            event.model_dump_json(exclude_none=True, by_alias=True),
+            full_state,
+            app_delta,
+            user_delta
+        )
+        if scoped is not None:
+            self._install_scoped(session.app_name, session.user_id, scoped)
+        self._set_version(key, version)
+        return event
+
+    async def archive_events(self, session: Session, count: int, state_delta: dict):
+        """
+        Drops the oldest `count` events from the session history and applies
+        state_delta. Archived events stay on disk but are no longer loaded
+        (used by history compaction).
+        """
+        del session.events[:count]
+        session.state.update(state_delta)
+
+        key = (session.app_name, session.user_id, session.id)
+        entry = self._hot.get(key)
+        stored = entry[1] if entry is not None else None
+        if stored is not None and stored is not session:
+            del stored.events[:count]
+            stored.state.update(state_delta)
+
+        state = dict(stored.state) if stored is not None else _split_state(session.state)[2]
+        version = await self._run(self._db_archive, session, count, state)
+        self._set_version(key, version)
+
+    async def discard_events(self, session: Session, since: float):
+        """
+        Drops the events recorded at or after `since` (time.time()) from the
+        session history: the events of an interrupted turn. Like archived
+        events, they stay on disk but are no longer loaded. Writes of those
+        events still in flight run first (single store thread).
+        """
+        session.events[:] = [e for e in session.events if e.timestamp < since]
+
+        key = (session.app_name, session.user_id, session.id)
+        entry = self._hot.get(key)
+        stored = entry[1] if entry is not None else None
+        if stored is not None and stored is not session:
+            stored.events[:] = [e for e in stored.events if e.timestamp < since]
+
+        version = await self._run(self._db_discard, session, since)
+        self._set_version(key, version)
+
+    def _set_version(self, key: tuple, version: int):
+        entry = self._hot.get(key)
+        if entry is not None:
+            self._hot[key] = (entry[0], entry[1], version)
+
+    def stats(self) -> dict:
+        return {
+            "hot_sessions": len(self._hot),
+            "max_hot_sessions": self.max_hot_sessions,
+            "hot_hits": self.hot_hits,
+            "cold_loads": self.cold_loads,
+            "evictions": self.evictions,
+            "stale_reloads": self.stale_reloads
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._conn.close()
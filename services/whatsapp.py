@@ -1,15 +1,181 @@
 # Service for communication with WhatsApp via the SpicyTool API
 
+import asyncio
 import os
+import time
+import weakref
 import httpx
 from dotenv import load_dotenv
+from observability import observe_stage, whatsapp_sends, get_logger
+from resilience import CircuitOpenError, circuit_breaker, remaining
 
 load_dotenv(override=True)
 
+logger = get_logger("services.whatsapp")
+
 # env variables
 SPICYTOOL_API_URL = os.getenv("SPICYTOOL_API_URL", "https://api.spicytool.net/api/webhooks/whatsApp/sendMessage")
 SPICY_API_TOKEN = os.getenv("SPICY_API_TOKEN")
 
+# Connection pool (one client shared by every outbound message)
+WHATSAPP_MAX_CONNECTIONS = int(os.getenv("WHATSAPP_MAX_CONNECTIONS", "20"))
+WHATSAPP_MAX_KEEPALIVE = int(os.getenv("WHATSAPP_MAX_KEEPALIVE", "10"))
+WHATSAPP_KEEPALIVE_EXPIRY = float(os.getenv("WHATSAPP_KEEPALIVE_EXPIRY", "60"))
+WHATSAPP_HTTP2 = os.getenv("WHATSAPP_HTTP2", "false").lower() in ("true", "1", "yes")
+
+# Per-phase timeouts (seconds)
+WHATSAPP_CONNECT_TIMEOUT = float(os.getenv("WHATSAPP_CONNECT_TIMEOUT", "5"))
+WHATSAPP_READ_TIMEOUT = float(os.getenv("WHATSAPP_READ_TIMEOUT", "20"))
+WHATSAPP_WRITE_TIMEOUT = float(os.getenv("WHATSAPP_WRITE_TIMEOUT", "5"))
+WHATSAPP_POOL_TIMEOUT = float(os.getenv("WHATSAPP_POOL_TIMEOUT", "5"))
+
+# A send slower than this counts as a failure for the breaker. While the
+# breaker is open sends fail at once with "retry_in" set, and the outbox
+# puts the reply back without using up an attempt.
+WHATSAPP_SLOW_CALL_SECONDS = float(os.getenv("WHATSAPP_SLOW_CALL_SECONDS", "5"))
+
+whatsapp_breaker = circuit_breaker("whatsapp", slow_call_seconds=WHATSAPP_SLOW_CALL_SECONDS)
+
+_client = None
+_client_loop = None
+
+# Clients created lazily outside the webhook (scripts, tests), one per event
+# loop; each is closed when its loop shuts down. loop -> (client, closer)
+_loop_clients = weakref.WeakKeyDictionary()
+
+
+class PoolStats:
+    """Counters to check connection reuse and pool saturation."""
+
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.pool_timeouts = 0
+        self.total_latency = 0.0
+
+    async def trace(self, event_name: str, info: dict):
+        """httpx trace hook, called by the transport for each connection event."""
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "max_connections": WHATSAPP_MAX_CONNECTIONS,
+            "saturation": round(self.in_flight / WHATSAPP_MAX_CONNECTIONS, 3),
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "pool_timeouts": self.pool_timeouts,
+            "avg_latency_ms": round(self.total_latency / self.requests * 1000, 1) if self.requests else 0.0,
+            "http2": _http2_enabled()
+        }
+
+
+pool_stats = PoolStats()
+
+
+def _http2_enabled() -> bool:
+    """HTTP/2 needs the optional "h2" package (pip install httpx[http2])."""
+    if not WHATSAPP_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _new_client(transport: httpx.AsyncBaseTransport = None) -> httpx.AsyncClient:
+    """Creates the pooled client used for every outbound message."""
+    return httpx.AsyncClient(
+        http2=_http2_enabled(),
+        transport=transport,
+        timeout=httpx.Timeout(
+            connect=WHATSAPP_CONNECT_TIMEOUT,
+            read=WHATSAPP_READ_TIMEOUT,
+            write=WHATSAPP_WRITE_TIMEOUT,
+            pool=WHATSAPP_POOL_TIMEOUT
+        ),
+        limits=httpx.Limits(
+            max_connections=WHATSAPP_MAX_CONNECTIONS,
+            max_keepalive_connections=WHATSAPP_MAX_KEEPALIVE,
+            keepalive_expiry=WHATSAPP_KEEPALIVE_EXPIRY
+        )
+    )
+
+
+async def _close_on_loop_shutdown(client: httpx.AsyncClient):
+    """Parked at its yield until asyncio.run() closes the loop's async generators."""
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+async def open_client(transport: httpx.AsyncBaseTransport = None):
+    """
+    Opens the shared WhatsApp client. Called on webhook startup.
+
+    Args:
+        transport: httpx transport to use instead of the network (tests)
+    """
+    global _client, _client_loop
+    if WHATSAPP_HTTP2 and not _http2_enabled():
+        logger.warning("http2_unavailable", hint="WHATSAPP_HTTP2 is set but 'h2' is not installed, using HTTP/1.1")
+    if _client is None or _client.is_closed:
+        _client = _new_client(transport)
+        _client_loop = asyncio.get_running_loop()
+    return _client
+
+
+async def close_client():
+    """Closes the shared WhatsApp client. Called on webhook shutdown."""
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+async def get_client() -> httpx.AsyncClient:
+    """
+    Returns the shared client. Outside the webhook a client is created
+    lazily for the running event loop, and closed when that loop shuts down.
+    """
+    loop = asyncio.get_running_loop()
+    if _client is not None and not _client.is_closed and _client_loop is loop:
+        return _client
+
+    entry = _loop_clients.get(loop)
+    if entry is None or entry[0].is_closed:
+        client = _new_client()
+        closer = _close_on_loop_shutdown(client)
+        await closer.asend(None)
+        # The loop only holds a weak reference to the generator
+        entry = _loop_clients[loop] = (client, closer)
+    return entry[0]
+
+
+def request_timeout():
+    """Per-phase timeouts of a send, each cut to what is left of the turn's deadline (if any)."""
+    left = remaining()
+    if left is None:
+        return httpx.USE_CLIENT_DEFAULT
+    left = max(0.001, left)
+    return httpx.Timeout(
+        connect=min(WHATSAPP_CONNECT_TIMEOUT, left),
+        read=min(WHATSAPP_READ_TIMEOUT, left),
+        write=min(WHATSAPP_WRITE_TIMEOUT, left),
+        pool=min(WHATSAPP_POOL_TIMEOUT, left)
+    )
+
 
 async def send_whatsapp_message(user_email: str, conversation_id: str, message: str) -> dict:
     """Sends a message to WhatsApp through the SpicyTool API."""
@@ -18,42 +184,73 @@ async def send_whatsapp_message(user_email: str, conversation_id: str, message:
         "conversationId": conversation_id,
         "message": message
     }
-    
+
     headers = {
         "Content-Type": "application/json",
-        "x-webhook-token": SPICY_API_TOKEN
+        "x-webhook-token": SPICY_API_TOKEN or ""
     }
-    
+
+    pool_stats.requests += 1
+    pool_stats.in_flight += 1
+    pool_stats.peak_in_flight = max(pool_stats.peak_in_flight, pool_stats.in_flight)
+    started = time.perf_counter()
+    timeout = request_timeout()
     try:
-        async with httpx.AsyncClient() as client:
+        with whatsapp_breaker.attempt() as attempt:
+            client = await get_client()
             response = await client.post(
                 SPICYTOOL_API_URL,
                 json=payload,
                 headers=headers,
-                timeout=30.0
+                timeout=timeout,
+                extensions={"trace": pool_stats.trace}
             )
-            return {
-                "success": response.status_code == 200,
-                "status_code": response.status_code,
-                "response": response.text
-            }
+            if response.status_code >= 500 or response.status_code == 429:
+                attempt.fail()
+        result = {
+            "success": response.status_code == 200,
+            "status_code": response.status_code,
+            "response": response.text
+        }
+    except CircuitOpenError as e:
+        result = {
+            "success": False,
+            "status_code": 503,
+            "response": str(e),
+            "retry_in": e.retry_in
+        }
+    except httpx.PoolTimeout:
+        pool_stats.pool_timeouts += 1
+        result = {
+            "success": False,
+            "status_code": 408,
+            "response": "Timeout waiting for a free connection to SpicyTool API"
+        }
     except httpx.TimeoutException:
-        return {
+        result = {
             "success": False,
             "status_code": 408,
             "response": "Timeout connecting to SpicyTool API"
         }
     except Exception as e:
-        return {
+        result = {
             "success": False,
             "status_code": 500,
             "response": str(e)
         }
+    finally:
+        elapsed = time.perf_counter() - started
+        pool_stats.in_flight -= 1
+        pool_stats.total_latency += elapsed
+
+    observe_stage("whatsapp_send", elapsed)
+    whatsapp_sends.inc(result["status_code"])
+    return result
 
 
 def validate_config() -> bool:
     """Validates that the environment variables are configured."""
     if not SPICY_API_TOKEN:
-        print("⚠️ WARNING: SPICY_API_TOKEN not set in .env")
+        logger.warning("config_missing", setting="SPICY_API_TOKEN")
         return False
-    return True
\ No newline at end of file
+    return True
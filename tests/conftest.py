@@ -0,0 +1,16 @@
+# Test setup: the session store, coordination and outbox databases go to a
+# temporary directory, not the repo root. Runs before any test module imports
+# the app, since the stores open their files at import time.
+
+import os
+import shutil
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="agent-tests-")
+os.environ["SESSION_DB_PATH"] = os.path.join(_db_dir, "sessions.db")
+os.environ["OUTBOX_DB_PATH"] = os.path.join(_db_dir, "outbox.db")
+os.environ["COORDINATION_DB_PATH"] = os.path.join(_db_dir, "coordination.db")
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_db_dir, ignore_errors=True)
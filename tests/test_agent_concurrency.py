@@ -0,0 +1,66 @@
+# Offline test: agent turns run concurrently on the event loop
+
+import asyncio
+import time
+
+import pytest
+
+from real_estate_agent.agent import root_agent
+from real_estate_agent.fake_llm import FakeLlm
+from real_estate_agent.tools.contact_cache import contact_cache
+from services.agent_runner import process_message
+from services.conversation_queue import llm_limiter
+
+LATENCY = 0.5
+CONVERSATIONS = 10  # below LLM_MAX_CONCURRENCY
+
+
+@pytest.fixture
+def slow_model():
+    original_model = root_agent.model
+    root_agent.model = FakeLlm(latency=LATENCY)
+    yield root_agent.model
+    root_agent.model = original_model
+
+
+def phones(prefix: str, count: int) -> list:
+    numbers = [prefix + str(1000 + i) for i in range(count)]
+    # Keep the CRM out of the test
+    for phone in numbers:
+        contact_cache.set(phone, {"status": "not_found", "contact": None})
+    return numbers
+
+
+def test_conversations_finish_in_about_one_model_latency(slow_model):
+    numbers = phones("+5693333", CONVERSATIONS + 1)
+    warmup = numbers.pop()
+
+    async def run_all():
+        # First turn pays one-time agent setup
+        await process_message(warmup, "Hola")
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[process_message(phone, "Hola") for phone in numbers])
+        return time.perf_counter() - started, responses
+
+    elapsed, responses = asyncio.run(run_all())
+
+    assert len(responses) == CONVERSATIONS
+    assert all(response.message == slow_model.reply for response in responses)
+    # Serialized turns would take CONVERSATIONS * LATENCY
+    assert elapsed < LATENCY * 2
+
+
+def test_cancelling_the_caller_cancels_the_turn(slow_model):
+    (phone,) = phones("+5694444", 1)
+
+    async def cancel_mid_turn():
+        task = asyncio.create_task(process_message(phone, "Hola"))
+        await asyncio.sleep(LATENCY / 2)
+        assert llm_limiter.in_flight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_mid_turn())
+    # The LLM slot was released
+    assert llm_limiter.in_flight == 0
@@ -0,0 +1,89 @@
+# Offline test: history compaction keeps the last turns verbatim, folds the
+# rest into a bounded summary that keeps the start of the conversation, and
+# folded events stay out of reloaded sessions
+
+import asyncio
+import json
+import time
+
+from google.adk.events.event import Event
+from google.genai.types import Content, FunctionCall, FunctionResponse, Part
+
+from services.compaction import SUMMARY_STATE_KEY, _fold, _is_user_turn, compact_history
+from services.session_store import SqliteSessionService
+
+APP = "real_estate_agent"
+
+
+def event(author: str, part: Part) -> Event:
+    role = "user" if author == "user" else "model"
+    return Event(author=author, content=Content(role=role, parts=[part]), timestamp=time.time())
+
+
+def turn(number: int, with_tool: bool = False) -> list:
+    """A user message, optionally a tool call and its result, and the agent's reply."""
+    events = [event("user", Part(text="mensaje " + str(number)))]
+    if with_tool:
+        events.append(event("agent", Part(function_call=FunctionCall(name="create_contact", args={}))))
+        events.append(event("user", Part(function_response=FunctionResponse(name="create_contact", response={"status": "success"}))))
+    events.append(event("agent", Part(text=json.dumps({"message": "respuesta " + str(number)}))))
+    return events
+
+
+def test_older_turns_are_folded_and_hidden_after_reload(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+
+    async def scenario():
+        store = SqliteSessionService(db_path=db_path)
+        session = await store.create_session(app_name=APP, user_id="u1", session_id="s1")
+        for number in range(1, 6):
+            for e in turn(number, with_tool=number == 1):
+                await store.append_event(session, e)
+        folded = await compact_history(store, session, keep_turns=3)
+        store.close()
+
+        reopened = SqliteSessionService(db_path=db_path)
+        reloaded = await reopened.get_session(app_name=APP, user_id="u1", session_id="s1")
+        reopened.close()
+        return folded, session, reloaded
+
+    folded, session, reloaded = asyncio.run(scenario())
+    # The incoming message is the third kept turn: turns 4 and 5 stay verbatim
+    assert folded == 4 + 2 + 2
+    for kept in (session, reloaded):
+        assert [e.content.parts[0].text for e in kept.events if _is_user_turn(e)] == ["mensaje 4", "mensaje 5"]
+        assert len(kept.events) == 4
+    assert reloaded.state[SUMMARY_STATE_KEY].splitlines() == [
+        "User: mensaje 1", "Tool create_contact: success", "Agent: respuesta 1",
+        "User: mensaje 2", "Agent: respuesta 2",
+        "User: mensaje 3", "Agent: respuesta 3"
+    ]
+
+
+def test_nothing_is_folded_within_the_kept_turns(tmp_path):
+    async def scenario():
+        store = SqliteSessionService(db_path=str(tmp_path / "sessions.db"))
+        session = await store.create_session(app_name=APP, user_id="u1", session_id="s1")
+        for e in turn(1) + turn(2):
+            await store.append_event(session, e)
+        folded = await compact_history(store, session, keep_turns=3)
+        store.close()
+        return folded, session
+
+    folded, session = asyncio.run(scenario())
+    assert folded == 0 and len(session.events) == 4
+    assert SUMMARY_STATE_KEY not in session.state
+
+
+def test_trimmed_summary_keeps_the_start_of_the_conversation():
+    first = [event("user", Part(text="Soy Ana Pérez, ana@correo.cl")), event("agent", Part(text='{"message": "Hola Ana"}'))]
+    summary = _fold("", first, max_chars=300, head_chars=60)
+    for number in range(20):
+        summary = _fold(summary, turn(number), max_chars=300, head_chars=60)
+
+    lines = summary.splitlines()
+    assert len(summary) <= 300
+    assert lines[:3] == ["User: Soy Ana Pérez, ana@correo.cl", "Agent: Hola Ana", "[...]"]
+    assert lines[-2:] == ["User: mensaje 19", "Agent: respuesta 19"]
+    assert "User: mensaje 0" not in lines
+    assert lines.count("[...]") == 1
@@ -0,0 +1,109 @@
+# Offline test: contact cache coalesces concurrent lookups, expires negative
+# results sooner, and survives a cancelled or invalidated load
+
+import asyncio
+import time
+
+import pytest
+
+from real_estate_agent.tools.contact_cache import ContactCache
+
+PHONE = "+56 9 5555 6001"
+FOUND = {"status": "success", "contact": {"name": "Ana"}}
+NOT_FOUND = {"status": "not_found", "contact": None}
+
+
+class FakeCrm:
+    """get_contact stand-in: returns `result` after `release` is set (or right away)."""
+
+    def __init__(self, result: dict = FOUND, gated: bool = False):
+        self.result = result
+        self.calls = 0
+        self.release = asyncio.Event() if gated else None
+
+    async def get_contact(self, phone_number: str) -> dict:
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        return self.result
+
+
+def test_concurrent_misses_share_one_crm_call():
+    cache = ContactCache()
+
+    async def scenario():
+        crm = FakeCrm(gated=True)
+        lookups = [asyncio.create_task(cache.get(phone, crm.get_contact)) for phone in (PHONE, "+56955556001", PHONE)]
+        await asyncio.sleep(0.01)
+        crm.release.set()
+        results = await asyncio.gather(*lookups)
+        results.append(await cache.get(PHONE, crm.get_contact))
+        return crm, results
+
+    crm, results = asyncio.run(scenario())
+    assert crm.calls == 1
+    assert results == [FOUND] * 4
+    assert cache.misses == 1 and cache.coalesced == 2 and cache.hits == 1
+
+
+def test_not_found_expires_after_the_negative_ttl_and_errors_are_not_cached():
+    cache = ContactCache(ttl_seconds=60, negative_ttl_seconds=0.05)
+
+    async def scenario():
+        missing = FakeCrm(NOT_FOUND)
+        await cache.get(PHONE, missing.get_contact)
+        await cache.get(PHONE, missing.get_contact)
+        assert missing.calls == 1 and cache.negative_hits == 1
+        time.sleep(0.06)
+        await cache.get(PHONE, missing.get_contact)
+        assert missing.calls == 2
+
+        failing = FakeCrm({"status": "error", "message": "timeout"})
+        await cache.get("+56955556002", failing.get_contact)
+        await cache.get("+56955556002", failing.get_contact)
+        assert failing.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_leader_hands_the_load_to_a_waiter():
+    cache = ContactCache()
+
+    async def scenario():
+        crm = FakeCrm(gated=True)
+        leader = asyncio.create_task(cache.get(PHONE, crm.get_contact))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get(PHONE, crm.get_contact))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        crm.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return crm, await follower
+
+    crm, result = asyncio.run(scenario())
+    # The waiter was not cancelled with the leader: it loaded the contact itself
+    assert result == FOUND
+    assert crm.calls == 2
+    assert cache.stats()["size"] == 1 and not cache._inflight
+
+
+def test_invalidate_during_a_load_does_not_cache_the_stale_result():
+    cache = ContactCache()
+
+    async def scenario():
+        stale = FakeCrm({"status": "success", "contact": {"name": "Ana"}}, gated=True)
+        loading = asyncio.create_task(cache.get(PHONE, stale.get_contact))
+        await asyncio.sleep(0.01)
+        cache.invalidate(PHONE)  # e.g. update_contact ran meanwhile
+        stale.release.set()
+        first = await loading
+
+        fresh = FakeCrm({"status": "success", "contact": {"name": "Ana Pérez"}})
+        second = await cache.get(PHONE, fresh.get_contact)
+        return first, second, fresh
+
+    first, second, fresh = asyncio.run(scenario())
+    assert first["contact"]["name"] == "Ana"  # the caller still gets its answer
+    assert fresh.calls == 1 and second["contact"]["name"] == "Ana Pérez"
@@ -0,0 +1,46 @@
+# Offline test of the Gemini context cache with the fake model backend
+
+import asyncio
+
+from real_estate_agent.agent import root_agent
+from real_estate_agent.context_cache import static_context_cache, token_usage
+from real_estate_agent.fake_llm import FakeLlm, FakeCacheBackend
+from real_estate_agent.tools.contact_cache import contact_cache
+from services.agent_runner import process_message
+
+
+def test_context_cache_reduces_uncached_prompt_tokens():
+    backend = FakeCacheBackend()
+    fake = FakeLlm(cache_backend=backend)
+    original_model = root_agent.model
+    root_agent.model = fake
+
+    # Keep the CRM out of the test
+    for phone in ("+56911111111", "+56922222222"):
+        contact_cache.set(phone, {"status": "not_found", "contact": None})
+
+    try:
+        static_context_cache.disable()
+        asyncio.run(process_message("+56911111111", "Hola, busco una casa"))
+        without_cache = token_usage.last
+
+        static_context_cache.enable(backend=backend)
+        asyncio.run(process_message("+56922222222", "Hola, busco una casa"))
+        asyncio.run(process_message("+56922222222", "Para vivir con mi familia"))
+        with_cache = token_usage.last
+    finally:
+        static_context_cache.disable()
+        root_agent.model = original_model
+
+    # One cache shared by both conversations and turns
+    assert backend.created == 1
+
+    request = fake.requests[-1]
+    assert request.config.cached_content == "cachedContents/fake-1"
+    assert request.config.system_instruction is None
+    turn_context = request.contents[0].parts[0].text
+    assert turn_context.startswith("<turn_context>") and turn_context.endswith("</turn_context>")
+    assert "<contact_context>" in turn_context
+
+    assert with_cache["cached_tokens"] > 0
+    assert with_cache["prompt_tokens"] - with_cache["cached_tokens"] < without_cache["prompt_tokens"] / 2
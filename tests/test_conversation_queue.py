@@ -0,0 +1,91 @@
+# Offline test: turns of one phone run in arrival order and cancelled waiters
+# never break the hand-over to the next turn
+
+import asyncio
+
+from services.conversation_queue import ConversationQueue
+from services.coordination import LocalCoordination
+
+PHONE = "+56955557001"
+
+
+def new_queue() -> ConversationQueue:
+    return ConversationQueue(coordination=LocalCoordination())
+
+
+async def hold_turn(queue: ConversationQueue, name: str, order: list, release: asyncio.Event = None):
+    async with queue.turn(PHONE):
+        order.append(name)
+        if release is not None:
+            await release.wait()
+    return name
+
+
+def test_turns_run_in_arrival_order():
+    queue = new_queue()
+    order = []
+
+    async def scenario():
+        release = asyncio.Event()
+        first = asyncio.create_task(hold_turn(queue, "a", order, release))
+        await asyncio.sleep(0)
+        others = [asyncio.create_task(hold_turn(queue, name, order)) for name in "bcd"]
+        await asyncio.sleep(0.01)
+        assert order == ["a"] and queue.depth(PHONE) == 4
+        release.set()
+        await asyncio.gather(first, *others)
+
+    asyncio.run(scenario())
+    assert order == ["a", "b", "c", "d"]
+    assert queue.depth(PHONE) == 0 and queue.stats()["active_conversations"] == 0
+
+
+def test_waiter_cancelled_while_the_running_turn_exits():
+    queue = new_queue()
+    order = []
+
+    async def scenario():
+        release = asyncio.Event()
+        running = asyncio.create_task(hold_turn(queue, "r", order, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold_turn(queue, "w", order))
+        last = asyncio.create_task(hold_turn(queue, "l", order))
+        await asyncio.sleep(0.01)
+        # Same loop tick: the running turn exits as the next waiter is cancelled
+        release.set()
+        waiter.cancel()
+        return await asyncio.gather(running, waiter, last, return_exceptions=True)
+
+    running, waiter, last = asyncio.run(scenario())
+    assert running == "r"
+    assert isinstance(waiter, asyncio.CancelledError)
+    assert last == "l"
+    assert order == ["r", "l"]
+    assert queue.depth(PHONE) == 0
+
+
+def test_granted_turn_cancelled_before_it_runs_hands_over():
+    queue = new_queue()
+    order = []
+
+    async def scenario():
+        tasks = {}
+
+        async def running():
+            async with queue.turn(PHONE):
+                order.append("r")
+                await asyncio.sleep(0.01)
+            # "w" was granted its turn but has not resumed yet
+            tasks["w"].cancel()
+
+        first = asyncio.create_task(running())
+        await asyncio.sleep(0)
+        tasks["w"] = asyncio.create_task(hold_turn(queue, "w", order))
+        last = asyncio.create_task(hold_turn(queue, "l", order))
+        return await asyncio.gather(first, tasks["w"], last, return_exceptions=True)
+
+    _, waiter, last = asyncio.run(scenario())
+    assert isinstance(waiter, asyncio.CancelledError)
+    assert last == "l"
+    assert order == ["r", "l"]
+    assert queue.depth(PHONE) == 0
@@ -0,0 +1,108 @@
+# Offline test: workers sharing a SqliteCoordination file hand debounce
+# buffers to the latest message, take message ids once and serialize turns
+
+import asyncio
+import time
+
+import pytest
+
+from services.coordination import LocalCoordination, SqliteCoordination
+
+PHONE = "+56955557101"
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two workers on one host: two SqliteCoordination instances on the same file."""
+    db_path = str(tmp_path / "coordination.db")
+    first, second = SqliteCoordination(db_path=db_path), SqliteCoordination(db_path=db_path)
+    yield first, second
+    first.close()
+    second.close()
+
+
+def test_only_the_latest_token_claims_the_shared_buffer(workers):
+    first, second = workers
+
+    async def scenario():
+        old_token = await first.buffer_message(PHONE, "hola", {"userEmail": "a@b.cl", "n": 1})
+        new_token = await second.buffer_message(PHONE, "busco depto", {"userEmail": "a@b.cl", "n": 2})
+        superseded = await first.claim_buffer(PHONE, old_token)
+        claimed = await second.claim_buffer(PHONE, new_token)
+        again = await second.claim_buffer(PHONE, new_token)
+        return superseded, claimed, again
+
+    superseded, claimed, again = asyncio.run(scenario())
+    assert superseded is None
+    assert claimed == (["hola", "busco depto"], {"userEmail": "a@b.cl", "n": 2})
+    assert again is None  # the buffer was taken
+    assert first.superseded == 1 and second.claimed == 1
+
+
+def test_message_ids_are_taken_by_one_worker(workers):
+    first, second = workers
+
+    async def scenario():
+        taken_first = await first.claim_messages(PHONE, ["m1", "m2"])
+        taken_second = await second.claim_messages(PHONE, ["m2", "m3"])
+        other_phone = await second.claim_messages("+56955557102", ["m1"])
+        return taken_first, taken_second, other_phone
+
+    taken_first, taken_second, other_phone = asyncio.run(scenario())
+    assert taken_first == ["m1", "m2"]
+    assert taken_second == ["m3"]
+    assert other_phone == ["m1"]  # ids are per phone
+
+
+def test_phone_lock_is_held_across_workers_until_released(workers):
+    first, second = workers
+    order = []
+
+    async def hold(coordination, name: str, seconds: float):
+        async with coordination.lock(PHONE):
+            order.append(name + " in")
+            await asyncio.sleep(seconds)
+            order.append(name + " out")
+
+    async def scenario():
+        holder = asyncio.create_task(hold(first, "first", 0.1))
+        await asyncio.sleep(0.02)
+        waiter = asyncio.create_task(hold(second, "second", 0))
+        await asyncio.gather(holder, waiter)
+        # Other phones are not blocked
+        async with first.lock(PHONE), second.lock("+56955557102"):
+            pass
+
+    asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+    assert order == ["first in", "first out", "second in", "second out"]
+    assert second.lock_waits > 0
+
+
+def test_expired_lease_of_a_crashed_worker_is_taken_over(workers):
+    first, second = workers
+    # A worker died holding the lock: its lease is past expiry
+    first._conn.execute(
+        "INSERT INTO phone_locks (phone_number, owner, expires_at) VALUES (?, ?, ?)",
+        (PHONE, "crashed-worker", time.time() - 1)
+    )
+
+    async def scenario():
+        async with second.lock(PHONE):
+            return second._conn.execute("SELECT owner FROM phone_locks WHERE phone_number = ?", (PHONE,)).fetchone()[0]
+
+    owner = asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+    assert owner.startswith(second.worker_id)
+    assert second.lock_waits == 0
+    assert first._conn.execute("SELECT COUNT(*) FROM phone_locks").fetchone()[0] == 0
+
+
+def test_local_coordination_is_not_shared():
+    local = LocalCoordination()
+
+    async def scenario():
+        async with local.lock(PHONE):
+            async with local.lock(PHONE):  # no cross-process lock: ordering is the queue's job
+                return True
+
+    assert local.shared is False
+    assert asyncio.run(scenario())
@@ -0,0 +1,106 @@
+# Offline test: the async CRM tools return the same dicts as the sync ones in
+# crm.py, invalidate the contact cache on writes, and close their clients
+
+import asyncio
+import json
+
+import httpx
+import pytest
+import requests
+
+from real_estate_agent.tools import crm, crm_async
+from real_estate_agent.tools.contact_cache import contact_cache, normalize_phone
+
+PHONE = "+56955557401"
+CONTACT = {"_id": "c-1", "name": "Ana", "email": "ana@correo.cl", "phoneNumber": PHONE}
+
+# (method, path) -> (status code, JSON body); a missing route is a network error
+ROUTES = {
+    ("GET", "/contact/c-1"): (200, CONTACT),
+    ("GET", "/contact/c-2"): (200, {"message": "Contact not found"}),
+    ("POST", "/contact"): (201, CONTACT),
+    ("PUT", "/contact/c-1"): (200, {**CONTACT, "email": "ana@nuevo.cl"}),
+}
+
+
+def route(method: str, url: str) -> tuple:
+    path = httpx.URL(url).path.replace("/spicyapi/v1", "")
+    return ROUTES.get((method, path))
+
+
+def async_handler(request: httpx.Request) -> httpx.Response:
+    found = route(request.method, str(request.url))
+    if found is None:
+        raise httpx.ConnectError("connection refused", request=request)
+    return httpx.Response(found[0], json=found[1])
+
+
+def sync_request(method: str, url: str, **kwargs) -> requests.Response:
+    found = route(method, url)
+    if found is None:
+        raise requests.ConnectionError("connection refused")
+    response = requests.Response()
+    response.status_code, response._content = found[0], json.dumps(found[1]).encode()
+    return response
+
+
+@pytest.fixture
+def crm_calls(monkeypatch):
+    """Runs the async tool on a mocked CRM; the sync tool gets the same responses."""
+    monkeypatch.setattr(crm.requests, "request", sync_request)
+
+    def run(tool: str, *args, **kwargs) -> dict:
+        async def call():
+            await crm_async.open_client(transport=httpx.MockTransport(async_handler))
+            try:
+                return await getattr(crm_async, tool)(*args, **kwargs)
+            finally:
+                await crm_async.close_client()
+
+        return asyncio.run(call())
+
+    yield run
+    crm_async.crm_breaker.reset()
+
+
+@pytest.mark.parametrize("tool, args", [
+    ("get_contact", ("c-1",)),
+    ("get_contact", ("c-2",)),
+    ("create_contact", ("Ana", "ana@correo.cl", PHONE)),
+    ("update_contact", ("c-1", None, "ana@nuevo.cl")),
+])
+def test_async_tools_match_the_sync_tools(crm_calls, tool, args):
+    assert crm_calls(tool, *args) == getattr(crm, tool)(*args)
+
+
+def test_network_errors_give_the_same_error_dict(crm_calls):
+    result = crm_calls("list_contacts")
+    expected = crm.list_contacts()
+    assert result["status"] == expected["status"] == "error"
+    assert result["error_message"].startswith("Could not list contacts: ")
+
+
+def test_writes_invalidate_the_contact_cache(crm_calls):
+    contact_cache.set(PHONE, {"status": "not_found", "contact": None})
+    crm_calls("create_contact", "Ana", "ana@correo.cl", PHONE)
+    assert normalize_phone(PHONE) not in contact_cache._entries
+
+    contact_cache.set("c-1", {"status": "success", "contact": CONTACT})
+    contact_cache.set(PHONE, {"status": "success", "contact": CONTACT})
+    crm_calls("update_contact", "c-1", None, "ana@nuevo.cl", PHONE)
+    assert not {normalize_phone("c-1"), normalize_phone(PHONE)} & set(contact_cache._entries)
+
+
+def test_lazy_clients_are_closed_with_their_event_loop():
+    clients = []
+
+    async def call():
+        client = await crm_async.get_client()
+        assert client is await crm_async.get_client()  # one per loop
+        clients.append(client)
+
+    for _ in range(3):
+        asyncio.run(call())  # like main.py: a new loop per turn
+
+    assert len(set(map(id, clients))) == 3
+    assert all(client.is_closed for client in clients)
@@ -0,0 +1,75 @@
+# Offline test: the adaptive debounce delay follows each phone's typing habits
+
+import asyncio
+
+from services.debounce_policy import AdaptiveDelay
+from services.debouncer import Debouncer
+
+
+def test_bursty_and_single_message_users_converge_apart():
+    policy = AdaptiveDelay(initial_delay=7.0, min_delay=1.5, max_delay=10.0)
+    now = 0.0
+    for _ in range(10):
+        # Bursty user: three messages 3s apart, then one turn
+        for _ in range(3):
+            policy.delay_for("bursty", "y", now, new_turn=False)
+            now += 3.0
+        policy.on_flush("bursty", 3, now)
+        # Single-message user: one message per turn, nothing follows
+        policy.delay_for("single", "hola", now, new_turn=True)
+        policy.on_flush("single", 1, now + 1.5)
+        now += 60.0
+
+    assert policy.current_delay("single") == 1.5
+    assert 3.0 < policy.current_delay("bursty") < 7.0
+    assert policy.current_delay("new") == 7.0
+    assert policy.split_turns == 0
+
+
+def test_question_uses_min_delay_and_follow_up_counts_split_turn():
+    policy = AdaptiveDelay(initial_delay=7.0, min_delay=1.5, max_delay=10.0)
+    assert policy.delay_for("p", "¿tienen algo en Providencia?", 0.0, new_turn=True) == 1.5
+    policy.on_flush("p", 1, 1.5)
+    policy.delay_for("p", "con estacionamiento", 2.0, new_turn=True)
+    assert policy.stats()["end_of_turn_flushes"] == 1
+    assert policy.stats()["split_turns"] == 1
+
+
+def test_debouncer_flushes_early_after_question():
+    debouncer = Debouncer(
+        delay_seconds=5.0,
+        tick_seconds=0.001,
+        policy=AdaptiveDelay(initial_delay=5.0, min_delay=0.05, max_delay=10.0)
+    )
+    processed = []
+
+    async def callback(phone, text, payload):
+        processed.append(text)
+        return {"reply": "ok"}
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await debouncer.debounce("p", "hola", {}, callback)
+        await asyncio.sleep(0.01)
+        result = await asyncio.wait_for(debouncer.debounce_and_wait("p", "¿tienen depto?", {}, callback), timeout=2)
+        return result, loop.time() - started
+
+    result, elapsed = asyncio.run(scenario())
+    assert result == {"reply": "ok"}
+    assert elapsed < 1.0
+    assert processed == ["hola ¿tienen depto?"]
+    stats = debouncer.stats()
+    assert stats["flushes"] == 1 and stats["messages"] == 2 and stats["merge_ratio"] == 2.0
+
+
+def test_idle_phones_are_forgotten():
+    policy = AdaptiveDelay(initial_delay=7.0, idle_seconds=60.0)
+    for i in range(3000):
+        policy.delay_for("+569" + str(i), "hola", float(i) / 100, new_turn=True)
+    assert policy.stats()["tracked_phones"] == 3000
+
+    # Only the phone writing now is left; the others were idle for more than a minute
+    policy.delay_for("+56900000000", "hola", 1000.0, new_turn=True)
+    assert policy.stats()["tracked_phones"] == 1
+    assert policy.stats()["evicted_phones"] == 3000
@@ -0,0 +1,95 @@
+# Offline test: the debouncer's single scheduler moves deadlines forward and
+# back, merges a phone's messages into one turn and resolves superseded waiters
+
+import asyncio
+
+from services.coordination import LocalCoordination
+from services.debounce_policy import AdaptiveDelay
+from services.debouncer import Debouncer
+
+
+def new_debouncer(delay_seconds: float = 0.1, policy=None) -> Debouncer:
+    return Debouncer(delay_seconds=delay_seconds, tick_seconds=0.001, coordination=LocalCoordination(), policy=policy)
+
+
+class Recorder:
+    """process_callback that records what was processed and when (loop time)."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, phone, text, payload):
+        self.calls.append((phone, text, asyncio.get_running_loop().time()))
+        return {"reply": text}
+
+
+def test_new_message_extends_the_deadline():
+    debouncer = new_debouncer(delay_seconds=0.1)
+    recorder = Recorder()
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        await debouncer.debounce("+56955557301", "hola", {}, recorder)
+        await asyncio.sleep(0.06)
+        last_at = loop.time()
+        await debouncer.debounce("+56955557301", "busco depto", {}, recorder)
+        await asyncio.sleep(0.3)
+        return last_at
+
+    last_at = asyncio.run(scenario())
+    assert [(phone, text) for phone, text, _ in recorder.calls] == [("+56955557301", "hola busco depto")]
+    # Fired 0.1s after the second message, not the first
+    assert recorder.calls[0][2] >= last_at + 0.1
+    assert debouncer.flushes == 1 and debouncer.get_pending_count() == 0
+
+
+def test_shorter_deadline_fires_early_and_the_stale_entry_is_skipped():
+    debouncer = new_debouncer(policy=AdaptiveDelay(initial_delay=0.3, min_delay=0.02, max_delay=1.0))
+    recorder = Recorder()
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        await debouncer.debounce("+56955557302", "hola", {}, recorder)
+        await asyncio.sleep(0.01)
+        question_at = loop.time()
+        await debouncer.debounce("+56955557302", "¿tienen depto en Ñuñoa?", {}, recorder)
+        await asyncio.sleep(0.15)
+        flushed_early = list(recorder.calls)
+        await asyncio.sleep(0.3)  # past the first message's deadline
+        return question_at, flushed_early
+
+    question_at, flushed_early = asyncio.run(scenario())
+    assert len(flushed_early) == 1
+    assert flushed_early[0][2] - question_at < 0.1
+    assert recorder.calls == flushed_early  # the first deadline did not fire a second turn
+
+
+def test_phones_fire_in_deadline_order():
+    debouncer = new_debouncer(delay_seconds=0.05)
+    recorder = Recorder()
+
+    async def scenario():
+        await debouncer.debounce("+56955557303", "uno", {}, recorder)
+        await debouncer.debounce("+56955557304", "dos", {}, recorder)
+        await asyncio.sleep(0.02)
+        await debouncer.debounce("+56955557303", "tres", {}, recorder)  # now due after the other phone
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+    assert [text for _, text, _ in recorder.calls] == ["dos", "uno tres"]
+
+
+def test_superseded_waiters_get_none_and_the_last_gets_the_result():
+    debouncer = new_debouncer(delay_seconds=0.05)
+    recorder = Recorder()
+
+    async def scenario():
+        first = asyncio.create_task(debouncer.debounce_and_wait("+56955557305", "hola", {}, recorder))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(debouncer.debounce_and_wait("+56955557305", "soy Ana", {}, recorder))
+        return await asyncio.wait_for(asyncio.gather(first, second), timeout=2)
+
+    first, second = asyncio.run(scenario())
+    assert first is None
+    assert second == {"reply": "hola soy Ana"}
+    assert len(recorder.calls) == 1
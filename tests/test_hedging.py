@@ -0,0 +1,95 @@
+# Offline test: slow model calls are hedged, the first valid reply wins, and
+# turns that wrote to the CRM are never hedged
+
+import asyncio
+import json
+import time
+
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+
+from real_estate_agent.agent import root_agent
+from real_estate_agent.fake_llm import FakeLlm
+from real_estate_agent.hedging import HedgedLlm, HedgeStats
+from services.agent_runner import process_message
+
+
+class FailingLlm(FakeLlm):
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        self.requests.append(llm_request)
+        raise RuntimeError("model overloaded")
+        yield
+
+
+def run_turn(model: HedgedLlm, phone: str, linger: float = 0.0):
+    """Runs one turn; returns the reply and how long it took. linger: seconds to stay on the loop after."""
+    original_model = root_agent.model
+    root_agent.model = model
+
+    async def turn():
+        started = time.perf_counter()
+        response = await process_message(phone, "hola, busco depto")
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(linger)
+        return response, elapsed
+
+    try:
+        return asyncio.run(turn())
+    finally:
+        root_agent.model = original_model
+
+
+def test_slow_call_is_hedged_to_the_fallback_and_the_fast_reply_wins():
+    primary = FakeLlm(latency=1.0, reply="lenta")
+    fallback = FakeLlm(model="fake-fallback", reply="rápida")
+    model = HedgedLlm(primary=primary, fallback=fallback, default_delay=0.1, max_rate=1.0, stats=HedgeStats())
+
+    response, elapsed = run_turn(model, "+56955558001", linger=1.2)
+
+    assert response.message == "rápida"
+    assert elapsed < 0.5
+    assert fallback.requests[0].model == "fake-fallback"
+    stats = model.stats.stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1 and stats["hedge_rate"] == 1.0
+    # The losing call was timed to the end: about 1.0s - 0.1s saved
+    assert 0.7 < stats["latency_saved_seconds"] < 1.0
+    assert len(model.stats.latencies) == 1 and stats["losers_running"] == 0
+
+
+def test_fast_call_is_not_hedged_and_budget_caps_hedges():
+    fallback = FakeLlm(reply="rápida")
+    model = HedgedLlm(primary=FakeLlm(), fallback=fallback, default_delay=0.5, max_rate=1.0, stats=HedgeStats())
+    response, _ = run_turn(model, "+56955558002")
+    assert response.message == FakeLlm().reply
+    assert fallback.requests == [] and model.stats.hedged == 0
+
+    capped = HedgedLlm(primary=FakeLlm(latency=0.3), fallback=fallback, default_delay=0.05, max_rate=0.0, stats=HedgeStats())
+    run_turn(capped, "+56955558003")
+    assert capped.stats.hedged == 0 and capped.stats.suppressed_budget == 1
+
+
+def test_failed_call_falls_back_right_away():
+    model = HedgedLlm(primary=FailingLlm(), fallback=FakeLlm(reply="respaldo"), default_delay=5.0, stats=HedgeStats())
+    response, elapsed = run_turn(model, "+56955558004")
+    assert response.message == "respaldo"
+    assert elapsed < 1.0
+    assert model.stats.fallbacks == 1
+
+
+def test_no_hedge_after_a_crm_write():
+    primary = FakeLlm(latency=0.3)
+    fallback = FakeLlm(reply="rápida")
+    model = HedgedLlm(primary=primary, fallback=fallback, default_delay=0.01, max_rate=1.0, stats=HedgeStats())
+    request = LlmRequest(model=primary.model, contents=[
+        types.Content(role="user", parts=[types.Part(text="soy Ana, ana@correo.cl")]),
+        types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(name="create_contact", args={}))]),
+        types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(name="create_contact", response={"status": "success"}))])
+    ])
+
+    async def call():
+        return [response async for response in model.generate_content_async(request)]
+
+    responses = asyncio.run(call())
+    assert json.loads(responses[0].content.parts[0].text)["message"] == primary.reply
+    assert fallback.requests == []
+    assert model.stats.suppressed_side_effects == 1
@@ -0,0 +1,73 @@
+# Offline test: only unseen user messages of a webhook delivery are processed,
+# with or without the per-phone history, and across workers
+
+import asyncio
+
+from models.payloads import Message
+from services.coordination import LocalCoordination, SqliteCoordination
+from services.ingestion import MessageDeduper
+
+PHONE = "+56955557201"
+
+
+def user(message_id: str, timestamp: int) -> Message:
+    return Message(id=message_id, body="texto " + message_id, timestamp=timestamp)
+
+
+def agent(message_id: str, timestamp: int) -> Message:
+    return Message(id=message_id, body="respuesta", fromMe=True, timestamp=timestamp)
+
+
+def ids(messages: list) -> list:
+    return [message.id for message in messages]
+
+
+def select(deduper: MessageDeduper, conversation: list, phone: str = PHONE) -> list:
+    return ids(asyncio.run(deduper.select_new(phone, conversation)))
+
+
+def new_deduper(**kwargs) -> MessageDeduper:
+    return MessageDeduper(coordination=LocalCoordination(), **kwargs)
+
+
+def test_first_delivery_stops_at_the_agents_last_reply():
+    deduper = new_deduper()
+    conversation = [user("u1", 1), agent("a1", 2), user("u2", 3), user("u3", 4)]
+    assert select(deduper, conversation) == ["u2", "u3"]  # u1 was answered before a restart
+
+
+def test_retries_are_duplicates_and_only_appended_messages_are_new():
+    deduper = new_deduper()
+    conversation = [user("u1", 1), user("u2", 2)]
+    assert select(deduper, conversation) == ["u1", "u2"]
+    assert select(deduper, conversation) == []
+
+    conversation += [agent("a1", 3), user("u3", 4)]
+    assert select(deduper, conversation) == ["u3"]
+    assert deduper.stats()["duplicates"] == 1 and deduper.stats()["batched_deliveries"] == 1
+
+
+def test_lru_is_bounded_and_the_high_water_mark_stops_older_history():
+    deduper = new_deduper(max_ids=2)
+    assert select(deduper, [user("u1", 10), user("u2", 20)]) == ["u1", "u2"]
+    # Another phone pushes this phone's ids out of the LRU
+    assert select(deduper, [user("x1", 5), user("x2", 6)], phone="+56955557202") == ["x1", "x2"]
+    assert deduper.stats()["tracked_ids"] == 2
+
+    # History older than the newest message taken is still not processed again
+    assert select(deduper, [user("u1", 10), user("u3", 30)]) == ["u3"]
+
+
+def test_workers_sharing_coordination_take_each_message_once(tmp_path):
+    db_path = str(tmp_path / "coordination.db")
+    first_worker, second_worker = SqliteCoordination(db_path=db_path), SqliteCoordination(db_path=db_path)
+    first, second = MessageDeduper(coordination=first_worker), MessageDeduper(coordination=second_worker)
+    try:
+        conversation = [user("u1", 1), user("u2", 2)]
+        assert select(first, conversation) == ["u1", "u2"]
+        # The retry reached the other worker, which has no local history
+        assert select(second, conversation) == []
+        assert select(second, conversation + [user("u3", 3)]) == ["u3"]
+    finally:
+        first_worker.close()
+        second_worker.close()
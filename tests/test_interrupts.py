@@ -0,0 +1,72 @@
+# Offline test: a message arriving mid-turn interrupts the turn and one turn answers both
+
+import asyncio
+
+import pytest
+
+from real_estate_agent.agent import root_agent
+from real_estate_agent.fake_llm import FakeLlm
+from real_estate_agent.tools.contact_cache import contact_cache
+from services import process_and_respond
+from services.agent_runner import APP_NAME, session_service
+from services.debouncer import Debouncer
+from services.interrupts import TurnInterrupts, turn_interrupts
+
+LATENCY = 0.5
+
+
+@pytest.fixture
+def slow_model():
+    original_model = root_agent.model
+    root_agent.model = FakeLlm(latency=LATENCY)
+    yield root_agent.model
+    root_agent.model = original_model
+
+
+def user_texts(contents) -> list:
+    return [part.text for content in contents if content.role == "user" for part in content.parts if part.text]
+
+
+def test_new_message_restarts_turn_with_merged_text(slow_model, monkeypatch):
+    monkeypatch.setattr(turn_interrupts, "enabled", True)
+    phone = "+56955550001"
+    contact_cache.set(phone, {"status": "not_found", "contact": None})
+    debouncer = Debouncer(delay_seconds=0.05, tick_seconds=0.001)
+
+    async def scenario():
+        first = asyncio.create_task(debouncer.debounce_and_wait(phone, "hola", {}, process_and_respond))
+        await asyncio.sleep(0.05 + LATENCY / 2)  # first turn is waiting on the model
+        second = await debouncer.debounce_and_wait(phone, "busco depto", {}, process_and_respond)
+        return await first, second
+
+    interrupted_before = turn_interrupts.interrupted
+    first, second = asyncio.run(scenario())
+
+    assert first is None  # superseded, like a message merged by the debouncer
+    assert second["agent_response"].message == slow_model.reply
+    assert turn_interrupts.interrupted == interrupted_before + 1
+    # The restarted turn saw the merged text once, not the interrupted message
+    assert user_texts(slow_model.requests[-1].contents) == ["hola busco depto"]
+
+    async def history():
+        return await session_service.get_session(app_name=APP_NAME, user_id=phone, session_id=phone)
+
+    assert user_texts(event.content for event in asyncio.run(history()).events if event.content) == ["hola busco depto"]
+
+
+def test_committed_or_restarted_turns_are_not_interrupted():
+    interrupts = TurnInterrupts(enabled=True, max_restarts=1)
+
+    async def scenario():
+        with interrupts.running("+56955550002", "hola") as turn:
+            turn.committed = True  # a CRM write started
+            assert interrupts.interrupt("+56955550002") is None
+            turn.tokens = 100
+        with interrupts.running("+56955550003", "hola", restarts=1):
+            assert interrupts.interrupt("+56955550003") is None
+
+    asyncio.run(scenario())
+    stats = interrupts.stats()
+    assert stats["interrupted"] == 0
+    assert stats["superseded"] == 2 and stats["stale_reply_tokens"] == 100
+    assert stats["refused_committed"] == 1 and stats["refused_max_restarts"] == 1
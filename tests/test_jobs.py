@@ -0,0 +1,93 @@
+# Offline test: job endpoint returns at once; the reply is long-polled or streamed
+
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from real_estate_agent.agent import root_agent
+from real_estate_agent.fake_llm import FakeLlm
+from real_estate_agent.tools.contact_cache import contact_cache
+from services import debouncer
+from services.jobs import JobStore
+from models import WebhookResponse
+import webhook
+
+
+@pytest.fixture(scope="module")
+def client():
+    # One app lifespan for the module: shutdown closes the outbox
+    original = root_agent.model, debouncer.delay_seconds, debouncer.policy
+    root_agent.model = FakeLlm(latency=0.05)
+    debouncer.delay_seconds, debouncer.policy = 0.05, None
+    with TestClient(webhook.app) as test_client:
+        yield test_client
+    root_agent.model, debouncer.delay_seconds, debouncer.policy = original
+
+
+def delivery(phone: str, message_id: str, body: str) -> dict:
+    contact_cache.set(phone, {"status": "not_found", "contact": None})
+    return {"from": phone, "conversation": [{"id": message_id, "body": body, "fromMe": False, "timestamp": 1}]}
+
+
+def test_job_is_created_then_long_polled(client):
+    created = client.post("/webhook/whatsapp/jobs", json=delivery("+56966660001", "j1", "hola"))
+    assert created.status_code == 202
+    job = created.json()
+    assert job["status"] == "pending" and job["result"] is None
+
+    done = client.get("/jobs/" + job["job_id"], params={"wait": 5}).json()
+    assert done["status"] == "done"
+    assert done["result"]["status"] == "success"
+    assert done["result"]["message_sent"] == root_agent.model.reply
+
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_job_result_is_streamed_as_sse(client):
+    job = client.post("/webhook/whatsapp/jobs", json=delivery("+56966660002", "j2", "hola")).json()
+    with client.stream("GET", "/jobs/" + job["job_id"], headers={"Accept": "text/event-stream"}) as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        lines = [line for line in response.iter_lines() if line]
+    assert lines[-2] == "event: result"
+    assert json.loads(lines[-1][len("data: "):])["result"]["status"] == "success"
+
+
+def test_sync_route_wraps_the_job(client):
+    body = delivery("+56966660003", "j3", "hola")
+    assert client.post("/webhook/whatsapp/sync", json=body).json()["status"] == "success"
+    assert client.post("/webhook/whatsapp/sync", json=body).json()["status"] == "duplicate"
+
+
+def test_store_expires_finished_jobs_and_is_bounded():
+    store = JobStore(max_jobs=2, ttl_seconds=0.05)
+
+    async def scenario():
+        first = store.create("a")
+        store.finish(first, WebhookResponse(status="success"))
+        await asyncio.sleep(0.1)
+        running = store.create("b")  # expires the finished one
+        assert store.get(first.id) is None and store.stats()["expired"] == 1
+        store.create("c")
+        store.create("d")  # over max_jobs: oldest dropped
+        assert store.get(running.id) is None and store.stats()["evicted"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_long_running_job_does_not_hold_back_expiry():
+    store = JobStore(ttl_seconds=0.05)
+
+    async def scenario():
+        slow = store.create("a")
+        late = store.create("b")
+        quick = store.create("c")
+        store.finish(quick, WebhookResponse(status="success"))
+        await asyncio.sleep(0.1)
+        store.finish(late, WebhookResponse(status="success"))  # created before quick, expires after it
+        # Neither the running head nor the late one keeps quick past its TTL
+        assert store.get(quick.id) is None and store.stats()["expired"] == 1
+        assert store.get(slow.id) is slow and store.get(late.id) is late
+
+    asyncio.run(scenario())
@@ -0,0 +1,90 @@
+# Offline test: lean webhook parsing matches full WebhookPayload validation
+
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from models import LazyConversation, WebhookPayload, parse_webhook_payload
+from webhook import app
+
+
+def conversation(count: int) -> list:
+    return [
+        {"id": "m" + str(i), "body": "mensaje " + str(i), "fromMe": i % 2 == 1, "timestamp": 1700000000 + i}
+        for i in range(count)
+    ]
+
+
+PAYLOADS = [
+    {"from": "+56911111111", "userEmail": "a@b.cl", "conversation": conversation(50)},
+    {"from": "+56911111111", "chatBotId": {"$oid": "abc"}, "contactId": None, "conversation": []},
+    {"from": "+56911111111", "conversation": [
+        {"id": "x", "body": "hola", "fromMe": "true", "timestamp": "1700000000.5"},
+        {"body": "sin id", "fromMe": 0, "timestamp": None},
+        {"id": "y", "fromMe": "no", "timestamp": "bad", "extra": 1},
+        {}
+    ]},
+    {"from": "+56911111111"},
+]
+
+INVALID_PAYLOADS = [
+    {"from": "+56911111111", "conversation": conversation(10) + [{"id": 5, "body": "x"}] + conversation(3)},
+    {"from": "+56911111111", "conversation": conversation(3) + ["not a message"]},
+    {"from": "+56911111111", "conversation": conversation(3) + [{"id": "z", "body": None}]},
+    {"from": "+56911111111", "conversation": {"not": "a list"}},
+    {"from": 569, "conversation": conversation(3)},
+    ["not", "an", "object"],
+]
+
+
+def dump(payload: WebhookPayload) -> dict:
+    data = payload.model_dump(exclude={"conversation"})
+    data["conversation"] = [m.model_dump() for m in payload.conversation]
+    return data
+
+
+def full_validation(data) -> WebhookPayload:
+    # How FastAPI validates a WebhookPayload body parameter
+    return WebhookPayload.model_validate(data, from_attributes=True)
+
+
+@pytest.mark.parametrize("data", PAYLOADS)
+def test_valid_payloads_match_full_validation(data):
+    assert dump(parse_webhook_payload(data)) == dump(full_validation(data))
+
+
+@pytest.mark.parametrize("data", INVALID_PAYLOADS)
+def test_invalid_payloads_raise_the_same_errors(data):
+    with pytest.raises(ValidationError) as full:
+        full_validation(data)
+    with pytest.raises(ValidationError) as lean:
+        parse_webhook_payload(data)
+    assert lean.value.errors() == full.value.errors()
+
+
+def test_only_read_messages_are_validated():
+    payload = parse_webhook_payload({"from": "+56911111111", "conversation": conversation(1000)})
+    assert isinstance(payload.conversation, LazyConversation)
+
+    newest_user_message = next(m for m in reversed(payload.conversation) if not m.fromMe)
+    assert newest_user_message.id == "m998"
+    assert payload.conversation.materialized == 2
+
+
+def test_endpoint_errors_match_a_plain_model_parameter():
+    reference = FastAPI()
+
+    @reference.post("/webhook/whatsapp")
+    async def receive(payload: WebhookPayload):
+        return {}
+
+    lean_client, reference_client = TestClient(app), TestClient(reference)
+    bodies = [json.dumps(data) for data in INVALID_PAYLOADS] + ["{not json"]
+    for body in bodies:
+        lean = lean_client.post("/webhook/whatsapp", content=body, headers={"content-type": "application/json"})
+        expected = reference_client.post("/webhook/whatsapp", content=body, headers={"content-type": "application/json"})
+        assert lean.status_code == expected.status_code == 422
+        assert lean.json() == expected.json()
@@ -0,0 +1,63 @@
+# Offline test: structured logger writes JSON records from its writer thread
+
+import hashlib
+import io
+import json
+
+from observability import log
+
+
+def records(run) -> list:
+    stream = io.StringIO()
+    log.configure(stream=stream)
+    try:
+        run(log.get_logger("test"))
+    finally:
+        log.shutdown()
+        log.start()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_records_are_json_without_phone_or_body():
+    def run(logger):
+        log.start_trace("trace-1")
+        logger.info("message_received", phone="+56911111111", stage="ingress", body="hola", duration_ms=1.5)
+
+    [record] = records(run)
+    assert record["event"] == "message_received"
+    assert record["level"] == "info"
+    assert record["stage"] == "ingress"
+    assert record["duration_ms"] == 1.5
+    assert record["trace_id"] == "trace-1"
+    assert record["phone_hash"] == log.phone_hash("+56911111111")
+    assert record["body_chars"] == 4
+    assert "+56911111111" not in json.dumps(record) and "hola" not in json.dumps(record)
+    # Never an unsalted hash, which anyone could reverse by hashing phone numbers
+    assert log.LOG_PHONE_SALT
+    assert record["phone_hash"] != hashlib.sha256(b"+56911111111").hexdigest()[:12]
+
+
+def test_level_filters_records(monkeypatch):
+    def run(logger):
+        monkeypatch.setattr(log, "_level", log.LEVELS["WARNING"])
+        logger.info("dropped")
+        logger.warning("kept")
+        try:
+            raise ValueError("boom")
+        except ValueError as e:
+            logger.error("failed", exc_info=e)
+
+    written = records(run)
+    assert [r["event"] for r in written] == ["kept", "failed"]
+    assert "ValueError: boom" in written[1]["exception"]
+
+
+def test_sampling_never_drops_warnings(monkeypatch):
+    monkeypatch.setattr(log, "LOG_SAMPLE_RATE", 0.0)
+
+    def run(logger):
+        for _ in range(10):
+            logger.info("sampled_out")
+        logger.warning("always")
+
+    assert [r["event"] for r in records(run)] == ["always"]
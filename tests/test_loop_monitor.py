@@ -0,0 +1,44 @@
+# Offline test: the loop monitor measures lag and names the call site that blocked
+
+import asyncio
+import time
+
+from observability.loop_monitor import LoopMonitor
+
+
+def blocking_handler():
+    time.sleep(0.3)  # a sync call inside the event loop
+
+
+def test_blocking_call_is_reported_with_its_call_site():
+    monitor = LoopMonitor(interval=0.01, threshold=0.1)
+
+    async def scenario():
+        await monitor.start()
+        await asyncio.sleep(0.1)
+        blocking_handler()
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+
+    asyncio.run(scenario())
+
+    assert monitor.stalls == 1
+    [offender] = monitor.top_offenders()
+    assert offender["site"].startswith("tests/test_loop_monitor.py:")
+    assert offender["site"].endswith("in blocking_handler")
+    assert "time.sleep" in offender["stack"]
+    assert offender["blocked_ms"] >= 200
+    assert monitor.percentiles()["max_ms"] >= 200
+
+
+def test_non_blocking_loop_has_no_stalls():
+    monitor = LoopMonitor(interval=0.01, threshold=0.1)
+
+    async def scenario():
+        await monitor.start()
+        await asyncio.gather(*(asyncio.sleep(0.01 * i) for i in range(30)))
+        await monitor.stop()
+
+    asyncio.run(scenario())
+    assert monitor.stalls == 0 and monitor.top_offenders() == []
+    assert monitor.percentiles()["count"] > 10
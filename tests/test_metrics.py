@@ -0,0 +1,41 @@
+# Offline test: stage spans end up in the Prometheus text on /metrics
+
+import pytest
+from fastapi.testclient import TestClient
+
+from observability.metrics import Registry, span, stage_errors, stage_seconds
+from webhook import app
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("demo_seconds", "Demo.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "a")
+
+    text = registry.render()
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{stage="a",le="1.0"} 3' in text
+    assert 'demo_seconds_bucket{stage="a",le="+Inf"} 4' in text
+    assert 'demo_seconds_count{stage="a"} 4' in text
+
+
+def test_span_records_duration_and_errors():
+    before = stage_seconds.count("test_stage")
+    with span("test_stage"):
+        pass
+    with pytest.raises(ValueError):
+        with span("test_stage"):
+            raise ValueError("boom")
+
+    assert stage_seconds.count("test_stage") == before + 2
+    assert stage_errors.value("test_stage") >= 1
+
+
+def test_metrics_endpoint_exposes_gauges():
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for name in ("webhook_pending_debounces", "agent_active_sessions", "llm_in_flight"):
+        assert "# TYPE " + name + " gauge" in response.text
@@ -0,0 +1,144 @@
+# Offline test: outbox retries failed sends, keeps order and rate limits per account
+
+import asyncio
+import time
+
+from services import outbox as outbox_module
+from services.outbox import Outbox, TokenBucket
+
+
+class FakeSpicyTool:
+    """Fails the first `failures` sends of each message with the given status."""
+
+    def __init__(self, failures: int = 0, status_code: int = 500):
+        self.failures = failures
+        self.status_code = status_code
+        self.attempts = {}
+        self.delivered = []
+
+    async def send(self, user_email: str, conversation_id: str, message: str) -> dict:
+        attempt = self.attempts[message] = self.attempts.get(message, 0) + 1
+        if attempt <= self.failures:
+            return {"success": False, "status_code": self.status_code, "response": "error"}
+        self.delivered.append((user_email, conversation_id, message, time.monotonic()))
+        return {"success": True, "status_code": 200, "response": "ok"}
+
+
+async def drain(box: Outbox, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while box.sent + box.failed < box.enqueued and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def test_failed_sends_are_retried_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox_module, "backoff_delay", lambda attempts: 0.01)
+    spicy = FakeSpicyTool(failures=2, status_code=500)
+    box = Outbox(db_path=str(tmp_path / "outbox.db"), workers=4, send=spicy.send)
+
+    async def scenario():
+        await box.start()
+        for i in range(3):
+            await box.enqueue("a@b.cl", "+56911111111", "reply " + str(i))
+        await drain(box)
+        await box.stop()
+
+    asyncio.run(scenario())
+    box.close()
+
+    assert [message for _, _, message, _ in spicy.delivered] == ["reply 0", "reply 1", "reply 2"]
+    assert box.sent == 3 and box.retries == 6 and box.failed == 0
+    assert box.stats()["depth"] == 0
+
+
+def test_client_errors_are_not_retried(tmp_path):
+    spicy = FakeSpicyTool(failures=1, status_code=401)
+    box = Outbox(db_path=str(tmp_path / "outbox.db"), workers=1, send=spicy.send)
+
+    async def scenario():
+        await box.start()
+        await box.enqueue("a@b.cl", "+56911111111", "reply")
+        await drain(box)
+        await box.stop()
+
+    asyncio.run(scenario())
+    box.close()
+    assert box.failed == 1 and box.retries == 0 and spicy.delivered == []
+
+
+def test_worker_survives_a_send_that_raises(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox_module, "backoff_delay", lambda attempts: 0.01)
+    spicy = FakeSpicyTool()
+    calls = []
+
+    async def flaky_send(user_email: str, conversation_id: str, message: str) -> dict:
+        calls.append(message)
+        if len(calls) == 1:
+            raise KeyError("status_code")
+        return await spicy.send(user_email, conversation_id, message)
+
+    box = Outbox(db_path=str(tmp_path / "outbox.db"), workers=1, send=flaky_send)
+
+    async def scenario():
+        await box.start()
+        await box.enqueue("a@b.cl", "+56911111111", "reply 0")
+        await box.enqueue("a@b.cl", "+56911111111", "reply 1")
+        await drain(box)
+        await box.stop()
+
+    asyncio.run(scenario())
+    box.close()
+
+    # The same worker retried the reply (counting an attempt) and went on
+    assert calls == ["reply 0", "reply 0", "reply 1"]
+    assert [message for _, _, message, _ in spicy.delivered] == ["reply 0", "reply 1"]
+    assert box.errors == 1 and box.sent == 2
+
+
+def test_unsent_replies_survive_a_restart(tmp_path):
+    db_path = str(tmp_path / "outbox.db")
+    first = Outbox(db_path=db_path)
+    asyncio.run(first.enqueue("a@b.cl", "+56911111111", "reply"))
+    first.close()
+
+    spicy = FakeSpicyTool()
+    second = Outbox(db_path=db_path, send=spicy.send)
+
+    async def scenario():
+        await second.start()
+        while not second.sent:
+            await asyncio.sleep(0.01)
+        await second.stop()
+
+    asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+    second.close()
+    assert [message for _, _, message, _ in spicy.delivered] == ["reply"]
+
+
+def test_each_account_has_its_own_rate_limit(tmp_path):
+    spicy = FakeSpicyTool()
+    box = Outbox(db_path=str(tmp_path / "outbox.db"), workers=4, rate_per_second=20, rate_burst=2, send=spicy.send)
+
+    async def scenario():
+        await box.start()
+        for i in range(6):
+            await box.enqueue("busy@b.cl", "+5691111111" + str(i), "busy " + str(i))
+        await box.enqueue("quiet@b.cl", "+56922222222", "quiet")
+        await drain(box)
+        await box.stop()
+
+    asyncio.run(scenario())
+    box.close()
+
+    busy = [at for email, _, _, at in spicy.delivered if email == "busy@b.cl"]
+    quiet = [at for email, _, _, at in spicy.delivered if email == "quiet@b.cl"]
+    # Burst of 2, then 20/s: the last 4 take at least ~0.2s
+    assert busy[-1] - busy[0] >= 0.15
+    assert box.throttled > 0
+    # The quiet account is not stuck behind the busy one
+    assert quiet[0] < busy[-1]
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.take() == 0 and bucket.take() == 0
+    assert 0 < bucket.take() <= 0.1
@@ -0,0 +1,60 @@
+# Offline test: country detection from the phone number's calling code
+
+import pytest
+
+from real_estate_agent.tools.phone_country import PhonePrefixTrie, resolve_country
+
+
+@pytest.mark.parametrize("phone, country", [
+    # NANP: the area code decides, "1" alone is the United States
+    ("+1 212 555 0100", "United States"),
+    ("+1 416 555 0100", "Canada"),
+    ("+1 809 555 0100", "Dominican Republic"),
+    ("+1 876 555 0100", "Jamaica"),
+    ("+1 787 555 0100", "Puerto Rico"),
+    # Zone 7: 76/77 are Kazakhstan, the rest Russia
+    ("+7 495 123 4567", "Russia"),
+    ("+7 701 123 4567", "Kazakhstan"),
+    ("+7 6 123 4567", "Kazakhstan"),
+    # One-, two- and three-digit codes that share leading digits
+    ("+56 9 1234 5678", "Chile"),
+    ("+591 7 123 4567", "Bolivia"),
+    ("+20 10 1234 5678", "Egypt"),
+    ("+212 6 1234 5678", "Morocco"),
+])
+def test_longest_prefix_wins(phone, country):
+    assert resolve_country(phone) == {"status": "success", "country": country}
+
+
+@pytest.mark.parametrize("phone", [
+    "+56912345678",
+    "56912345678",
+    "0056912345678",
+    "+56 9 1234-5678",
+    "(+56) 9-1234-5678",
+    " +56 (9) 1234 5678 ",
+])
+def test_international_prefix_and_separators_are_ignored(phone):
+    assert resolve_country(phone)["country"] == "Chile"
+
+
+@pytest.mark.parametrize("phone", [
+    None,
+    "",
+    "+",
+    "whatsapp",
+    "+2",  # shorter than any zone 2 code
+    "+8",
+    "+800 1234 5678",  # international freephone: no country
+    "+999 123 4567",  # unassigned
+])
+def test_unknown_numbers_fall_back_to_unknown(phone):
+    assert resolve_country(phone) == {"status": "not_found", "country": "Unknown"}
+
+
+def test_trie_keeps_the_longest_match_seen():
+    trie = PhonePrefixTrie({"1": "A", "123": "B"})
+    assert trie.longest_match("12") == "A"  # "12" is only a path to "123"
+    assert trie.longest_match("1234") == "B"
+    assert trie.longest_match("9") is None
+    assert trie.longest_match("") is None
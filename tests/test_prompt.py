@@ -0,0 +1,79 @@
+# Offline test: the static prompt prefix is compiled once, recompiled when
+# config.py changes, and only the per-turn tail is formatted every turn
+
+from datetime import datetime
+
+from real_estate_agent import config
+from real_estate_agent import prompt as prompt_module
+from real_estate_agent.prompt import PromptCompiler
+
+
+def tail(compiler: PromptCompiler, now: datetime = None) -> str:
+    return compiler.render_tail("New contact", "Greet them.", "Chile", now=now)
+
+
+def test_static_prefix_is_compiled_once_and_identical():
+    compiler = PromptCompiler()
+    first = compiler.static_prefix()
+    for _ in range(3):
+        assert compiler.static_prefix() is first
+    assert compiler.compile_count == 1
+    assert first.encode() == PromptCompiler().static_prefix().encode()
+
+
+def test_config_changes_recompile_including_in_place_edits(monkeypatch):
+    compiler = PromptCompiler()
+    compiler.static_prefix()
+
+    monkeypatch.setattr(config, "AGENT_NAME", "Valentina")
+    renamed = compiler.static_prefix()
+    assert compiler.compile_count == 2
+    assert "You are Valentina" in renamed
+
+    # The dict is edited, not replaced: only the deep-copied snapshot notices
+    monkeypatch.setitem(config.BANT_QUESTIONS, "budget", "pie disponible y crédito hipotecario")
+    edited = compiler.static_prefix()
+    assert compiler.compile_count == 3
+    assert "pie disponible y crédito hipotecario" in edited
+    assert compiler.static_prefix() is edited
+
+
+def test_example_placeholders_are_filled(monkeypatch):
+    monkeypatch.setattr(config, "COMPANY", "Propiedades Sur")
+    prefix = PromptCompiler().static_prefix()
+    assert "I'm " + config.AGENT_NAME + ", a real estate advisor at Propiedades Sur" in prefix
+    assert "{agent_name}" not in prefix and "{company}" not in prefix
+
+
+def test_empty_config_values_use_the_defaults(monkeypatch):
+    monkeypatch.setattr(config, "AGENT_NAME", "")
+    monkeypatch.setattr(config, "CONVERSATION_EXAMPLES", "")
+    prefix = PromptCompiler().static_prefix()
+    assert "You are " + config.DEFAULTS["agent_name"] + "," in prefix
+    assert config.DEFAULTS["conversation_examples"] in prefix
+
+
+def test_tail_takes_the_time_of_each_turn(monkeypatch):
+    times = iter([datetime(2026, 3, 1, 9, 30), datetime(2026, 3, 1, 18, 5)])
+
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return next(times)
+
+    monkeypatch.setattr(prompt_module, "datetime", Clock)
+    compiler = PromptCompiler()
+    morning, evening = tail(compiler), tail(compiler)
+    assert "01/03/2026 09:30" in morning
+    assert "01/03/2026 18:05" in evening
+    assert "<conversation_summary>" not in morning
+    assert compiler.compile_count == 0  # the tail never touches the static prefix
+
+
+def test_render_is_prefix_plus_tail_with_summary():
+    compiler = PromptCompiler()
+    now = datetime(2026, 3, 1, 9, 30)
+    full = compiler.render("New contact", "Greet them.", "Chile", "User: soy Ana", now=now)
+    assert full.startswith(compiler.static_prefix())
+    assert full.endswith(compiler.render_tail("New contact", "Greet them.", "Chile", "User: soy Ana", now=now))
+    assert "User: soy Ana" in full
@@ -0,0 +1,244 @@
+# Offline test: circuit breakers trip on errors and slow calls, recover through
+# a half-open probe, and callers get their fallback without waiting
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from real_estate_agent.agent import root_agent
+from real_estate_agent.callbacks import get_contact_context
+from real_estate_agent.fake_llm import FakeLlm
+from real_estate_agent.tools import crm_async
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, deadline, remaining, timeout_for
+from services import agent_runner, whatsapp
+
+
+def fail(breaker: CircuitBreaker, calls: int):
+    for _ in range(calls):
+        with pytest.raises(RuntimeError):
+            with breaker.attempt():
+                raise RuntimeError("upstream down")
+
+
+@pytest.fixture
+def tripped():
+    """Opens the given global breakers for the test, then closes them again."""
+    breakers = []
+
+    def trip(breaker: CircuitBreaker):
+        # Earlier calls may be in its window: fail until it opens
+        while breaker.state != "open":
+            fail(breaker, 1)
+        breakers.append(breaker)
+
+    yield trip
+    for breaker in breakers:
+        breaker.reset()
+
+
+def test_breaker_opens_rejects_and_recovers_through_probe():
+    breaker = CircuitBreaker("test", failure_rate=0.5, window=10, min_calls=4, open_seconds=0.05, half_open_probes=1)
+    with breaker.attempt():
+        pass
+    fail(breaker, 2)
+    assert breaker.state == "closed"  # 2 of 3, under min_calls
+    fail(breaker, 1)
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        with breaker.attempt():
+            pytest.fail("call made while open")
+    assert breaker.rejected == 1
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    with breaker.attempt():
+        # Only one probe at a time
+        with pytest.raises(CircuitOpenError):
+            with breaker.attempt():
+                pass
+    assert breaker.state == "closed"
+
+    fail(breaker, 4)
+    time.sleep(0.06)
+    fail(breaker, 1)  # failed probe
+    assert breaker.state == "open"
+    assert breaker.opened == 3
+
+
+def test_slow_calls_trip_the_breaker_and_error_responses_count():
+    breaker = CircuitBreaker("slow", slow_call_seconds=0.01, min_calls=3, failure_rate=0.6)
+    for _ in range(2):
+        with breaker.attempt():
+            time.sleep(0.015)
+    with breaker.attempt() as attempt:
+        attempt.fail()  # e.g. a 503 response
+    assert breaker.state == "open"
+    assert breaker.slow_calls == 2
+
+
+def test_deadline_bounds_calls_and_cut_calls_are_not_failures():
+    assert remaining() is None
+    assert timeout_for(10) == 10
+    with deadline(5):
+        with deadline(60):
+            assert remaining() <= 5  # an inner deadline never extends the outer one
+        assert timeout_for(1) == 1
+        assert timeout_for(10) <= 5
+
+    breaker = CircuitBreaker("cut", min_calls=1)
+    with deadline(0.01):
+        time.sleep(0.02)
+        with pytest.raises(DeadlineExceeded):
+            with breaker.attempt():
+                timeout_for(10)
+        # A timeout raised because the turn ran out of time is not the dependency's fault
+        with pytest.raises(TimeoutError):
+            with breaker.attempt():
+                raise TimeoutError()
+    assert breaker.state == "closed"
+    assert breaker.calls == 0
+
+
+def test_open_crm_gives_new_contact_context_without_a_call(tripped):
+    tripped(crm_async.crm_breaker)
+    phone = "+56955559001"
+
+    async def scenario():
+        started = time.perf_counter()
+        context = await get_contact_context(phone)
+        return context, time.perf_counter() - started
+
+    context, elapsed = asyncio.run(scenario())
+    assert context["is_new"] is True
+    assert elapsed < 0.5
+    assert crm_async.crm_breaker.rejected >= 1
+
+
+def test_open_llm_breaker_returns_holding_reply_without_calling_the_model(tripped):
+    original_model = root_agent.model
+    root_agent.model = model = FakeLlm()
+    tripped(agent_runner.llm_breaker)
+    try:
+        response = asyncio.run(agent_runner.process_message("+56955559002", "hola"))
+    finally:
+        root_agent.model = original_model
+    assert response.message == agent_runner.LLM_HOLDING_REPLY
+    assert response.should_escalate is True
+    assert model.requests == []
+
+
+def test_turn_deadline_cuts_a_slow_model_turn():
+    original_model = root_agent.model
+    root_agent.model = FakeLlm(latency=2.0)
+
+    async def scenario():
+        with deadline(0.2):
+            started = time.perf_counter()
+            response = await agent_runner.process_message("+56955559003", "hola")
+            return response, time.perf_counter() - started
+
+    try:
+        response, elapsed = asyncio.run(scenario())
+    finally:
+        root_agent.model = original_model
+    assert response.message == agent_runner.LLM_HOLDING_REPLY
+    assert elapsed < 1.0
+
+
+class FailingLlm(FakeLlm):
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        self.requests.append(llm_request)
+        raise RuntimeError("model overloaded")
+        yield
+
+
+def run_with_model(model, phone: str, turn_deadline: float = None):
+    original_model = root_agent.model
+    root_agent.model = model
+
+    async def turn():
+        if turn_deadline is None:
+            return await agent_runner.process_message(phone, "hola")
+        with deadline(turn_deadline):
+            return await agent_runner.process_message(phone, "hola")
+
+    try:
+        return asyncio.run(turn())
+    finally:
+        root_agent.model = original_model
+
+
+def test_llm_breaker_times_model_calls_not_slow_crm_tools(monkeypatch):
+    breaker = agent_runner.llm_breaker
+    monkeypatch.setattr(breaker, "slow_call_seconds", 0.2)
+
+    async def slow_failing_crm(method: str, path: str, **kwargs):
+        await asyncio.sleep(0.3)
+        raise RuntimeError("CRM down")
+
+    monkeypatch.setattr(crm_async, "_request", slow_failing_crm)
+    calls, failures = breaker.calls, breaker.failures
+    model = FakeLlm(tool_calls=[{"name": "get_contact", "args": {"contact_id": "56955559005"}}])
+    response = run_with_model(model, "+56955559005")
+
+    assert response.message == model.reply
+    # Two fast model calls around a 0.3s tool call: both succeeded
+    assert breaker.calls - calls == 2 and breaker.failures == failures
+    assert breaker.state == "closed"
+
+
+def test_model_errors_count_and_cut_calls_release_the_probe(tripped):
+    breaker = agent_runner.llm_breaker
+    failures = breaker.failures
+    with pytest.raises(RuntimeError):
+        run_with_model(FailingLlm(), "+56955559006")
+    assert breaker.failures - failures == 1
+
+    tripped(breaker)
+    breaker._opened_at -= breaker.open_seconds
+    assert breaker.state == "half_open"
+    # The probe call is cut by the turn's deadline: not a verdict on the model
+    response = run_with_model(FakeLlm(latency=2.0), "+56955559007", turn_deadline=0.2)
+    assert response.message == agent_runner.LLM_HOLDING_REPLY
+    assert breaker.state == "half_open"
+    # ...and the next call can probe
+    run_with_model(FakeLlm(), "+56955559008")
+    assert breaker.state == "closed"
+
+
+def test_open_send_breaker_defers_without_sending(tripped):
+    tripped(whatsapp.whatsapp_breaker)
+    result = asyncio.run(whatsapp.send_whatsapp_message("asesor@inmobiliaria.cl", "+56955559004", "hola"))
+    assert result["success"] is False
+    assert result["status_code"] == 503
+    assert result["retry_in"] > 0
+
+
+def test_send_timeouts_are_cut_per_phase_by_the_deadline():
+    assert whatsapp.request_timeout() is httpx.USE_CLIENT_DEFAULT
+    with deadline(60):
+        roomy = whatsapp.request_timeout()
+    with deadline(2):
+        tight = whatsapp.request_timeout()
+    assert (roomy.connect, roomy.read, roomy.write, roomy.pool) == (
+        whatsapp.WHATSAPP_CONNECT_TIMEOUT, whatsapp.WHATSAPP_READ_TIMEOUT,
+        whatsapp.WHATSAPP_WRITE_TIMEOUT, whatsapp.WHATSAPP_POOL_TIMEOUT
+    )
+    assert all(0 < phase <= 2 for phase in (tight.connect, tight.read, tight.write, tight.pool))
+
+
+def test_empty_holding_reply_setting_keeps_the_default():
+    # As set by a .env copied from .env.example; read at import, so in a fresh process
+    env = {**os.environ, "LLM_HOLDING_REPLY": ""}
+    result = subprocess.run(
+        [sys.executable, "-c", "from services.agent_runner import holding_response; print(holding_response().message)"],
+        env=env, capture_output=True, text=True, encoding="utf-8", timeout=120, check=True
+    )
+    assert agent_runner.LLM_HOLDING_REPLY in result.stdout.splitlines()
+    assert agent_runner.LLM_HOLDING_REPLY.strip()
@@ -0,0 +1,149 @@
+# Offline test: SqliteSessionService persistence, hot tier, scoped state,
+# archiving and recovery from failed writes
+
+import asyncio
+import sqlite3
+import time
+
+import pytest
+from google.adk.events.event import Event
+from google.adk.events.event_actions import EventActions
+from google.genai.types import Content, Part
+
+from services.session_store import SqliteSessionService
+
+APP = "real_estate_agent"
+
+
+def text_event(author: str, text: str, state_delta: dict = None) -> Event:
+    return Event(
+        author=author,
+        content=Content(role="user" if author == "user" else "model", parts=[Part(text=text)]),
+        actions=EventActions(state_delta=state_delta or {}),
+        timestamp=time.time()
+    )
+
+
+def texts(session) -> list:
+    return [event.content.parts[0].text for event in session.events]
+
+
+def event_rows(db_path) -> list:
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT archived FROM events ORDER BY seq").fetchall()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sessions.db")
+
+
+def test_session_survives_restart_and_events_are_appended_one_by_one(db_path):
+    async def write():
+        store = SqliteSessionService(db_path=db_path)
+        session = await store.create_session(app_name=APP, user_id="u1", session_id="s1", state={"user_id": "u1"})
+        await store.append_event(session, text_event("user", "hola"))
+        assert len(event_rows(db_path)) == 1
+        await store.append_event(session, text_event("agent", "¡Hola!", {"stage": "greeted"}))
+        assert len(event_rows(db_path)) == 2  # one INSERT per event, history never rewritten
+        store.close()
+
+    async def read():
+        store = SqliteSessionService(db_path=db_path)
+        session = await store.get_session(app_name=APP, user_id="u1", session_id="s1")
+        store.close()
+        return session
+
+    asyncio.run(write())
+    session = asyncio.run(read())
+    assert texts(session) == ["hola", "¡Hola!"]
+    assert session.state == {"user_id": "u1", "stage": "greeted"}
+
+
+def test_hot_tier_is_bounded_and_evicted_sessions_reload(db_path):
+    async def scenario():
+        store = SqliteSessionService(db_path=db_path, max_hot_sessions=2)
+        for user in ("a", "b", "c"):
+            session = await store.create_session(app_name=APP, user_id=user, session_id=user)
+            await store.append_event(session, text_event("user", "soy " + user))
+        assert store.stats()["hot_sessions"] == 2 and store.evictions == 1
+
+        hot = await store.get_session(app_name=APP, user_id="c", session_id="c")
+        cold = await store.get_session(app_name=APP, user_id="a", session_id="a")
+        missing = await store.get_session(app_name=APP, user_id="x", session_id="x")
+        store.close()
+        return store, hot, cold, missing
+
+    store, hot, cold, missing = asyncio.run(scenario())
+    assert texts(hot) == ["soy c"] and texts(cold) == ["soy a"]
+    assert missing is None
+    assert store.hot_hits == 1 and store.cold_loads == 1
+
+
+def test_app_and_user_state_are_shared_across_sessions(db_path):
+    async def scenario():
+        store = SqliteSessionService(db_path=db_path)
+        first = await store.create_session(
+            app_name=APP, user_id="u1", session_id="s1", state={"app:listings": 12, "user:name": "Ana", "temp:x": 1}
+        )
+        await store.append_event(first, text_event("agent", "ok", {"user:email": "ana@correo.cl"}))
+        second = await store.create_session(app_name=APP, user_id="u1", session_id="s2")
+        other = await store.create_session(app_name=APP, user_id="u2", session_id="s3")
+        store.close()
+
+        reopened = SqliteSessionService(db_path=db_path)
+        user_state = await reopened.get_user_state(app_name=APP, user_id="u1")
+        reloaded = await reopened.get_session(app_name=APP, user_id="u1", session_id="s1")
+        reopened.close()
+        return first, second, other, user_state, reloaded
+
+    first, second, other, user_state, reloaded = asyncio.run(scenario())
+    assert "temp:x" not in first.state
+    assert second.state == {"app:listings": 12, "user:name": "Ana", "user:email": "ana@correo.cl"}
+    assert other.state == {"app:listings": 12}
+    assert user_state == {"name": "Ana", "email": "ana@correo.cl"}
+    assert reloaded.state["user:email"] == "ana@correo.cl"
+
+
+def test_archived_and_discarded_events_are_not_loaded(db_path):
+    async def scenario():
+        store = SqliteSessionService(db_path=db_path)
+        session = await store.create_session(app_name=APP, user_id="u1", session_id="s1")
+        for text in ("uno", "dos", "tres"):
+            await store.append_event(session, text_event("user", text))
+        await store.archive_events(session, 2, {"conversation_summary": "uno, dos"})
+        since = time.time()
+        await store.append_event(session, text_event("user", "interrumpido"))
+        await store.discard_events(session, since)
+        store.close()
+
+        reopened = SqliteSessionService(db_path=db_path)
+        reloaded = await reopened.get_session(app_name=APP, user_id="u1", session_id="s1")
+        reopened.close()
+        return session, reloaded
+
+    session, reloaded = asyncio.run(scenario())
+    assert texts(session) == texts(reloaded) == ["tres"]
+    assert reloaded.state["conversation_summary"] == "uno, dos"
+    assert [row[0] for row in event_rows(db_path)] == [1, 1, 0, 1]  # kept on disk
+
+
+def test_failed_write_rolls_back_and_the_store_keeps_working(db_path):
+    async def scenario():
+        store = SqliteSessionService(db_path=db_path)
+        session = await store.create_session(app_name=APP, user_id="u1", session_id="s1")
+        with pytest.raises(TypeError):
+            await store.append_event(session, text_event("agent", "roto", {"bad": object()}))
+        assert not store._conn.in_transaction
+        with pytest.raises(Exception):
+            await store.create_session(app_name=APP, user_id="u1", session_id="s1")  # already exists
+        await store.append_event(session, text_event("user", "sigue"))
+        store.close()
+
+        reopened = SqliteSessionService(db_path=db_path)
+        reloaded = await reopened.get_session(app_name=APP, user_id="u1", session_id="s1")
+        reopened.close()
+        return reloaded
+
+    reloaded = asyncio.run(scenario())
+    assert texts(reloaded) == ["sigue"]  # the failed event's INSERT was rolled back
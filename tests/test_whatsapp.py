@@ -0,0 +1,96 @@
+# Offline test: concurrent sends share one pooled client and its keep-alive
+# connections, and sends outside the webhook lifespan still get a client
+
+import asyncio
+
+import pytest
+
+from benchmarks.bench_whatsapp_send import StubServer
+from services import whatsapp
+
+SENDS = 20
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Local stub of the send endpoint (started inside each test's loop) and fresh pool counters."""
+    server = StubServer(handshake_delay=0.01)
+    monkeypatch.setattr(whatsapp, "pool_stats", whatsapp.PoolStats())
+
+    async def start():
+        monkeypatch.setattr(whatsapp, "SPICYTOOL_API_URL", await server.start())
+
+    yield server, start
+    whatsapp.whatsapp_breaker.reset()
+
+
+async def send_all(count: int) -> list:
+    sends = (whatsapp.send_whatsapp_message("test@example.com", "569" + str(i), "hola") for i in range(count))
+    return await asyncio.gather(*sends)
+
+
+def test_concurrent_sends_reuse_one_client_and_its_connections(stub, monkeypatch):
+    server, start = stub
+    clients = []
+    real_get_client = whatsapp.get_client
+
+    async def recording_get_client():
+        client = await real_get_client()
+        clients.append(client)
+        return client
+
+    async def scenario():
+        await start()
+        await whatsapp.open_client()
+        try:
+            first = await send_all(SENDS)
+            opened = server.connections
+            second = await send_all(SENDS)
+            return first + second, opened
+        finally:
+            await whatsapp.close_client()
+            await server.stop()
+
+    monkeypatch.setattr(whatsapp, "get_client", recording_get_client)
+    results, opened_by_first_wave = asyncio.run(scenario())
+
+    assert all(result["success"] for result in results)
+    assert len(clients) == 2 * SENDS and len(set(map(id, clients))) == 1
+
+    stats = whatsapp.pool_stats.to_dict()
+    assert stats["requests"] == 2 * SENDS and stats["in_flight"] == 0
+    assert 1 < stats["peak_in_flight"] <= SENDS
+    # The second wave rides the first wave's keep-alive connections
+    assert 1 <= opened_by_first_wave <= min(SENDS, whatsapp.WHATSAPP_MAX_CONNECTIONS)
+    assert server.connections == opened_by_first_wave == stats["connections_opened"]
+
+
+def test_sends_outside_the_lifespan_get_a_client_per_loop(stub):
+    server, start = stub
+
+    async def without_client():
+        await start()
+        try:
+            result = await whatsapp.send_whatsapp_message("test@example.com", "56900000000", "hola")
+            return result, await whatsapp.get_client()
+        finally:
+            await server.stop()
+
+    async def after_close():
+        await start()
+        await whatsapp.open_client()
+        await whatsapp.close_client()
+        try:
+            result = await whatsapp.send_whatsapp_message("test@example.com", "56900000000", "hola")
+            return result, await whatsapp.get_client()
+        finally:
+            await server.stop()
+
+    missing_result, missing_client = asyncio.run(without_client())
+    closed_result, closed_client = asyncio.run(after_close())
+
+    assert missing_result["success"] and closed_result["success"]
+    assert missing_client is not closed_client
+    assert missing_client.is_closed and closed_client.is_closed  # closed with their loops
+    assert whatsapp._client is None
+    assert whatsapp.pool_stats.requests == 2
@@ -1,16 +1,38 @@
 # FastAPI server to receive WhatsApp messages
 
+import sys
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
+from pydantic import ValidationError
 
-from models import WebhookPayload, WebhookResponse
-from services import validate_config, debouncer, process_and_respond
+from models import WebhookPayload, WebhookResponse, JobResponse
+from models.lean_payload import loads, parse_webhook_payload
+from services import validate_config, debouncer, process_and_respond, whatsapp
+from services.debouncer import DEBOUNCE_DELAY
+from services.compaction import compaction_stats
+from services.conversation_queue import conversation_queue, llm_limiter
+from services.coordination import coordination
+from services.ingestion import message_deduper
+from services.interrupts import turn_interrupts
+from services.jobs import Job, job_store, sse_events, JOB_MAX_WAIT_SECONDS
+from services.outbox import outbox
+from services.agent_runner import session_service
+from observability import registry, span, get_logger, start_trace
+from observability import log
+from observability.metrics import CONTENT_TYPE
+from observability.loop_monitor import loop_monitor, LOOP_MONITOR_ENABLED
+from resilience import breaker_stats
+from real_estate_agent.tools import crm_async
+from real_estate_agent.tools.contact_cache import contact_cache
+from real_estate_agent.context_cache import static_context_cache, token_usage
+from real_estate_agent.hedging import hedge_stats
 
 load_dotenv(override=True)
 
-# Debounce delay in seconds
-DEBOUNCE_DELAY = 7.0
+logger = get_logger("webhook")
 
 # LIFESPAN (replaces on_event)
 @asynccontextmanager
@@ -22,22 +44,49 @@ async def lifespan(app: FastAPI):
     """
 
     # STARTUP
-    print("🚀 Starting Real Estate Agent Webhook...")
-    print("⏱️  Debounce delay: " + str(DEBOUNCE_DELAY) + " seconds")
+    log.start()
+    logger.info("startup", debounce_delay_seconds=DEBOUNCE_DELAY)
     
     if not validate_config():
-        print("⚠️ Configuration incomplete. Check your .env file.")
+        logger.warning("config_incomplete", hint="Check your .env file")
     else:
-        print("✅ Configuration loaded successfully")
+        logger.info("config_loaded")
     
-    print("📍 Webhook ready at: /webhook/whatsapp")
-    print("📚 Docs available at: /docs")
+    # Shared keep-alive pool for the CRM tools
+    await crm_async.open_client()
+    
+    # Shared keep-alive pool for outbound WhatsApp messages
+    await whatsapp.open_client()
+    
+    # Sender workers delivering queued replies
+    await outbox.start()
+    
+    # Event-loop lag and blocking-call watchdog
+    if LOOP_MONITOR_ENABLED:
+        await loop_monitor.start()
+    
+    logger.info("ready", webhook="/webhook/whatsapp", docs="/docs")
     
     yield  # app runs here
     
     # SHUTDOWN
-    print("👋 Shutting down webhook...")
+    logger.info("shutdown")
+    await loop_monitor.stop()
     await debouncer.cancel_all()
+    await job_store.cancel_all()
+    await outbox.stop()
+    await crm_async.close_client()
+    await whatsapp.close_client()
+    outbox.close()
+    coordination.close()
+    log.shutdown()
+
+
+# Live values exported on /metrics (read when scraped)
+registry.gauge("webhook_pending_debounces", "Phones waiting for their debounce delay.", debouncer.get_pending_count)
+registry.gauge("agent_active_sessions", "Sessions held in memory.", lambda: session_service.stats()["hot_sessions"])
+registry.gauge("llm_in_flight", "Agent turns calling the model right now.", lambda: llm_limiter.in_flight)
+registry.gauge("outbox_depth", "Replies waiting to be delivered.", lambda: outbox.stats()["depth"])
 
 
 # Create APP
@@ -48,9 +97,59 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# REQUEST PARSING
+async def webhook_payload(request: Request) -> WebhookPayload:
+    """
+    Webhook body parsed with the lean path: only the conversation messages
+    that are read get validated (see models/lean_payload.py).
+    Invalid bodies get the same 422 errors as a WebhookPayload parameter.
+    """
+    body = await request.body()
+    with span("ingress_parse"):
+        try:
+            data = loads(body)
+        except ValueError as e:
+            raise RequestValidationError([{
+                "type": "json_invalid",
+                "loc": ("body", getattr(e, "pos", 0)),
+                "msg": "JSON decode error",
+                "input": {},
+                "ctx": {"error": getattr(e, "msg", str(e))}
+            }])
+        try:
+            return parse_webhook_payload(data)
+        except ValidationError as e:
+            raise RequestValidationError([
+                {**error, "loc": ("body",) + tuple(error["loc"])} for error in e.errors(include_url=False)
+            ])
+
+
+# Request body documented as WebhookPayload (it is read by webhook_payload)
+PAYLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": WebhookPayload.model_json_schema(by_alias=True)}}
+    }
+}
+
+
+def build_payload_data(payload: WebhookPayload, trace_id: str) -> dict:
+    """
+    Data kept with the phone's buffered messages until its turn runs.
+    Account-level strings are interned: every conversation of an account
+    shares one copy instead of one per webhook request.
+    """
+    return {
+        "userEmail": sys.intern(payload.userEmail),
+        "contactId": payload.contactId,
+        "assignedContainer": sys.intern(payload.assignedContainer),
+        "trace_id": trace_id
+    }
+
+
 # ENDPOINTS
-@app.post("/webhook/whatsapp", response_model=WebhookResponse)
-async def receive_whatsapp_message(payload: WebhookPayload, background_tasks: BackgroundTasks):
+@app.post("/webhook/whatsapp", response_model=WebhookResponse, openapi_extra=PAYLOAD_OPENAPI)
+async def receive_whatsapp_message(background_tasks: BackgroundTasks, payload: WebhookPayload = Depends(webhook_payload)):
     """
     Receives WhatsApp messages from SpicyTool,
     processes them with the real estate agent,
@@ -59,44 +158,42 @@ async def receive_whatsapp_message(payload: WebhookPayload, background_tasks: Ba
     Uses debouncing to handle rapid consecutive messages.
 
     Flow:
-    1. Receive message
+    1. Receive message(s) not seen before (retries are ignored)
     2. Add to debounce queue
     3. Return immediately (202 Accepted)
     4. After delay, process all buffered messages together
-    5. Send single response to WhatsApp
+    5. Queue single response for WhatsApp (delivered by the outbox)
     """
-    # 1. Extract the user's message (fromMe = false)
-    user_messages = [msg for msg in payload.conversation if not msg.fromMe]
+    trace_id = start_trace()
     
-    if not user_messages:
+    # 1. Extract the user's messages (fromMe = false), newest first
+    if not any(not msg.fromMe for msg in reversed(payload.conversation)):
         return {"status": "no_user_message"}
     
-    # 2. Get last message
-    last_message = user_messages[-1]
+    # 2. Keep only the messages not processed yet
     phone_number = payload.from_
+    new_messages = await message_deduper.select_new(phone_number, payload.conversation)
+    if not new_messages:
+        logger.info("duplicate_delivery", phone=phone_number, stage="ingress")
+        return {"status": "duplicate"}
     
-    print("📩 Message from " + phone_number + ": " + last_message.body)
-    
-     # Check if already debouncing
-    if debouncer.is_pending(phone_number):
-        print("⏳ Adding to debounce buffer for " + phone_number)
-    else:
-        print("⏳ Starting debounce timer for " + phone_number)
+    for message in new_messages:
+        logger.info(
+            "message_received", phone=phone_number, stage="ingress", body=message.body,
+            buffered=debouncer.is_pending(phone_number)
+        )
     
     # Prepare payload data for callback
-    payload_data = {
-        "userEmail": payload.userEmail,
-        "contactId": payload.contactId,
-        "assignedContainer": payload.assignedContainer
-    }
+    payload_data = build_payload_data(payload, trace_id)
     
     # Add to debouncer (non-blocking)
-    await debouncer.debounce(
-        phone_number=phone_number,
-        message_text=last_message.body,
-        payload_data=payload_data,
-        process_callback=process_and_respond
-    )
+    for message in new_messages:
+        await debouncer.debounce(
+            phone_number=phone_number,
+            message_text=message.body,
+            payload_data=payload_data,
+            process_callback=process_and_respond
+        )
     
     # Return immediately
     return {
@@ -107,34 +204,21 @@ async def receive_whatsapp_message(payload: WebhookPayload, background_tasks: Ba
     }
 
 
-@app.post("/webhook/whatsapp/sync", response_model=WebhookResponse)
-async def receive_whatsapp_message_sync(payload: WebhookPayload):
-    """
-    Synchronous version - waits for debounce and returns response.
-    Use this for testing or when you need immediate response.
-    """
-    
-    # Extract user messages
-    user_messages = [msg for msg in payload.conversation if not msg.fromMe]
-    
-    if not user_messages:
-        return WebhookResponse(status="no_user_message")
-    
-    last_message = user_messages[-1]
-    phone_number = payload.from_
-    
-    print("📩 [SYNC] Message from " + phone_number + ": " + last_message.body)
-    
-    payload_data = {
-        "userEmail": payload.userEmail,
-        "contactId": payload.contactId,
-        "assignedContainer": payload.assignedContainer
-    }
+async def answer_messages(phone_number: str, new_messages: list, payload_data: dict) -> WebhookResponse:
+    """Debounces the messages and waits for the agent's reply to the last one."""
+    # Earlier new messages join the buffer; wait on the last one
+    for message in new_messages[:-1]:
+        await debouncer.debounce(
+            phone_number=phone_number,
+            message_text=message.body,
+            payload_data=payload_data,
+            process_callback=process_and_respond
+        )
     
     # Debounce and wait for result
     result = await debouncer.debounce_and_wait(
         phone_number=phone_number,
-        message_text=last_message.body,
+        message_text=new_messages[-1].body,
         payload_data=payload_data,
         process_callback=process_and_respond
     )
@@ -167,6 +251,76 @@ async def receive_whatsapp_message_sync(payload: WebhookPayload):
     return response
 
 
+async def start_job(payload: WebhookPayload) -> Job:
+    """Creates a job for the delivery; its result is the reply to the newest message."""
+    trace_id = start_trace()
+    phone_number = payload.from_
+    job = job_store.create(phone_number)
+    
+    # Extract user messages (newest first)
+    if not any(not msg.fromMe for msg in reversed(payload.conversation)):
+        job_store.finish(job, WebhookResponse(status="no_user_message"))
+        return job
+    
+    new_messages = await message_deduper.select_new(phone_number, payload.conversation)
+    if not new_messages:
+        job_store.finish(job, WebhookResponse(status="duplicate"))
+        return job
+    
+    for message in new_messages:
+        logger.info("message_received", phone=phone_number, stage="ingress", body=message.body, job_id=job.id)
+    
+    payload_data = build_payload_data(payload, trace_id)
+    job_store.run(job, answer_messages(phone_number, new_messages, payload_data))
+    return job
+
+
+@app.post("/webhook/whatsapp/jobs", response_model=JobResponse, status_code=202, openapi_extra=PAYLOAD_OPENAPI)
+async def receive_whatsapp_message_job(payload: WebhookPayload = Depends(webhook_payload)):
+    """
+    Same as the sync endpoint without holding the connection: returns a job
+    id right away. The WebhookResponse is read from GET /jobs/{job_id}.
+    """
+    job = await start_job(payload)
+    return job.to_response()
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, request: Request, wait: float = 0.0):
+    """
+    Job status and result.
+    - ?wait=seconds: long-poll, returns as soon as the job is done (max JOB_MAX_WAIT_SECONDS)
+    - Accept: text/event-stream: Server-Sent Events, one `result` event when done
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            sse_events(job),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    if wait > 0:
+        await job.wait(min(wait, JOB_MAX_WAIT_SECONDS))
+    return job.to_response()
+
+
+@app.post("/webhook/whatsapp/sync", response_model=WebhookResponse, openapi_extra=PAYLOAD_OPENAPI)
+async def receive_whatsapp_message_sync(payload: WebhookPayload = Depends(webhook_payload)):
+    """
+    Synchronous version - waits for debounce and returns response.
+    Use this for testing; integrations should use /webhook/whatsapp/jobs.
+    """
+    job = await start_job(payload)
+    await job.wait()
+    if job.error is not None:
+        raise job.error
+    return job.response
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
@@ -175,10 +329,42 @@ async def health_check():
         "service": "real_estate_agent_webhook",
         "version": "1.0.0",
         "debounce_delay_seconds": DEBOUNCE_DELAY,
-        "pending_messages": debouncer.get_pending_count()
+        "pending_messages": debouncer.get_pending_count(),
+        "debounce": debouncer.stats(),
+        "contact_cache": contact_cache.stats(),
+        "whatsapp_pool": whatsapp.pool_stats.to_dict(),
+        "context_cache": static_context_cache.stats(),
+        "llm_tokens": token_usage.to_dict(),
+        "history_compaction": compaction_stats.to_dict(),
+        "conversation_queue": conversation_queue.stats(),
+        "llm_concurrency": llm_limiter.stats(),
+        "llm_hedging": hedge_stats.stats(),
+        "turn_interrupts": turn_interrupts.stats(),
+        "coordination": coordination.stats(),
+        "ingestion": message_deduper.stats(),
+        "jobs": job_store.stats(),
+        "circuit_breakers": breaker_stats(),
+        "outbox": outbox.stats(),
+        "logging": log.stats(),
+        "event_loop": loop_monitor.stats()
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, counters and gauges."""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/debug/loop")
+async def debug_loop(reset: bool = False):
+    """Event-loop lag percentiles and the call sites that blocked the loop, with stacks."""
+    stats = loop_monitor.stats(with_stacks=True)
+    if reset:
+        loop_monitor.reset()
+    return stats
+
+
 @app.get("/")
 async def root():
     """Root endpoint with service info."""
@@ -187,8 +373,12 @@ async def root():
         "features": ["debouncing", "escalation", "BANT qualification"],
         "endpoints": {
             "webhook_async": "POST /webhook/whatsapp (non-blocking, recommended)",
+            "webhook_jobs": "POST /webhook/whatsapp/jobs (returns a job id)",
+            "job_result": "GET /jobs/{job_id} (?wait=seconds long-poll, or Accept: text/event-stream)",
             "webhook_sync": "POST /webhook/whatsapp/sync (blocking, for testing)",
             "health": "GET /health",
+            "metrics": "GET /metrics",
+            "loop_debug": "GET /debug/loop",
             "docs": "GET /docs"
         }
     }